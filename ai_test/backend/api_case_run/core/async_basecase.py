@@ -0,0 +1,157 @@
+import asyncio
+import traceback
+import httpx
+from api_case_run.core.basecase import BaseTestCase
+from api_case_run.core.database_client import DBClient
+from api_case_run.core.http_pool import AsyncHttpPool
+from api_case_run.core.script_runner import ScriptRunner
+from api_case_run.core.test_result import TestResult, APIRequestInfo
+
+"""
+异步版本的接口用例执行流程
+    执行步骤与 BaseTestCase 完全一致(前置依赖接口 -> 前置脚本 -> 变量替换 -> 请求 -> 后置脚本 -> 断言),
+    只是请求通过 httpx.AsyncClient 发送, 前后置脚本在进程池或线程中执行, 不阻塞事件循环;
+    同一次执行中的所有用例共享一个连接池(AsyncHttpPool), 每条用例使用独立的 client, cookie 互不影响
+"""
+
+
+class AsyncBaseTestCase(BaseTestCase):
+    """基于 httpx 的异步接口用例"""
+
+    def __init__(self, case_data: dict, result: TestResult, test_env_global: dict, db: DBClient,
+                 transport: AsyncHttpPool, script_runner: ScriptRunner = None):
+        self.case_data = case_data
+        self.result = result
+        self.test_env_global = test_env_global
+        # 共享连接池, 独立 cookie; 与 requests 保持一致: 跟随重定向、不设置超时
+        self.http = httpx.AsyncClient(transport=transport, follow_redirects=True, timeout=None)
+        self.db = db
+        self.script_runner = script_runner
+
+    async def _run_script(self, api_info):
+        """执行前后置脚本的方法(脚本在进程池或线程中执行, 不阻塞事件循环)"""
+        namespace = {"test": self, "db": self.db, "self": self, "api_info": api_info}
+        setup_script = api_info.get("setup_script", '')
+        teardown_script = api_info.get("teardown_script", '')
+        if setup_script:
+            self.result.add_info_log(f"开始执行用例的前置脚本:\n{setup_script}")
+            await self._exec_script_async(setup_script, namespace, teardown_script)
+        namespace["response"] = yield
+        if teardown_script:
+            self.result.add_info_log(f"开始执行用例的后置脚本:\n{teardown_script}")
+            await self._exec_script_async(teardown_script, namespace)
+
+    async def _exec_script_async(self, source, namespace, next_script=''):
+        job = self._prepare_script(source, namespace, next_script)
+        if job is None:
+            # 未启用进程池(或脚本只能在当前进程执行)时放到线程中执行, 脚本中的数据库查询同样不阻塞事件循环
+            await asyncio.to_thread(self._exec_local_script, source, namespace)
+        else:
+            self._apply_script_result(await self.script_runner.run_async(job), namespace)
+
+    async def execute_setup_script(self, api_info):
+        """执行用例前置脚本"""
+        self.script_executor = self._run_script(api_info)
+        await self.script_executor.__anext__()
+
+    async def execute_teardown_script(self, response):
+        """执行用例后置脚本"""
+        try:
+            await self.script_executor.asend(response)
+        except StopAsyncIteration:
+            pass
+        finally:
+            del self.script_executor
+
+    async def execute_preconditions(self):
+        """执行前置依赖接口"""
+        self.result.add_info_log("开始检测用例的前置依赖接口")
+        if self.case_data.get("preconditions"):
+            for api in self.case_data.get("preconditions"):
+                api_info = api.get("request")
+                await self.execute_setup_script(api_info)
+                api_info = self.replace_variables(api_info)
+                response = await self.request_api(api_info)
+                await self.execute_teardown_script(response)
+                self.extract_data(api, response)
+            self.result.add_info_log("前置依赖接口执行完毕")
+        else:
+            self.result.add_info_log("没有前置依赖接口")
+
+    async def request_api(self, api_info):
+        """请求接口"""
+        api_request_info = APIRequestInfo(interface_id=api_info.get("interface_id", None))
+        method = api_info.get('method', 'GET').upper()
+        api_request_info.method = method
+        url = api_info.get('base_url', self.test_env_global.get('base_url', "")) + api_info.get('url')
+        api_request_info.url = url
+        headers = api_info.get('headers', {})
+        api_request_info.headers = headers
+        params = api_info.get('params', {})
+        api_request_info.params = params
+        body = api_info.get('body', {})
+        files = api_info.get('files', {})
+        content_type = headers.get('Content-Type', '').lower()
+        self.result.add_info_log(
+            f"开始发送请求,请求地址为：{url}请求方法为：{method}，请求头为：{headers}，请求参数为：{params}，请求体参数为：{body}")
+        api_request_info.body = body
+        opened_files = []
+        try:
+            if content_type.startswith('application/json'):
+                response = await self.http.request(method, url, headers=headers, params=params, json=body)
+            elif content_type.startswith('multipart/form-data'):
+                # 文件字段交给 httpx 编码, boundary 由 httpx 生成
+                fields, new_files = {}, {}
+                for key, value in files.items():
+                    if isinstance(value, (list, tuple)) and len(value) == 3:
+                        file_content = open(value[1], 'rb')
+                        opened_files.append(file_content)
+                        new_files[key] = (value[0], file_content, value[2])
+                    elif isinstance(value, (list, tuple)):
+                        new_files[key] = tuple(value)
+                    else:
+                        fields[key] = value
+                headers = {k: v for k, v in headers.items() if k.lower() != 'content-type'}
+                response = await self.http.request(method, url, headers=headers, params=params,
+                                                   data=fields, files=new_files)
+                api_request_info.body = {k: (v[0] if isinstance(v, tuple) else v)
+                                         for k, v in {**fields, **new_files}.items()}
+            else:
+                # xml / 表单 / 默认: 字符串按原样发送, 字典按表单编码
+                if isinstance(body, (str, bytes)):
+                    response = await self.http.request(method, url, headers=headers, params=params, content=body)
+                else:
+                    response = await self.http.request(method, url, headers=headers, params=params, data=body)
+        except Exception as e:
+            api_request_info.status_code = None
+            api_request_info.response_body = None
+            self.result.api_requests_info.append(api_request_info)
+            self.result.add_error_log(f"请求接口异常，异常信息为：{e}")
+            self.result.traceback = traceback.format_exc()
+            raise e
+        else:
+            api_request_info.status_code = response.status_code
+            if response.headers.get('Content-Type', '').lower().startswith('application/json'):
+                api_request_info.response_body = response.json()
+                self.result.add_info_log(
+                    f"获取到接口的请求响应：\n响应状态码为：{response.status_code}\n响应结果为：{response.json()}\n响应头为：{response.headers}，")
+            else:
+                api_request_info.response_body = response.text
+                self.result.add_info_log(
+                    f"获取到接口的请求响应：\n响应状态码为：{response.status_code}\n响应结果为：{response.text}\n响应头为：{response.headers}，")
+            self.result.api_requests_info.append(api_request_info)
+            return response
+        finally:
+            for f in opened_files:
+                f.close()
+
+    async def run(self):
+        """用例执行的主入口函数"""
+        await self.execute_preconditions()
+        case_api_info = self.case_data.get("request")
+        await self.execute_setup_script(case_api_info)
+        case_api_info = self.replace_variables(case_api_info)
+        response = await self.request_api(case_api_info)
+        await self.execute_teardown_script(response)
+        assertions = self.release_assertions(self.case_data.get("assertions", {}))
+        self.assert_result(assertions, response)
@@ -1,11 +1,14 @@
 import json
 import re
+import time
 import traceback
-from numbers import Number
 import jmespath
 from requests.sessions import Session
 from requests_toolbelt import MultipartEncoder
 from api_case_run.core.database_client import DBClient
+from api_case_run.core.http_pool import HttpPool
+from api_case_run.core.script_runner import ScriptRunner, compile_script, script_globals
+from api_case_run.core.template import REPLACE_FIELDS, render_template
 from api_case_run.core.test_result import TestResult, APIRequestInfo
 from api_case_run import global_tools as global_function
 
@@ -31,18 +34,22 @@ from api_case_run import global_tools as global_function
 class BaseTestCase:
     """定义一个通用的接口用例执行流程的类"""
 
-    def __init__(self, case_data: dict, result: TestResult, test_env_global: dict, db: DBClient):
+    def __init__(self, case_data: dict, result: TestResult, test_env_global: dict, db: DBClient,
+                 http_pool: HttpPool = None, script_runner: ScriptRunner = None):
         """
         :param case_data: 用例数据
         :param result: 执行器对象
         :param test_env_global: 测试环境数据
+        :param http_pool: 执行器共享的连接池(为空时单独创建会话)
+        :param script_runner: 前后置脚本进程池(为空时在当前线程执行脚本)
         """
         self.case_data = case_data
         self.result = result
         self.test_env_global = test_env_global
-        # 创建一个接口请求对象
-        self.http = Session()
+        # 创建一个接口请求对象(使用连接池时连接共享、cookie独立)
+        self.http = http_pool.session() if http_pool else Session()
         self.db = db
+        self.script_runner = script_runner
 
     def execute_preconditions(self):
         """执行前置依赖接口"""
@@ -67,19 +74,18 @@ class BaseTestCase:
 
     def _run_script(self, api_info):
         """执行前后置脚本的方法"""
+        # 前后置脚本共享同一个变量空间（前置脚本中定义的变量，后置脚本中可以直接使用）
         # 对相关的操作进行重命名（方便编辑前后置脚本）
-        test = self
-        db = self.db
-
+        namespace = {"test": self, "db": self.db, "self": self, "api_info": api_info}
         setup_script = api_info.get("setup_script", '')
+        teardown_script = api_info.get("teardown_script", '')
         if setup_script:
             self.result.add_info_log(f"开始执行用例的前置脚本:\n{setup_script}")
-            exec(setup_script)
-        response = yield
-        teardown_script = api_info.get("teardown_script", '')
+            self._exec_script(setup_script, namespace, teardown_script)
+        namespace["response"] = yield
         if teardown_script:
             self.result.add_info_log(f"开始执行用例的后置脚本:\n{teardown_script}")
-            exec(teardown_script)
+            self._exec_script(teardown_script, namespace)
 
     def execute_setup_script(self, api_info):
         """执行用例前置脚本"""
@@ -100,96 +106,63 @@ class BaseTestCase:
             # 删除脚本执行器
             del self.script_executor
 
+    def _prepare_script(self, source, namespace, next_script=''):
+        """生成进程池任务，未启用进程池或脚本只能在当前进程执行时返回None"""
+        if self.script_runner is None:
+            return None
+        return self.script_runner.prepare(source, namespace, self.test_env_global, namespace.get("response"),
+                                          next_script)
+
+    def _exec_script(self, source, namespace, next_script=''):
+        """执行单个脚本，并记录CPU耗时"""
+        job = self._prepare_script(source, namespace, next_script)
+        if job is not None:
+            self._apply_script_result(self.script_runner.run(job), namespace)
+            return
+        self._exec_local_script(source, namespace)
+
+    def _exec_local_script(self, source, namespace):
+        """在当前进程中执行脚本，并记录CPU耗时"""
+        code = compile_script(source)
+        script_global = script_globals(self.test_env_global.get("func_global"))
+        start = time.thread_time()
+        exec(code, script_global, namespace)
+        self.result.add_info_log(f"脚本执行完成，CPU耗时：{(time.thread_time() - start) * 1000:.2f}ms")
+
+    def _apply_script_result(self, script_result, namespace):
+        """合并进程池中脚本的执行结果"""
+        for log in script_result["logs"]:
+            self.result.add_info_log(log)
+        self.test_env_global.update(script_result["env_changes"])
+        namespace.update(script_result["namespace"])
+        if script_result["skipped"]:
+            self.result.add_warning_log(f"脚本变量{script_result['skipped']}无法跨进程传递，后置脚本中不可用")
+        self.result.add_info_log(f"脚本在进程池中执行完成，CPU耗时：{script_result['cpu_time'] * 1000:.2f}ms")
+
     def replace_variables(self, api_info: dict) -> dict:
         """替换用例参数中的变量引用"""
         self.result.add_info_log("开始替换用例参数中的变量引用")
-        # 定义变量替换的正则表达式的规则
-        pattern = r"\${{(.+?)}}"
-        # 有可能需要替换处理的字段
-        data = str({
-            "url": api_info.get("url"),
-            "base_url": api_info.get("base_url"),
-            "headers": api_info.get("headers"),
-            "params": api_info.get("params"),
-            "body": api_info.get("body"),
-            "files": api_info.get("files"),
-        })
-
-        print("替换之前的数据为：", api_info)
-        # 写一个正则表达式，进行循环匹配
-        while re.search(pattern, data):
-            match = re.search(pattern, data)
-            pattern_content = match.group()
-            key = match.group(1)
-            value = self.test_env_global.get(key, None)
-            # ==================判断value值的类型=======================
-            if value:
-                self.result.add_info_log(
-                    f"正则匹配到：{pattern_content},需要替换为测试环境数据中的变量：{key},变量值为：{value}")
-                # 如果替换的值为数值
-                if isinstance(value, Number):
-                    s = data.find(pattern_content)
-                    new_pattern_content = data[s - 1:s + len(pattern_content) + 1]
-                    print("数值类型，需要替换的内容：", new_pattern_content)
-                    data = data.replace(new_pattern_content, str(value))
-                # 如果替换的值为列表或者字典
-                elif isinstance(value, list) or isinstance(value, dict):
-                    s = data.find(pattern_content)
-                    new_pattern_content = data[s - 1:s + len(pattern_content) + 1]
-                    data = data.replace(new_pattern_content, str(value))
-                # 如果替换的字符串中有单引号
-                elif isinstance(value, str) and "'" in value:
-                    data = data.replace(pattern_content, value.replace("'", '"'))
-                else:
-                    data = data.replace(pattern_content, str(value))
-            else:
-                self.result.add_info_log(
-                    f"正则匹配到：{pattern_content},没有找到对应的测试环境数据中的变量：{key},给变量设置默认值为空字符串")
-                data = data.replace(pattern_content, "")
-        # 数据替换完之后，需要重新转换为字典
-        new_data = eval(data)
-        # 更新api_info中被替换的字段
-        api_info.update(new_data)
-        # 返回数据
-        return api_info
+        # 有可能需要替换处理的字段(只处理用例中存在的字段，缺省字段继续使用默认值)
+        data = {key: api_info[key] for key in REPLACE_FIELDS if key in api_info}
+        new_data = self._render(data)
+        # 返回替换后的新数据(不修改用例原始数据，编译结果可在重复执行时复用)
+        return {**api_info, **new_data}
 
     def release_assertions(self, assertions: dict) -> dict:
         self.result.add_info_log("开始替换用例参数中的变量引用")
-        # 定义变量替换的正则表达式的规则
-        pattern = r"\${{(.+?)}}"
-        data = str(assertions)
-        # 写一个正则表达式，进行循环匹配
-        while re.search(pattern, data):
-            match = re.search(pattern, data)
-            pattern_content = match.group()
-            key = match.group(1)
-            value = self.test_env_global.get(key, None)
-            # ==================判断value值的类型=======================
-            if value:
+        return self._render(assertions)
+
+    def _render(self, data):
+        """使用编译后的模板替换变量，并记录替换日志"""
+        trace = []
+        new_data = render_template(data, self.test_env_global, trace)
+        for key, value in trace:
+            if value is not None:
                 self.result.add_info_log(
-                    f"正则匹配到：{pattern_content},需要替换为测试环境数据中的变量：{key},变量值为：{value}")
-                # 如果替换的值为数值
-                if isinstance(value, Number):
-                    s = data.find(pattern_content)
-                    new_pattern_content = data[s - 1:s + len(pattern_content) + 1]
-                    print("数值类型，需要替换的内容：", new_pattern_content)
-                    data = data.replace(new_pattern_content, str(value))
-                # 如果替换的值为列表或者字典
-                elif isinstance(value, list) or isinstance(value, dict):
-                    s = data.find(pattern_content)
-                    new_pattern_content = data[s - 1:s + len(pattern_content) + 1]
-                    data = data.replace(new_pattern_content, str(value))
-                # 如果替换的字符串中有单引号
-                elif isinstance(value, str) and "'" in value:
-                    data = data.replace(pattern_content, value.replace("'", '"'))
-                else:
-                    data = data.replace(pattern_content, str(value))
+                    f"正则匹配到：${{{{{key}}}}},需要替换为测试环境数据中的变量：{key},变量值为：{value}")
             else:
                 self.result.add_info_log(
-                    f"正则匹配到：{pattern_content},没有找到对应的测试环境数据中的变量：{key},给变量设置默认值为空字符串")
-                data = data.replace(pattern_content, "")
-        # 数据替换完之后，需要重新转换为字典
-        new_data = eval(data)
+                    f"正则匹配到：${{{{{key}}}}},没有找到对应的测试环境数据中的变量：{key},给变量设置默认值为空字符串")
         return new_data
 
     def request_api(self, api_info):
@@ -2,6 +2,7 @@
 一个项目设计到多个数据
     每个数据库有不同的配置
 """
+import threading
 import pymysql
 
 
@@ -9,6 +10,8 @@ class MySQLClient:
     """mysql数据库连接的类"""
 
     def __init__(self, config):
+        # 异步执行器中并发用例的脚本在不同线程中执行, 共用同一个连接, 查询需要加锁
+        self._lock = threading.Lock()
         try:
             # 连接数据库
             self.db_connect = pymysql.connect(**config)
@@ -22,8 +25,9 @@ class MySQLClient:
         :param query: sql语句
         :return:
         """
-        self.db_cursor.execute(query)
-        return self.db_cursor.fetchall()
+        with self._lock:
+            self.db_cursor.execute(query)
+            return self.db_cursor.fetchall()
 
     def close(self):
         """关闭数据库连接"""
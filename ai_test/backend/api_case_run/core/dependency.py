@@ -0,0 +1,111 @@
+"""
+用例之间的变量依赖分析
+    用例通过 test_env_global 互相传递数据:
+        - 前置依赖接口的 extract、脚本中的 save_test_env_variables 会写入变量
+        - 请求参数/断言中的 ${{变量}}、脚本中的 get_test_env_variables 会读取变量
+    根据静态分析构建依赖图(DAG): 用例只依赖"在它之前最后一次写入它所读变量"的用例,
+    没有依赖关系的分支可以并发执行, 每个分支在独立的变量作用域中运行
+"""
+import re
+from typing import Dict, List, Set
+from api_case_run.core.template import REPLACE_FIELDS, VARIABLE_PATTERN
+
+# 脚本中按字面量读写变量
+_SCRIPT_WRITE = re.compile(r"""save_test_env_variables\(\s*['"]([^'"]+)['"]|test_env_global\[\s*['"]([^'"]+)['"]\s*\]\s*=[^=]""")
+_SCRIPT_READ = re.compile(r"""get_test_env_variables\(\s*['"]([^'"]+)['"]|test_env_global(?:\.get\(|\[)\s*['"]([^'"]+)['"]""")
+# 脚本中无法静态确定变量名的写入/读取
+_SCRIPT_DYNAMIC_WRITE = re.compile(r"""save_test_env_variables\(\s*[^'"\s]|test_env_global\[\s*[^'"\s]|test_env_global\.(update|setdefault|pop)\(""")
+_SCRIPT_DYNAMIC_READ = re.compile(r"""get_test_env_variables\(\s*[^'"\s]|test_env_global\.get\(\s*[^'"\s]|test_env_global\s*[,)]""")
+
+
+def _iter_requests(case_data: dict):
+    """依次返回用例中的前置依赖接口和用例自身(api, request)"""
+    for api in case_data.get("preconditions") or []:
+        yield api, api.get("request") or {}
+    yield None, case_data.get("request") or {}
+
+
+def _script_names(pattern, script: str) -> Set[str]:
+    return {a or b for a, b in pattern.findall(script or "")}
+
+
+def analyse_case(case_data: dict) -> dict:
+    """
+    分析单条用例读写的变量
+    :return: {"inputs": 读取的变量, "outputs": 写入的变量,
+              "dynamic": 是否存在无法静态分析的写入, "dynamic_read": 是否存在无法静态分析的读取}
+    """
+    inputs, outputs = set(), set()
+    dynamic = dynamic_read = False
+
+    def read(names):
+        # 用例内部先写后读的变量不算外部输入
+        inputs.update(set(names) - outputs)
+
+    for api, request in _iter_requests(case_data):
+        setup_script = request.get("setup_script") or ""
+        teardown_script = request.get("teardown_script") or ""
+        read(_script_names(_SCRIPT_READ, setup_script))
+        outputs.update(_script_names(_SCRIPT_WRITE, setup_script))
+        read(VARIABLE_PATTERN.findall(str({key: request.get(key) for key in REPLACE_FIELDS})))
+        read(_script_names(_SCRIPT_READ, teardown_script))
+        outputs.update(_script_names(_SCRIPT_WRITE, teardown_script))
+        for script in (setup_script, teardown_script):
+            if _SCRIPT_DYNAMIC_WRITE.search(script):
+                dynamic = True
+            if _SCRIPT_DYNAMIC_READ.search(script):
+                dynamic_read = True
+        if api is not None:
+            for item in api.get("extract") or []:
+                outputs.add(item[0])
+    read(VARIABLE_PATTERN.findall(str(case_data.get("assertions") or {})))
+    return {"inputs": inputs, "outputs": outputs, "dynamic": dynamic, "dynamic_read": dynamic_read}
+
+
+def build_case_plan(cases_list: List[dict]) -> dict:
+    """
+    构建套件的执行计划(DAG)
+        - 读取变量 v 的用例依赖于它之前最后一个写入 v 的用例(与串行执行时读到的值一致)
+        - 存在无法静态分析的写入时, 该用例作为屏障: 依赖之前所有用例, 之后所有用例都依赖它
+        - 存在无法静态分析的读取时, 依赖之前所有写入过变量的用例
+    :return: {"nodes": [{index, case_id, name, depends_on, inputs, outputs, level}], "levels", "max_parallelism"}
+    """
+    nodes = []
+    last_writer: Dict[str, int] = {}
+    writers: List[int] = []
+    barrier = None
+    for index, case_data in enumerate(cases_list):
+        info = analyse_case(case_data)
+        if info["dynamic"]:
+            depends = set(range(index))
+        else:
+            depends = {last_writer[name] for name in info["inputs"] if name in last_writer}
+            if info["dynamic_read"]:
+                depends.update(writers)
+            if barrier is not None:
+                depends.add(barrier)
+        depends = sorted(depends)
+        level = max((nodes[d]["level"] + 1 for d in depends), default=0)
+        nodes.append({
+            "index": index,
+            "case_id": case_data.get("id"),
+            "name": case_data.get("name"),
+            "depends_on": depends,
+            "inputs": sorted(info["inputs"]),
+            "outputs": sorted(info["outputs"]),
+            "level": level,
+        })
+        for name in info["outputs"]:
+            last_writer[name] = index
+        if info["outputs"] or info["dynamic"]:
+            writers.append(index)
+        if info["dynamic"]:
+            barrier = index
+    width: Dict[int, int] = {}
+    for node in nodes:
+        width[node["level"]] = width.get(node["level"], 0) + 1
+    return {
+        "nodes": nodes,
+        "levels": len(width),
+        "max_parallelism": max(width.values(), default=0),
+    }
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import threading
+from typing import Dict
+from urllib.parse import urlsplit
+import httpx
+from requests.adapters import HTTPAdapter
+from requests.sessions import Session
+from urllib3.util.retry import Retry
+
+"""
+一次执行(任务/套件)内共享的 HTTP 连接池
+    1、按请求地址的 scheme://host:port 划分连接池，同一个 base_url 的用例复用 TCP/TLS 连接
+    2、每个主机的最大连接数可配置
+    3、幂等请求(GET/HEAD/OPTIONS/PUT/DELETE/TRACE)在连接错误或 502/503/504 时按指数退避重试
+    4、每条用例使用独立的 Session/Client，cookie 只在用例内部生效，不会串到其它用例
+"""
+
+# 幂等请求方法
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+# 需要重试的响应状态码
+RETRY_STATUSES = (502, 503, 504)
+# 默认配置(可通过环境变量调整)
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("API_RUN_MAX_CONNECTIONS_PER_HOST", 10))
+RETRIES = int(os.getenv("API_RUN_RETRIES", 2))
+RETRY_BACKOFF = float(os.getenv("API_RUN_RETRY_BACKOFF", 0.3))
+
+
+def pool_key(url) -> str:
+    """连接池的key: scheme://host:port"""
+    parts = urlsplit(str(url))
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}"
+
+
+class PooledSession(Session):
+    """使用共享连接池的 requests 会话(cookie 独立)"""
+
+    def __init__(self, pool: "HttpPool"):
+        super().__init__()
+        self.pool = pool
+
+    def get_adapter(self, url):
+        return self.pool.adapter(url)
+
+    def close(self):
+        # 连接池由 HttpPool 统一关闭
+        pass
+
+
+class HttpPool:
+    """同步执行器(requests)使用的连接池"""
+
+    def __init__(self, max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST, retries: int = RETRIES,
+                 backoff_factor: float = RETRY_BACKOFF):
+        self.max_connections_per_host = max_connections_per_host
+        self.retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                           backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                           allowed_methods=IDEMPOTENT_METHODS, raise_on_status=False)
+        self._adapters: Dict[str, HTTPAdapter] = {}
+        self._lock = threading.Lock()
+
+    def adapter(self, url) -> HTTPAdapter:
+        key = pool_key(url)
+        adapter = self._adapters.get(key)
+        if adapter is None:
+            with self._lock:
+                adapter = self._adapters.get(key)
+                if adapter is None:
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections_per_host,
+                                          max_retries=self.retry, pool_block=True)
+                    self._adapters[key] = adapter
+        return adapter
+
+    def session(self) -> PooledSession:
+        """为一条用例创建会话"""
+        return PooledSession(self)
+
+    def close(self):
+        for adapter in self._adapters.values():
+            adapter.close()
+        self._adapters.clear()
+
+
+class AsyncHttpPool(httpx.AsyncBaseTransport):
+    """异步执行器(httpx)使用的连接池，作为 transport 传给每条用例的 AsyncClient"""
+
+    def __init__(self, max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST, retries: int = RETRIES,
+                 backoff_factor: float = RETRY_BACKOFF):
+        self.max_connections_per_host = max_connections_per_host
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self._transports: Dict[str, httpx.AsyncHTTPTransport] = {}
+
+    def _transport(self, url) -> httpx.AsyncHTTPTransport:
+        key = pool_key(url)
+        transport = self._transports.get(key)
+        if transport is None:
+            limits = httpx.Limits(max_connections=self.max_connections_per_host,
+                                  max_keepalive_connections=self.max_connections_per_host)
+            transport = self._transports[key] = httpx.AsyncHTTPTransport(limits=limits)
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transport = self._transport(request.url)
+        # 只有请求体可以重复发送(ByteStream)时才重试, 流式/文件请求体发送一次后无法重放
+        replayable = isinstance(request.stream, httpx.ByteStream)
+        retries = self.retries if request.method in IDEMPOTENT_METHODS and replayable else 0
+        attempt = 0
+        while True:
+            try:
+                response = await transport.handle_async_request(request)
+            except httpx.TransportError:
+                if attempt >= retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                # 读完响应体再释放, 连接可以继续复用
+                await response.aread()
+                await response.aclose()
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+            attempt += 1
+
+    async def aclose(self):
+        for transport in self._transports.values():
+            await transport.aclose()
+        self._transports.clear()
@@ -0,0 +1,280 @@
+import ast
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import jmespath
+from requests.structures import CaseInsensitiveDict
+
+"""
+前后置脚本执行器
+    1、脚本按内容哈希缓存编译后的代码对象，全局函数(func_global)按哈希缓存执行后的命名空间
+    2、可选的进程池模式(API_RUN_SCRIPT_MODE=process)：
+        - 工作进程启动时预先导入 api_case_run.global_tools 等模块，常驻复用
+        - 只传递脚本用到的变量：脚本读取的环境变量、后置脚本需要的前置脚本变量、精简后的响应数据
+        - 使用了 db、self、或 test 上代理不支持的属性的脚本仍在当前进程执行
+    3、每个脚本的CPU耗时写入用例日志
+"""
+
+SCRIPT_MODE = os.getenv("API_RUN_SCRIPT_MODE", "thread")
+SCRIPT_WORKERS = int(os.getenv("API_RUN_SCRIPT_WORKERS", 0)) or max(1, (os.cpu_count() or 2) - 1)
+
+# 进程池中脚本可以使用的 test 方法/属性
+PROXY_TEST_ATTRS = frozenset({"save_test_env_variables", "get_test_env_variables", "test_env_global",
+                              "json_extract", "re_extract"})
+# 进程池中脚本可以使用的 response 属性
+PROXY_RESPONSE_ATTRS = frozenset({"status_code", "headers", "text", "content", "url", "json", "encoding"})
+# 脚本命名空间中由执行器注入的变量
+RESERVED_NAMES = frozenset({"test", "db", "response", "self", "api_info"})
+# 只能在当前进程使用的变量
+LOCAL_ONLY_NAMES = frozenset({"db", "self", "api_info"})
+
+_code_cache = {}
+_analysis_cache = {}
+_globals_cache = {}
+_cache_lock = threading.Lock()
+
+
+def script_hash(source: str) -> str:
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+def compile_script(source: str):
+    """编译脚本(按内容哈希缓存)"""
+    key = script_hash(source)
+    code = _code_cache.get(key)
+    if code is None:
+        code = compile(source, f"<script {key[:8]}>", "exec")
+        with _cache_lock:
+            _code_cache[key] = code
+    return code
+
+
+def script_globals(func_global: Optional[str]) -> dict:
+    """
+    脚本执行的全局命名空间: 与 BaseTestCase 所在模块一致(可使用 global_function、jmespath 等)，
+    并加入测试环境中定义的全局函数
+    """
+    key = script_hash(func_global) if func_global else ""
+    namespace = _globals_cache.get(key)
+    if namespace is None:
+        from api_case_run.core import basecase
+        namespace = dict(vars(basecase))
+        if func_global:
+            exec(compile_script(func_global), namespace)
+        with _cache_lock:
+            _globals_cache[key] = namespace
+    # 返回副本，脚本中的 global 语句不会污染缓存
+    return dict(namespace)
+
+
+def analyse_script(source: str) -> dict:
+    """
+    静态分析脚本，判断能否放到进程池执行
+    :return: {"portable": 是否可在进程池执行, "loads": 读取的变量名, "stores": 写入的变量名,
+              "env_reads": 读取的环境变量(None表示无法确定，需要传递全部环境变量)}
+    """
+    key = script_hash(source)
+    info = _analysis_cache.get(key)
+    if info is not None:
+        return info
+    info = {"portable": True, "loads": set(), "stores": set(), "env_reads": set()}
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        tree = None
+        info["portable"] = False
+    if tree is not None:
+        attribute_values = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+                attribute_values.add(id(node.value))
+                owner, attr = node.value.id, node.attr
+                if owner == "test":
+                    if attr not in PROXY_TEST_ATTRS:
+                        info["portable"] = False
+                    elif attr == "test_env_global":
+                        info["env_reads"] = None
+                elif owner == "response" and attr not in PROXY_RESPONSE_ATTRS:
+                    info["portable"] = False
+            elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                    and node.func.attr == "get_test_env_variables" and info["env_reads"] is not None:
+                arg = node.args[0] if node.args else None
+                if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                    info["env_reads"].add(arg.value)
+                else:
+                    info["env_reads"] = None
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Name):
+                continue
+            if node.id in LOCAL_ONLY_NAMES or (node.id == "test" and id(node) not in attribute_values):
+                info["portable"] = False
+            if isinstance(node.ctx, ast.Load):
+                info["loads"].add(node.id)
+            else:
+                info["stores"].add(node.id)
+    with _cache_lock:
+        _analysis_cache[key] = info
+    return info
+
+
+def dump_response(response) -> Optional[dict]:
+    """把 requests/httpx 响应精简为可以跨进程传递的数据"""
+    if response is None:
+        return None
+    return {
+        "status_code": response.status_code,
+        "headers": dict(response.headers),
+        "content": response.content,
+        "encoding": response.encoding,
+        "url": str(response.url),
+    }
+
+
+class ScriptResponse:
+    """进程池中脚本看到的响应对象"""
+
+    def __init__(self, status_code, headers, content, encoding, url):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+        self.encoding = encoding
+        self.url = url
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.text)
+
+    def __repr__(self):
+        return f"<Response [{self.status_code}]>"
+
+
+class ScriptTest:
+    """进程池中脚本看到的 test 对象(代理 BaseTestCase 中脚本常用的方法)"""
+
+    def __init__(self, test_env_global: dict):
+        self.test_env_global = test_env_global
+        self.logs = []
+
+    def save_test_env_variables(self, name, value):
+        self.logs.append(f"开始保存环境变量:变量名称为：{name}，变量值为：{value}")
+        self.test_env_global[name] = value
+
+    def get_test_env_variables(self, name):
+        self.logs.append("开始获取环境变量")
+        return self.test_env_global.get(name)
+
+    def json_extract(self, expr, response):
+        value = jmespath.search(expr, response.json())
+        self.logs.append(f"JSON提取数据: 表达式={expr}, 结果={value}")
+        return value
+
+    def re_extract(self, string, pattern):
+        match = re.search(pattern, string)
+        value = match.group(1) if match else None
+        self.logs.append(f"正则提取数据: 表达式={pattern}, 结果={value}")
+        return value
+
+
+def _warm_up():
+    """工作进程初始化: 预先导入脚本常用的模块"""
+    import api_case_run.global_tools  # noqa: F401
+    script_globals(None)
+
+
+def _run_in_worker(source: str, func_global: Optional[str], env: dict, namespace: dict,
+                   response: Optional[dict], keep) -> dict:
+    """在工作进程中执行脚本，返回环境变量变化、需要保留的脚本变量、日志和CPU耗时"""
+    test = ScriptTest(env)
+    before = dict(env)
+    local_vars = dict(namespace)
+    local_vars["test"] = test
+    local_vars["response"] = ScriptResponse(**response) if response is not None else None
+    code = compile_script(source)
+    script_global = script_globals(func_global)
+    start = time.process_time()
+    exec(code, script_global, local_vars)
+    cpu_time = time.process_time() - start
+    exported, skipped = {}, []
+    for name in keep:
+        if name in local_vars and name not in RESERVED_NAMES:
+            try:
+                pickle.dumps(local_vars[name])
+            except Exception:
+                skipped.append(name)
+            else:
+                exported[name] = local_vars[name]
+    return {
+        "env_changes": {k: v for k, v in env.items() if k not in before or before[k] is not v},
+        "namespace": exported,
+        "skipped": skipped,
+        "logs": test.logs,
+        "cpu_time": cpu_time,
+    }
+
+
+class ScriptRunner:
+    """前后置脚本进程池"""
+
+    def __init__(self, workers: int = SCRIPT_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_warm_up)
+        return self._pool
+
+    def prepare(self, source: str, namespace: dict, env: dict, response, next_script: str = "") -> Optional[tuple]:
+        """
+        生成进程池任务参数，脚本不适合在进程池执行时返回 None
+        :param namespace: 前后置脚本共享的变量空间
+        :param next_script: 后续还要执行的脚本(前置脚本执行时传入后置脚本)，用于确定需要带回的变量
+        """
+        info = analyse_script(source)
+        if not info["portable"]:
+            return None
+        env_reads = info["env_reads"]
+        func_global = env.get("func_global")
+        if env_reads is None:
+            sub_env = dict(env)
+        else:
+            sub_env = {k: env[k] for k in env_reads if k in env}
+        # 只传递脚本会读取的前置脚本变量
+        sub_namespace = {k: v for k, v in namespace.items() if k in info["loads"] and k not in RESERVED_NAMES}
+        try:
+            pickle.dumps((sub_env, sub_namespace))
+        except Exception:
+            return None
+        keep = sorted(analyse_script(next_script)["loads"] & info["stores"]) if next_script else []
+        return source, func_global, sub_env, sub_namespace, dump_response(response), keep
+
+    def run(self, job: tuple) -> dict:
+        return self._ensure_pool().submit(_run_in_worker, *job).result()
+
+    async def run_async(self, job: tuple) -> dict:
+        return await asyncio.wrap_future(self._ensure_pool().submit(_run_in_worker, *job))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# 进程内共享的脚本进程池(按需启动)
+script_runner = ScriptRunner()
@@ -0,0 +1,108 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+"""
+变量引用 ${{name}} 的模板编译与替换
+    1、编译：遍历一次请求/断言数据结构，记录每个字符串中变量引用的位置，编译结果按数据内容缓存
+    2、替换：按编译结果直接构造新的数据结构，不再经过 str() + eval() 的往返
+        - 整个字符串就是一个变量引用时，替换为变量的原始类型(数字、列表、字典等)
+        - 变量引用嵌在字符串中时，按字符串拼接
+        - 变量不存在(或值为None)时替换为空字符串
+    3、替换不会修改原始数据，同一条用例重复执行时可以复用编译结果
+"""
+
+VARIABLE_PATTERN = re.compile(r"\${{(.+?)}}")
+# 用例请求中需要替换变量的字段
+REPLACE_FIELDS = ("url", "base_url", "headers", "params", "body", "files")
+# 编译结果缓存的最大条数
+CACHE_SIZE = 2048
+
+_cache: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _lookup(variables: dict, name: str, trace: Optional[list]):
+    value = variables.get(name)
+    if trace is not None:
+        trace.append((name, value))
+    return "" if value is None else value
+
+
+def _compile(node) -> Tuple[Callable, bool]:
+    """
+    编译单个节点
+    :return: (渲染函数 render(variables, trace), 是否包含变量引用)
+    """
+    if isinstance(node, str):
+        parts = VARIABLE_PATTERN.split(node)
+        if len(parts) == 1:
+            return (lambda variables, trace: node), False
+        # split 后奇数下标为变量名
+        if len(parts) == 3 and parts[0] == "" and parts[2] == "":
+            name = parts[1]
+            return (lambda variables, trace: _lookup(variables, name, trace)), True
+
+        def render_str(variables, trace):
+            return "".join(part if i % 2 == 0 else str(_lookup(variables, part, trace))
+                           for i, part in enumerate(parts))
+
+        return render_str, True
+    if isinstance(node, dict):
+        items = [(_compile(k), _compile(v)) for k, v in node.items()]
+        dynamic = any(k[1] or v[1] for k, v in items)
+        items = [(k[0], v[0]) for k, v in items]
+
+        def render_dict(variables, trace):
+            return {render_key(variables, trace): render_value(variables, trace) for render_key, render_value in items}
+
+        return render_dict, dynamic
+    if isinstance(node, (list, tuple)):
+        items = [_compile(v) for v in node]
+        dynamic = any(d for _, d in items)
+        renders = [r for r, _ in items]
+        container = type(node)
+
+        def render_seq(variables, trace):
+            return container(r(variables, trace) for r in renders)
+
+        return render_seq, dynamic
+    return (lambda variables, trace: node), False
+
+
+class CompiledTemplate:
+    """编译后的模板"""
+
+    def __init__(self, source):
+        self._render, self.dynamic = _compile(source)
+        self.variables = sorted(set(VARIABLE_PATTERN.findall(repr(source))))
+
+    def render(self, variables: dict, trace: Optional[List[Tuple[str, Any]]] = None):
+        """
+        替换变量，返回新的数据结构
+        :param variables: 变量字典(测试环境数据)
+        :param trace: 传入列表时记录每次替换的 (变量名, 变量值)，用于写日志
+        """
+        return self._render(variables, trace)
+
+
+def compile_template(source) -> CompiledTemplate:
+    """编译模板(按数据内容缓存)"""
+    key = repr(source)
+    with _cache_lock:
+        template = _cache.get(key)
+        if template is not None:
+            _cache.move_to_end(key)
+            return template
+    template = CompiledTemplate(source)
+    with _cache_lock:
+        _cache[key] = template
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return template
+
+
+def render_template(source, variables: dict, trace: Optional[list] = None):
+    """编译(命中缓存时直接复用)并替换变量"""
+    return compile_template(source).render(variables, trace)
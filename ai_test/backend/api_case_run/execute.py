@@ -3,18 +3,27 @@
     1、遍历测试任务/套件，执行用例
     2、记录每条用例的执行结果
 """
+import asyncio
+import logging
 import time
-from typing import List
+from typing import Awaitable, Callable, List, Optional
 from api_case_run.core.database_client import DBClient
+from api_case_run.core.http_pool import HttpPool, AsyncHttpPool, MAX_CONNECTIONS_PER_HOST
+from api_case_run.core.script_runner import SCRIPT_MODE, script_runner
 from api_case_run.core.test_result import TestResult
 from api_case_run.core.basecase import BaseTestCase
+from api_case_run.core.async_basecase import AsyncBaseTestCase
+from api_case_run.core.dependency import build_case_plan
 import traceback
 
+logger = logging.getLogger(__name__)
+
 
 class TestExecutor:
     """用例执行器"""
 
-    def __init__(self, test_env_global: dict, db_config: list):
+    def __init__(self, test_env_global: dict, db_config: list, max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST,
+                 script_mode: str = None):
         # 保存所有用例执行的结果
         self.results: List[TestResult] = []
         self.summary = {
@@ -28,6 +37,27 @@ class TestExecutor:
         self.test_env_global = test_env_global
         # 对数据库连接进行初始化
         self.db = DBClient(db_config)
+        self.max_connections_per_host = max_connections_per_host
+        # 所有用例共享的连接池
+        self.http_pool = HttpPool(max_connections_per_host)
+        # 前后置脚本执行方式: thread(当前进程，默认) / process(进程池)
+        self.script_runner = script_runner if (script_mode or SCRIPT_MODE) == "process" else None
+
+    def close(self):
+        """关闭共享连接池"""
+        self.http_pool.close()
+
+    def reset_summary(self):
+        """重置执行结果和统计信息(执行下一个套件前调用)"""
+        self.results = []
+        self.summary = {
+            "total": 0,
+            "success": 0,
+            "fail": 0,
+            "error": 0,
+            "skip": 0,
+            "duration": 0,
+        }
 
     def execute_test_case(self, case_data: dict) -> TestResult:
         """执行单条用例，并收集执行的结果"""
@@ -45,7 +75,8 @@ class TestExecutor:
         result.add_info_log(f"【开始执行用例】：{case_name}")
         try:
             # 编写用例执行的逻辑
-            case_run = BaseTestCase(case_data, result, self.test_env_global, self.db)
+            case_run = BaseTestCase(case_data, result, self.test_env_global, self.db, self.http_pool,
+                                    self.script_runner)
             case_run.run()
         except AssertionError as e:
             # 修改用例执行的状态为失败
@@ -66,6 +97,13 @@ class TestExecutor:
         else:
             result.status = "success"
             result.add_info_log(f"【执行通过】：用例{case_name}")
+        self._finish_result(result)
+        # 返回用例执行的结果
+        return result
+
+    @staticmethod
+    def _finish_result(result: TestResult):
+        """记录结束时间，并把接口请求信息转换为字典"""
         # 获取执行结束的时间戳
         result.end_time = time.time()
         # 计算执行的时长
@@ -83,8 +121,6 @@ class TestExecutor:
                 "status_code": api_request.status_code,
             })
         result.api_requests_info = new_api_requests_info
-        # 返回用例执行的结果
-        return result
 
     def execute_test_suite(self, suite_data: dict):
         """执行测试套件"""
@@ -98,15 +134,7 @@ class TestExecutor:
             result = self.execute_test_case(case_data)
             # 保存执行结果
             self.results.append(result)
-            # 判断执行的状态信息
-            if result.status == "success":
-                self.summary['success'] += 1
-            elif result.status == "failed":
-                self.summary['fail'] += 1
-            elif result.status == "error":
-                self.summary['error'] += 1
-            elif result.status == "skip":
-                self.summary['skip'] += 1
+            self._count_result(result)
         end_time = time.time()
         # 获取执行完的时间戳
         self.summary['duration'] = end_time - start_time
@@ -117,6 +145,17 @@ class TestExecutor:
             "summary": self.summary
         }
 
+    def _count_result(self, result: TestResult):
+        """根据执行状态累计套件统计信息"""
+        if result.status == "success":
+            self.summary['success'] += 1
+        elif result.status == "failed":
+            self.summary['fail'] += 1
+        elif result.status == "error":
+            self.summary['error'] += 1
+        elif result.status == "skip":
+            self.summary['skip'] += 1
+
     def execute_test_task(self, task_data: dict):
         """执行测试任务的方法
         Args:
@@ -161,15 +200,7 @@ class TestExecutor:
         # 遍历执行任务中的每个套件
         for suite_data in suites_list:
             # 重置执行器状态，为每个套件创建新的结果收集器
-            self.results = []
-            self.summary = {
-                "total": 0,
-                "success": 0,
-                "fail": 0,
-                "error": 0,
-                "skip": 0,
-                "duration": 0,
-            }
+            self.reset_summary()
             
             # 执行当前套件
             suite_result = self.execute_test_suite(suite_data)
@@ -199,3 +230,210 @@ class TestExecutor:
             "task_summary": task_summary,
             "suite_results": suite_results
         }
+
+
+class AsyncTestExecutor(TestExecutor):
+    """
+    异步用例执行器
+        - 请求通过 httpx 异步发送，整次执行共享一个连接池
+        - 套件内按变量依赖构建DAG：存在依赖的用例保持先后顺序，独立分支按套件并发数并行执行，
+          每条用例在独立的变量作用域中运行(基础环境变量 + 所依赖用例产生的变量)
+        - 返回的结果结构与 TestExecutor 完全一致
+        - 传入 on_event 时，套件中每条用例开始/结束执行都会发布事件(用于实时进度推送)
+    """
+
+    def __init__(self, test_env_global: dict, db_config: list, concurrency: int = 5,
+                 max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST, script_mode: str = None,
+                 on_event: Optional[Callable[[dict], None]] = None):
+        # pymysql 建立连接是阻塞的, 数据库连接在第一次执行用例前放到线程中建立
+        super().__init__(test_env_global, [], max_connections_per_host, script_mode)
+        self._db_config = db_config or None
+        self._db_lock = asyncio.Lock()
+        # 默认的套件并发数(套件数据中的 concurrency 优先)
+        self.concurrency = concurrency
+        self.on_event = on_event
+        self._transport: Optional[AsyncHttpPool] = None
+
+    def _emit(self, event_type: str, **data):
+        """发布执行事件(回调异常不影响用例执行)"""
+        if self.on_event is None:
+            return
+        try:
+            self.on_event({"type": event_type, **data})
+        except Exception as e:
+            logger.warning(f"执行事件发布失败: {e}")
+
+    async def __aenter__(self):
+        """在 async with 范围内所有套件共享同一个连接池"""
+        await self._connect_db()
+        self._open_transport()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self._close_transport()
+
+    async def _connect_db(self):
+        """在线程中建立数据库连接, 整个执行器只连接一次"""
+        if self._db_config is None:
+            return
+        async with self._db_lock:
+            if self._db_config is not None:
+                self.db = await asyncio.to_thread(DBClient, self._db_config)
+                self._db_config = None
+
+    def _open_transport(self) -> bool:
+        """创建共享连接池，已存在时返回False(由外层负责关闭)"""
+        if self._transport is not None:
+            return False
+        self._transport = AsyncHttpPool(self.max_connections_per_host)
+        return True
+
+    async def _close_transport(self):
+        if self._transport is not None:
+            await self._transport.aclose()
+            self._transport = None
+
+    async def execute_test_case(self, case_data: dict, test_env: Optional[dict] = None) -> TestResult:
+        """执行单条用例，并收集执行的结果(test_env为用例的变量作用域，默认使用全局环境变量)"""
+        case_name = case_data.get("name")
+        case_id = case_data.get("id")
+        result = TestResult(case_name, case_id)
+        if case_data.get("skip"):
+            result.status = "skip"
+            result.add_info_log(f"【跳过用例】：{case_name}")
+            return result
+        await self._connect_db()
+        result.start_time = time.time()
+        result.add_info_log(f"【开始执行用例】：{case_name}")
+        opened = self._open_transport()
+        try:
+            env = self.test_env_global if test_env is None else test_env
+            case_run = AsyncBaseTestCase(case_data, result, env, self.db, self._transport, self.script_runner)
+            await case_run.run()
+        except AssertionError as e:
+            result.status = "failed"
+            result.error_message = str(e)
+            result.traceback = traceback.format_exc()
+            result.add_error_log(f"用例{case_name}断言失败，错误信息为：{e}")
+        except Exception as e:
+            result.status = "error"
+            result.error_message = str(e)
+            result.traceback = traceback.format_exc()
+            result.add_error_log(f"用例{case_name}执行出现错误！，错误信息为：{e}")
+        else:
+            result.status = "success"
+            result.add_info_log(f"【执行通过】：用例{case_name}")
+        finally:
+            if opened:
+                await self._close_transport()
+        self._finish_result(result)
+        return result
+
+    async def execute_test_suite(self, suite_data: dict,
+                                 on_result: Optional[Callable[[TestResult], Awaitable]] = None):
+        """
+        执行测试套件：按依赖图调度，独立分支并发
+        :param on_result: 每条用例执行完成后的回调(用于实时保存结果)
+        """
+        start_time = time.time()
+        cases_list = suite_data.get("cases_list")
+        self.summary['total'] = len(cases_list)
+        plan = build_case_plan(cases_list)
+        nodes = plan["nodes"]
+        semaphore = asyncio.Semaphore(max(1, suite_data.get("concurrency") or self.concurrency))
+        results: List[Optional[TestResult]] = [None] * len(cases_list)
+        finished = [asyncio.Event() for _ in cases_list]
+        # exports: 用例结束时相对基础环境变化过的变量(含依赖链传递下来的)；changes: 用例自身写入的变量
+        exports: List[dict] = [{} for _ in cases_list]
+        changes: List[dict] = [{} for _ in cases_list]
+        base = self.test_env_global
+        suite_id = suite_data.get("id")
+
+        async def run_node(node):
+            index = node["index"]
+            for dep in node["depends_on"]:
+                await finished[dep].wait()
+            scope = dict(base)
+            for dep in node["depends_on"]:
+                scope.update(exports[dep])
+            initial = dict(scope)
+            try:
+                async with semaphore:
+                    case_data = cases_list[index]
+                    self._emit("case_started", suite_id=suite_id, index=index, case_id=case_data.get("id"),
+                               name=case_data.get("name"))
+                    results[index] = await self.execute_test_case(case_data, scope)
+                    self._emit("case_finished", suite_id=suite_id, index=index, case_id=case_data.get("id"),
+                               name=case_data.get("name"), status=results[index].status,
+                               duration=results[index].duration)
+                exports[index] = {k: v for k, v in scope.items() if k not in base or base[k] is not v}
+                changes[index] = {k: v for k, v in scope.items() if k not in initial or initial[k] is not v}
+            finally:
+                finished[index].set()
+            if on_result is not None:
+                await on_result(results[index])
+
+        opened = self._open_transport()
+        try:
+            await asyncio.gather(*[run_node(node) for node in nodes])
+        finally:
+            if opened:
+                await self._close_transport()
+        # 按用例原有顺序合并变量，后续套件看到的环境与串行执行一致
+        for index, result in enumerate(results):
+            base.update(changes[index])
+            self.results.append(result)
+            self._count_result(result)
+        self.summary['duration'] = time.time() - start_time
+        return {
+            "results": self.results,
+            "summary": self.summary,
+            "plan": plan
+        }
+
+    async def execute_test_task(self, task_data: dict,
+                                on_suite_start: Optional[Callable[[dict], Awaitable]] = None,
+                                on_result: Optional[Callable[[TestResult], Awaitable]] = None):
+        """
+        执行测试任务：套件依次执行，整个任务共享连接池
+        :param on_suite_start: 每个套件开始执行前的回调(用于创建套件运行记录)
+        :param on_result: 每条用例执行完成后的回调(用于实时保存结果)
+        """
+        task_start_time = time.time()
+        task_summary = {
+            "total_suites": 0,
+            "total_cases": 0,
+            "success_cases": 0,
+            "failed_cases": 0,
+            "error_cases": 0,
+            "skip_cases": 0,
+            "duration": 0,
+        }
+        suite_results = []
+        suites_list = task_data.get("suites_list", [])
+        task_summary["total_suites"] = len(suites_list)
+        opened = self._open_transport()
+        try:
+            for suite_data in suites_list:
+                self.reset_summary()
+                if on_suite_start is not None:
+                    await on_suite_start(suite_data)
+                suite_result = await self.execute_test_suite(suite_data, on_result=on_result)
+                suite_result["suite_id"] = suite_data.get("id")
+                suite_result["suite_name"] = suite_data.get("suite_name")
+                suite_results.append(suite_result)
+                task_summary["total_cases"] += suite_result["summary"]["total"]
+                task_summary["success_cases"] += suite_result["summary"]["success"]
+                task_summary["failed_cases"] += suite_result["summary"]["fail"]
+                task_summary["error_cases"] += suite_result["summary"]["error"]
+                task_summary["skip_cases"] += suite_result["summary"]["skip"]
+        finally:
+            if opened:
+                await self._close_transport()
+        task_summary["duration"] = time.time() - task_start_time
+        return {
+            "task_id": task_data.get("id"),
+            "task_name": task_data.get("task_name"),
+            "task_summary": task_summary,
+            "suite_results": suite_results
+        }
@@ -18,6 +18,9 @@ from pathlib import Path
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass, field
 
+# api_case_run 包所在目录
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 @dataclass
 class PytestCaseData:
@@ -71,17 +74,16 @@ class PytestBridge:
         conftest_content = f'''# Auto-generated conftest.py by AI Test Platform
 import pytest
 import json
-import re
 import sys
 import os
 import time
-from numbers import Number
 
 import allure
 import jmespath
 import requests
 from requests.sessions import Session
 from requests_toolbelt import MultipartEncoder
+from api_case_run.core.template import render_template
 
 # ============================ 全局 fixture ============================
 
@@ -113,42 +115,17 @@ def http_session():
 
 # ============================ 通用工具函数 ============================
 
-def replace_variables(data_str: str, env_vars: dict) -> str:
-    """替换变量引用 ${{variable_name}}"""
-    pattern = r"\\$\\{{\\{{(.+?)\\}}\\}}"
-    while re.search(pattern, data_str):
-        match = re.search(pattern, data_str)
-        key = match.group(1)
-        value = env_vars.get(key, "")
-        pattern_content = match.group()
-        if isinstance(value, Number) and not isinstance(value, bool):
-            s = data_str.find(pattern_content)
-            new_pattern_content = data_str[s - 1:s + len(pattern_content) + 1]
-            data_str = data_str.replace(new_pattern_content, str(value))
-        elif isinstance(value, (list, dict)):
-            s = data_str.find(pattern_content)
-            new_pattern_content = data_str[s - 1:s + len(pattern_content) + 1]
-            data_str = data_str.replace(new_pattern_content, str(value))
-        elif isinstance(value, str) and "\\'" in value:
-            data_str = data_str.replace(pattern_content, value.replace("\\'", '"'))
-        else:
-            data_str = data_str.replace(pattern_content, str(value))
-    return data_str
-
-
 def send_request(session: Session, api_info: dict, env_vars: dict) -> requests.Response:
     """发送 HTTP 请求"""
-    # 替换变量
-    data_str = str({{
+    # 替换变量(编译后的模板按用例数据缓存，重复执行时直接复用)
+    replaced_data = render_template({{
         "url": api_info.get("url", ""),
         "base_url": api_info.get("base_url", env_vars.get("base_url", "")),
         "headers": api_info.get("headers", {{}}),
         "params": api_info.get("params", {{}}),
         "body": api_info.get("body", {{}}),
         "files": api_info.get("files", {{}}),
-    }})
-    data_str = replace_variables(data_str, env_vars)
-    replaced_data = eval(data_str)
+    }}, env_vars)
 
     method = api_info.get("method", "GET").upper()
     url = replaced_data.get("base_url", "") + replaced_data.get("url", "")
@@ -200,9 +177,7 @@ def run_assertions(assertions: dict, response: requests.Response, env_vars: dict
         return
 
     # 替换断言中的变量
-    assertion_str = str(assertions)
-    assertion_str = replace_variables(assertion_str, env_vars)
-    assertions = eval(assertion_str)
+    assertions = render_template(assertions, env_vars)
 
     for item in assertions.get("response", []):
         type_ = item.get("type")
@@ -391,7 +366,8 @@ addopts = -v --tb=short --alluredir={self.allure_results_dir}
             pytest_args.extend(["-n", str(config.max_workers)])
 
         env = os.environ.copy()
-        env["PYTHONPATH"] = self.test_dir
+        # 生成的 conftest 需要导入 api_case_run 包
+        env["PYTHONPATH"] = os.pathsep.join([self.test_dir, PACKAGE_ROOT])
 
         process = subprocess.run(
             pytest_args,
@@ -12,6 +12,8 @@ dotenv.load_dotenv(os.path.join(BASE_DIR, '.env'))
 OUTPUT_PATH = os.path.join(os.path.join(BASE_DIR, "rag"), "output")
 # RAG_STORAGE路径
 STORAGE_PATH = os.path.join(os.path.join(BASE_DIR, "rag"), "rag_storage")
+# 压测原始样本落盘路径
+STRESS_SAMPLE_PATH = os.getenv('STRESS_SAMPLE_PATH', os.path.join(os.path.join(BASE_DIR, "datas"), "stress_samples"))
 
 # ==============通过接口接入rag的配置参数==============
 RAG_SERVER_URL = os.getenv('RAG_SERVER_URL', "")
@@ -15,6 +15,12 @@ while ! python -c "import pymysql; pymysql.connect(host='mysql', port=3306, user
     sleep 2
 done
 
+# PROCESS_TYPE=executor 时启动测试执行工作进程（配合 EXECUTION_QUEUE_ENABLED=1 使用）
+if [ "$PROCESS_TYPE" = "executor" ]; then
+    echo "MySQL已就绪，启动测试执行工作进程..."
+    exec python executor_worker.py
+fi
+
 echo "MySQL已就绪，启动gunicorn服务..."
 
 # 启动gunicorn服务
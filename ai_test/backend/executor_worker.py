@@ -0,0 +1,137 @@
+"""
+测试执行工作进程
+    启动方式: python executor_worker.py (或容器中设置 PROCESS_TYPE=executor)
+    1、从 execution_job 表按优先级租用任务，同时执行的任务数由 EXECUTOR_WORKER_SLOTS 控制
+    2、执行期间定时续租；租约被其它进程接管时停止执行当前任务
+    3、收到退出信号时停止租用新任务，并归还正在执行任务的租约，由其它工作进程从未完成的套件继续执行
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+from typing import Dict
+from tortoise import Tortoise
+from main import TORTOISE_ORM
+from service.test_execution import job_queue
+from service.test_execution.api import execute_test_task_background
+from service.test_execution.models import ExecutionJob
+from service.api_test.api import _execute_task_run
+
+logger = logging.getLogger("executor_worker")
+
+WORKER_SLOTS = int(os.getenv("EXECUTOR_WORKER_SLOTS", 2))
+# 队列为空时的轮询间隔(秒)
+POLL_INTERVAL = float(os.getenv("EXECUTOR_POLL_INTERVAL", 1.0))
+
+
+async def run_task_background(payload: dict, resume: bool):
+    await execute_test_task_background(payload["project_id"], payload["task_id"], payload["environment_id"],
+                                       payload["task_run_id"], resume=resume)
+
+
+async def run_task_run(payload: dict, resume: bool):
+    await _execute_task_run(payload["task_run_id"], payload["suite_info"], payload["environment_id"],
+                            payload["project_id"], resume=resume)
+
+
+# 任务类型 -> 执行函数
+HANDLERS = {
+    "task_background": run_task_background,
+    "task_run": run_task_run,
+}
+
+
+class ExecutorWorker:
+    """执行工作进程"""
+
+    def __init__(self, slots: int = WORKER_SLOTS, lease_seconds: int = job_queue.LEASE_SECONDS):
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.slots = slots
+        self.lease_seconds = lease_seconds
+        self._running: Dict[int, asyncio.Task] = {}
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        logger.info(f"执行工作进程启动: {self.worker_id}, 并发数: {self.slots}")
+        while not self._stopping.is_set():
+            try:
+                await job_queue.reap_expired()
+                job = await job_queue.lease(self.worker_id, self.lease_seconds) \
+                    if len(self._running) < self.slots else None
+            except Exception as e:
+                logger.error(f"租用执行任务失败: {e}")
+                job = None
+            if job is not None:
+                self._running[job.id] = asyncio.create_task(self._execute(job))
+                continue
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        await self._shutdown()
+
+    async def _execute(self, job: ExecutionJob):
+        resume = job.attempts > 1
+        logger.info(f"开始执行任务{job.id}({job.job_type}, 通道{job.lane}, 第{job.attempts}次租用)")
+        task = asyncio.current_task()
+        heartbeat = asyncio.create_task(self._heartbeat(job.id, task))
+        try:
+            handler = HANDLERS.get(job.job_type)
+            if handler is None:
+                raise ValueError(f"未知的任务类型: {job.job_type}")
+            await handler(job.payload, resume)
+        except asyncio.CancelledError:
+            # 租约丢失或进程退出，由其它工作进程继续执行
+            logger.warning(f"任务{job.id}已停止执行")
+        except Exception as e:
+            logger.error(f"任务{job.id}执行失败: {e}")
+            await job_queue.fail(job.id, self.worker_id, str(e))
+        else:
+            await job_queue.complete(job.id, self.worker_id)
+            logger.info(f"任务{job.id}执行完成")
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job.id, None)
+
+    async def _heartbeat(self, job_id: int, task: asyncio.Task):
+        """定时续租，租约被接管时停止执行"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                renewed = await job_queue.renew(job_id, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"任务{job_id}续租失败: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"任务{job_id}的租约已被其它进程接管")
+                task.cancel()
+                return
+
+    async def _shutdown(self):
+        """停止正在执行的任务并归还租约"""
+        for job_id, task in list(self._running.items()):
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await job_queue.release(job_id, self.worker_id)
+        logger.info(f"执行工作进程退出: {self.worker_id}")
+
+
+async def main():
+    await Tortoise.init(config=TORTOISE_ORM)
+    worker = ExecutorWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -24,6 +24,9 @@ from service.schedule.api import router as schedule_router
 from service.knowledge.api import router as knowledge_router
 from service.ui_test.api import router as ui_test_router
 from service.stress_test.api import router as stress_test_router
+from service.stress_test.metric_writer import metric_writer
+from api_case_run.core.script_runner import script_runner
+from service.api_test.scheduler import SCHEDULER_ENABLED, cron_scheduler
 from service.data_analysis.api import router as data_analysis_router
 import uvicorn
 
@@ -124,6 +127,44 @@ async def run_migrations():
         "ALTER TABLE `ui_test_step_result` ADD COLUMN `assertion_type` VARCHAR(50) NULL",
         "ALTER TABLE `ui_test_step_result` ADD COLUMN `assertion_passed` TINYINT(1) NULL",
         "ALTER TABLE `ui_test_step_result` ADD COLUMN `assertion_detail` TEXT NULL",
+        # 压测实时指标：秒级窗口P95/P99
+        "ALTER TABLE `stress_test_metric` ADD COLUMN `p95_response_time` DOUBLE NOT NULL DEFAULT 0",
+        "ALTER TABLE `stress_test_metric` ADD COLUMN `p99_response_time` DOUBLE NOT NULL DEFAULT 0",
+        # 压测开放模型：到达分布、丢弃/迟发计数
+        "ALTER TABLE `stress_test_task` ADD COLUMN `arrival_distribution` VARCHAR(20) NOT NULL DEFAULT 'constant'",
+        "ALTER TABLE `stress_test_result` ADD COLUMN `dropped_requests` INT NOT NULL DEFAULT 0",
+        "ALTER TABLE `stress_test_result` ADD COLUMN `late_requests` INT NOT NULL DEFAULT 0",
+        # 压测多进程发压
+        "ALTER TABLE `stress_test_task` ADD COLUMN `processes` INT NOT NULL DEFAULT 1",
+        "ALTER TABLE `stress_test_task` ADD COLUMN `agent_count` INT NOT NULL DEFAULT 0",
+        # 压测场景：思考时间分布与节奏控制
+        "ALTER TABLE `stress_test_scenario` ADD COLUMN `think_time_distribution` VARCHAR(20) NOT NULL DEFAULT 'constant'",
+        "ALTER TABLE `stress_test_scenario` ADD COLUMN `think_time_spread` INT NOT NULL DEFAULT 0",
+        "ALTER TABLE `stress_test_scenario` ADD COLUMN `pacing` INT NOT NULL DEFAULT 0",
+        # 压测任务：原始样本落盘开关
+        "ALTER TABLE `stress_test_task` ADD COLUMN `record_samples` TINYINT(1) NOT NULL DEFAULT 0",
+        # 压测容量探测：探测配置、吞吐/延迟曲线与饱和点
+        "ALTER TABLE `stress_test_task` ADD COLUMN `capacity_config` JSON NULL",
+        "ALTER TABLE `stress_test_result` ADD COLUMN `capacity_curve` JSON NULL",
+        "ALTER TABLE `stress_test_result` ADD COLUMN `saturation_point` JSON NULL",
+        # 压测传输层配置与统计
+        "ALTER TABLE `stress_test_scenario` ADD COLUMN `transport_profile` JSON NULL",
+        "ALTER TABLE `stress_test_result` ADD COLUMN `transport_stats` JSON NULL",
+        # 压测请求阶段耗时拆分
+        "ALTER TABLE `stress_test_task` ADD COLUMN `trace_phases` TINYINT(1) NOT NULL DEFAULT 0",
+        "ALTER TABLE `stress_test_result` ADD COLUMN `phase_breakdown` JSON NULL",
+        # 压测阶段编排：阶段列表与指标所属阶段
+        "ALTER TABLE `stress_test_task` ADD COLUMN `stages` JSON NULL",
+        "ALTER TABLE `stress_test_metric` ADD COLUMN `stage` INT NULL",
+        # 测试套件新增用例并发数
+        "ALTER TABLE `test_suite` ADD COLUMN `concurrency` INT NOT NULL DEFAULT 5",
+        # 套件运行记录新增用例依赖图执行计划
+        "ALTER TABLE `test_suite_run` ADD COLUMN `execution_plan` JSON NULL",
+        # 增量执行：用例执行指纹、任务执行模式与用例选择结果
+        "ALTER TABLE `api_case_run` ADD COLUMN `fingerprint` VARCHAR(80) NULL",
+        "ALTER TABLE `test_task_run` ADD COLUMN `run_mode` VARCHAR(20) NOT NULL DEFAULT 'full'",
+        "ALTER TABLE `test_task_run` ADD COLUMN `selection` JSON NULL",
+        "ALTER TABLE `scheduled_task` ADD COLUMN `run_mode` VARCHAR(20) NOT NULL DEFAULT 'full'",
     ]
     for sql in migrations:
         try:
@@ -181,7 +222,16 @@ async def lifespan(app: FastAPI):
     handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
     # 添加处理器到记录器
     logger.addHandler(handler)
+    # 启动定时任务调度器
+    if SCHEDULER_ENABLED:
+        await cron_scheduler.start()
     yield
+    # 停止定时任务调度器
+    await cron_scheduler.stop()
+    # 写出尚未入库的压测指标
+    await metric_writer.close()
+    # 关闭前后置脚本进程池
+    script_runner.shutdown()
     # 关闭时清理数据库连接
     await close_db()
     for handler in logger.handlers:
@@ -39,6 +39,7 @@ from .schemas import (
 )
 from .models import ApiInterface, ApiDependencyGroup, ApiDependency, ApiBaseCase, ApiTestCase, \
     QuickDebugHistory, ScheduledTask, WebhookConfig
+from .scheduler import cron_scheduler
 import httpx
 import time
 import shlex
@@ -50,6 +51,11 @@ from service.project.models import Project
 from service.test_environment.models import TestEnvironment, TestEnvironmentConfig, TestEnvironmentDb
 from service.test_management.models import TestTask, TestSuite, TaskSuiteRelation, SuiteCaseRelation
 from service.test_execution.models import ApiCaseRun, TestSuiteRun, TestTaskRun
+from service.test_execution.result_sink import CaseResultSink, restore_task_run
+from service.test_execution.case_selection import prepare_task_run
+from service.test_execution.job_queue import QUEUE_ENABLED, enqueue
+from service.test_execution.run_events import run_event_hub
+from utils.cron import CronExpression
 from utils.permissions import verify_admin_or_project_owner, verify_admin_or_project_editor, \
     verify_admin_or_project_member
 from utils.auth import get_current_user
@@ -3193,6 +3199,9 @@ async def create_scheduled_task(
     if not env:
         raise HTTPException(status_code=404, detail="测试环境不存在")
 
+    if req.cron_expression:
+        _validate_cron(req.cron_expression)
+
     # 计算下次执行时间
     next_run = _calc_next_run(req.cron_expression) if req.cron_expression and req.task_type == 'cron' else None
 
@@ -3203,10 +3212,12 @@ async def create_scheduled_task(
         test_task_id=req.test_task_id,
         environment_id=req.environment_id,
         is_active=req.is_active,
+        run_mode=req.run_mode,
         next_run_at=next_run,
         project_id=project_id,
         creator_id=current_user.id,
     )
+    await cron_scheduler.refresh(task.id)
 
     return ScheduledTaskResponse(
         id=task.id,
@@ -3218,30 +3229,26 @@ async def create_scheduled_task(
         environment_id=task.environment_id,
         environment_name=env.name,
         is_active=task.is_active,
+        run_mode=task.run_mode,
         last_run_at=task.last_run_at,
         next_run_at=task.next_run_at,
         created_at=task.created_at,
     )
 
 
+def _validate_cron(cron_expr: str):
+    try:
+        CronExpression(cron_expr)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Cron表达式格式错误: {e}")
+
+
 def _calc_next_run(cron_expr: str) -> Optional[datetime]:
-    """简单计算下次执行时间（支持基本的cron格式）"""
+    """计算下次执行时间（本地时间）"""
     try:
-        # 简单实现：解析 minute hour 部分
-        parts = cron_expr.strip().split()
-        if len(parts) < 5:
-            return None
-        minute, hour = parts[0], parts[1]
-        now = datetime.now()
-        if minute.isdigit() and hour.isdigit():
-            target = now.replace(hour=int(hour), minute=int(minute), second=0, microsecond=0)
-            if target <= now:
-                from datetime import timedelta
-                target += timedelta(days=1)
-            return target
-    except Exception:
-        pass
-    return None
+        return CronExpression(cron_expr).next_after(datetime.now())
+    except ValueError:
+        return None
 
 
 @router.get("/{project_id}/scheduled-tasks", response_model=ScheduledTaskListResponse, summary="获取定时任务列表")
@@ -3273,6 +3280,7 @@ async def list_scheduled_tasks(
             environment_id=t.environment_id,
             environment_name=env.name if env else None,
             is_active=t.is_active,
+            run_mode=t.run_mode,
             last_run_at=t.last_run_at,
             next_run_at=t.next_run_at,
             created_at=t.created_at,
@@ -3301,6 +3309,7 @@ async def update_scheduled_task(
     if req.task_type is not None:
         update_data['task_type'] = req.task_type
     if req.cron_expression is not None:
+        _validate_cron(req.cron_expression)
         update_data['cron_expression'] = req.cron_expression
         update_data['next_run_at'] = _calc_next_run(req.cron_expression)
     if req.test_task_id is not None:
@@ -3315,10 +3324,13 @@ async def update_scheduled_task(
         update_data['environment_id'] = req.environment_id
     if req.is_active is not None:
         update_data['is_active'] = req.is_active
+    if req.run_mode is not None:
+        update_data['run_mode'] = req.run_mode
 
     if update_data:
         await task.update_from_dict(update_data)
         await task.save()
+        await cron_scheduler.refresh(task_id)
 
     # 重新获取
     task = await ScheduledTask.get(id=task_id)
@@ -3335,6 +3347,7 @@ async def update_scheduled_task(
         environment_id=task.environment_id,
         environment_name=env.name if env else None,
         is_active=task.is_active,
+        run_mode=task.run_mode,
         last_run_at=task.last_run_at,
         next_run_at=task.next_run_at,
         created_at=task.created_at,
@@ -3353,6 +3366,7 @@ async def delete_scheduled_task(
     if not task:
         raise HTTPException(status_code=404, detail="定时任务不存在")
     await task.delete()
+    await cron_scheduler.refresh(task_id)
     return {"message": "删除成功"}
 
 
@@ -3403,6 +3417,7 @@ async def trigger_task_execution(
         failed_cases=0,
         skipped_cases=0,
         start_time=_now,
+        run_mode=task.run_mode,
     )
 
     # 更新定时任务最后执行时间
@@ -3410,9 +3425,10 @@ async def trigger_task_execution(
     if task.cron_expression:
         task.next_run_at = _calc_next_run(task.cron_expression)
     await task.save()
+    await cron_scheduler.refresh(task.id)
 
-    # 异步执行
-    asyncio.create_task(_execute_task_run(task_run.id, suite_info, task.environment_id, project_id))
+    # 异步执行：启用执行队列时由执行工作进程执行
+    await _submit_task_run(task_run.id, suite_info, task.environment_id, project_id, lane="manual")
 
     return CiTriggerResponse(
         task_run_id=task_run.id,
@@ -3430,11 +3446,13 @@ async def ci_webhook_trigger(
     """CI/CD流水线通过Webhook调用此接口来触发测试执行"""
     project, current_user = project_user
 
+    run_mode = req.run_mode
     test_task = await TestTask.get_or_none(id=req.task_id, project_id=project_id)
     if not test_task:
         scheduled = await ScheduledTask.get_or_none(id=req.task_id, project_id=project_id)
         if scheduled:
             test_task = await TestTask.get_or_none(id=scheduled.test_task_id)
+            run_mode = run_mode or scheduled.run_mode
         if not test_task:
             raise HTTPException(status_code=404, detail="找不到对应的测试任务")
 
@@ -3451,9 +3469,10 @@ async def ci_webhook_trigger(
         failed_cases=0,
         skipped_cases=0,
         start_time=datetime.now(timezone.utc),
+        run_mode=run_mode or 'full',
     )
 
-    asyncio.create_task(_execute_task_run(task_run.id, suite_info, 0, project_id))
+    await _submit_task_run(task_run.id, suite_info, 0, project_id, lane="ci")
 
     return CiTriggerResponse(
         task_run_id=task_run.id,
@@ -3462,149 +3481,161 @@ async def ci_webhook_trigger(
     )
 
 
-async def _execute_task_run(task_run_id: int, suite_info: list, environment_id: int, project_id: int):
-    """异步执行测试任务（Phase 3：并行执行 + Webhook通知）"""
-    from api_case_run.execute import TestExecutor
-
-    total_passed = 0
-    total_failed = 0
-    total_skipped = 0
+async def _submit_task_run(task_run_id: int, suite_info: list, environment_id: int, project_id: int,
+                           lane: str = "manual"):
+    """提交任务执行：启用执行队列时写入队列，否则在当前进程中异步执行"""
+    if QUEUE_ENABLED:
+        await enqueue("task_run", {
+            "task_run_id": task_run_id,
+            "suite_info": suite_info,
+            "environment_id": environment_id,
+            "project_id": project_id,
+        }, lane=lane, project_id=project_id, task_run_id=task_run_id)
+    else:
+        asyncio.create_task(_execute_task_run(task_run_id, suite_info, environment_id, project_id))
 
-    # 获取环境配置
-    env_vars = {}
-    if environment_id:
-        env_configs = await TestEnvironmentConfig.filter(environment_id=environment_id).all()
-        for cfg in env_configs:
-            env_vars[cfg.name] = cfg.value
 
-    # 获取数据库配置
-    db_configs = []
-    if environment_id:
-        env_dbs = await TestEnvironmentDb.filter(environment_id=environment_id).all()
-        for db in env_dbs:
-            try:
-                db_configs.append({
-                    "name": db.name,
-                    "type": db.type,
-                    "config": json.loads(db.config) if isinstance(db.config, str) else db.config
-                })
-            except Exception:
-                pass
-
-    for si in suite_info:
-        suite_id = si["suite_id"]
-        case_ids = si["case_ids"]
-
-        # 创建套件运行记录
-        suite_run = await TestSuiteRun.create(
-            suite_id=suite_id,
-            run_task_id=task_run_id,
-            status='running',
-            total_cases=len(case_ids),
-            start_time=datetime.now(timezone.utc),
-        )
-
-        suite_passed = 0
-        suite_failed = 0
-        suite_skipped = 0
-        suite_error = 0
+async def _execute_task_run(task_run_id: int, suite_info: list, environment_id: int, project_id: int,
+                            resume: bool = False):
+    """
+    异步执行测试任务（Phase 3：并行执行 + Webhook通知）
+    resume 为 True 时表示中断后恢复执行（执行队列租约过期后重新租用），跳过已结束的套件
+    """
+    from api_case_run.execute import AsyncTestExecutor
 
-        # Phase 3: 并行执行用例（最多5个并发）
-        semaphore = asyncio.Semaphore(5)
-        results_lock = asyncio.Lock()
+    # 打开事件频道，订阅者可以实时看到用例执行进度
+    run_event_hub.open(task_run_id)
 
-        async def run_single_case(case_id):
-            nonlocal suite_passed, suite_failed, suite_skipped, suite_error
-            async with semaphore:
-                test_case = await ApiTestCase.get_or_none(id=case_id)
-                if not test_case:
-                    async with results_lock:
-                        suite_skipped += 1
-                    return
+    def publish(event):
+        run_event_hub.publish(task_run_id, event)
 
+    task_run = None
+    try:
+        # 获取环境配置（与测试执行模块一致，包含全局函数）
+        env_vars = {}
+        if environment_id:
+            env_configs = await TestEnvironmentConfig.filter(environment_id=environment_id).all()
+            for cfg in env_configs:
+                env_vars[cfg.name] = cfg.value
+            test_environment = await TestEnvironment.get_or_none(id=environment_id)
+            if test_environment and test_environment.func_global:
+                env_vars['func_global'] = test_environment.func_global
+
+        # 获取数据库配置
+        db_configs = []
+        if environment_id:
+            env_dbs = await TestEnvironmentDb.filter(environment_id=environment_id).all()
+            for db in env_dbs:
                 try:
-                    # 构建用例数据（兼容现有executor格式）
-                    case_data = {
-                        "id": test_case.id,
-                        "name": test_case.name,
-                        "preconditions": test_case.preconditions or [],
-                        "request": test_case.request or {},
-                        "assertions": test_case.assertions or {},
-                    }
-
-                    # 在线程中执行同步的TestExecutor
-                    loop = asyncio.get_event_loop()
-                    executor = TestExecutor(env_vars, db_configs)
-                    result = await loop.run_in_executor(None, executor.execute_test_case, case_data)
-
-                    # 保存用例执行记录
-                    await ApiCaseRun.create(
-                        suite_run_id=suite_run.id,
-                        api_case_id=test_case.id,
-                        case_name=test_case.name,
-                        status=result.status,
-                        error_message=result.error_message,
-                        traceback=result.traceback,
-                        start_time=datetime.fromtimestamp(result.start_time) if result.start_time else None,
-                        end_time=datetime.fromtimestamp(result.end_time) if result.end_time else None,
-                        duration=result.duration,
-                        logs=result.logs if hasattr(result, 'logs') else None,
-                        api_requests_info=result.api_requests_info if hasattr(result, 'api_requests_info') else None,
-                    )
+                    db_configs.append({
+                        "name": db.name,
+                        "type": db.type,
+                        "config": json.loads(db.config) if isinstance(db.config, str) else db.config
+                    })
+                except Exception:
+                    pass
 
-                    async with results_lock:
-                        if result.status == 'success':
-                            suite_passed += 1
-                        elif result.status == 'failed':
-                            suite_failed += 1
-                        elif result.status == 'skip':
-                            suite_skipped += 1
-                        else:
-                            suite_error += 1
-
-                except Exception as e:
-                    await ApiCaseRun.create(
-                        suite_run_id=suite_run.id,
-                        api_case_id=case_id,
-                        case_name=test_case.name if test_case else f"case_{case_id}",
-                        status='error',
-                        error_message=str(e),
-                        traceback=traceback.format_exc(),
-                    )
-                    async with results_lock:
-                        suite_error += 1
-
-        # 并行执行所有用例
-        await asyncio.gather(*[run_single_case(cid) for cid in case_ids])
-
-        # 更新套件运行记录
-        suite_run.status = 'completed'
-        suite_run.passed_cases = suite_passed
-        suite_run.failed_cases = suite_failed
-        suite_run.skipped_cases = suite_skipped
-        suite_run.error_cases = suite_error
-        suite_run.end_time = datetime.now(timezone.utc)
-        if suite_run.start_time:
-            suite_run.duration = (suite_run.end_time - suite_run.start_time).total_seconds()
-        await suite_run.save()
-
-        total_passed += suite_passed
-        total_failed += suite_failed + suite_error
-        total_skipped += suite_skipped
-
-    # 更新任务运行记录
-    task_run = await TestTaskRun.get(id=task_run_id)
-    task_run.status = 'completed'
-    task_run.passed_cases = total_passed
-    task_run.failed_cases = total_failed
-    task_run.skipped_cases = total_skipped
-    task_run.end_time = datetime.now(timezone.utc)
-    if task_run.start_time:
-        task_run.duration = (task_run.end_time - task_run.start_time).total_seconds()
-    await task_run.save()
+        # 构建用例数据（兼容现有executor格式），已删除的用例计为跳过
+        all_case_ids = {case_id for si in suite_info for case_id in si["case_ids"]}
+        test_cases = {c.id: c for c in await ApiTestCase.filter(id__in=all_case_ids)}
+        suites = []
+        for si in suite_info:
+            cases_list = [{
+                "id": test_case.id,
+                "name": test_case.name,
+                "preconditions": test_case.preconditions or [],
+                "request": test_case.request or {},
+                "assertions": test_case.assertions or {},
+            } for test_case in (test_cases.get(case_id) for case_id in si["case_ids"]) if test_case]
+            suites.append({"id": si["suite_id"], "cases_list": cases_list,
+                           "skipped": len(si["case_ids"]) - len(cases_list)})
+
+        # 计算用例指纹；增量执行模式下只执行有变化或上次未通过的用例
+        task_run = await TestTaskRun.get(id=task_run_id)
+        suites, fingerprints = await prepare_task_run(task_run, suites, env_vars, resume)
+
+        publish({"type": "run_started", "total_suites": len(suites),
+                 "total_cases": sum(len(suite["cases_list"]) + suite["skipped"] for suite in suites)})
+        finished_suites = await restore_task_run(task_run_id) if resume else {}
+        # 整个任务共享一个执行器: 连接池按 base_url 复用, 提取的变量在套件之间传递
+        # 用例结果批量写入, 套件/任务的统计数在执行过程中实时更新
+        async with AsyncTestExecutor(env_vars, db_configs, on_event=publish) as executor, \
+                CaseResultSink(task_run_id, fingerprints=fingerprints) as sink:
+            sink.restore(list(finished_suites.values()))
+            for suite_data in suites:
+                suite_id = suite_data["id"]
+                if suite_id in finished_suites:
+                    continue
+                cases_list = suite_data["cases_list"]
+                total_cases = len(cases_list) + suite_data["skipped"]
+
+                # 创建套件运行记录
+                suite_run = await TestSuiteRun.create(
+                    suite_id=suite_id,
+                    run_task_id=task_run_id,
+                    status='running',
+                    total_cases=total_cases,
+                    start_time=datetime.now(timezone.utc),
+                )
+                sink.start_suite(suite_run.id, skipped=suite_data["skipped"])
+
+                # Phase 4: 按用例依赖图调度，存在变量依赖的用例保持顺序，独立分支并发执行
+                suite = await TestSuite.get_or_none(id=suite_id)
+                publish({"type": "suite_started", "suite_id": suite_id, "suite_run_id": suite_run.id,
+                         "name": suite.suite_name if suite else None, "total_cases": total_cases,
+                         "skipped": suite_data["skipped"]})
+                executor.reset_summary()
+                suite_result = await executor.execute_test_suite({
+                    "id": suite_id,
+                    "concurrency": suite.concurrency if suite else None,
+                    "cases_list": cases_list,
+                }, on_result=sink.add)
+                await sink.flush()
+                suite_counts = sink.suite_summary(suite_run.id)
+
+                # 更新套件运行记录
+                suite_run.execution_plan = suite_result.get("plan")
+                suite_run.status = 'completed'
+                suite_run.passed_cases = suite_counts["passed"]
+                suite_run.failed_cases = suite_counts["failed"]
+                suite_run.skipped_cases = suite_counts["skipped"]
+                suite_run.error_cases = suite_counts["error"]
+                suite_run.end_time = datetime.now(timezone.utc)
+                if suite_run.start_time:
+                    suite_run.duration = (suite_run.end_time - suite_run.start_time).total_seconds()
+                await suite_run.save()
+                publish({"type": "suite_finished", "suite_id": suite_id, "suite_run_id": suite_run.id,
+                         "counts": suite_counts})
+
+        # 更新任务运行记录
+        task_counts = sink.task_counts
+        task_run = await TestTaskRun.get(id=task_run_id)
+        task_run.status = 'completed'
+        task_run.passed_cases = task_counts["passed"]
+        task_run.failed_cases = task_counts["failed"] + task_counts["error"]
+        task_run.skipped_cases = task_counts["skipped"]
+        task_run.end_time = datetime.now(timezone.utc)
+        if task_run.start_time:
+            task_run.duration = (task_run.end_time - task_run.start_time).total_seconds()
+        await task_run.save()
+        publish({"type": "run_finished", "status": task_run.status})
+    except Exception as e:
+        # 执行过程中出现异常，任务运行记录标记为失败，同样发送结束事件和Webhook通知
+        traceback.print_exc()
+        task_run = await TestTaskRun.get_or_none(id=task_run_id)
+        if task_run is not None:
+            task_run.status = 'failed'
+            task_run.end_time = datetime.now(timezone.utc)
+            if task_run.start_time:
+                task_run.duration = (task_run.end_time - task_run.start_time).total_seconds()
+            await task_run.save()
+        publish({"type": "run_finished", "status": "failed", "message": str(e)})
+    finally:
+        run_event_hub.close(task_run_id)
 
     # Phase 3: 发送Webhook通知
-    await _send_webhook_notifications(project_id, task_run)
+    if task_run is not None:
+        await _send_webhook_notifications(project_id, task_run)
 
 
 @router.post("/{project_id}/curl-to-interface", summary="cURL导入为接口")
@@ -3828,22 +3859,24 @@ def _build_webhook_message(webhook_type: str, title: str, content: str) -> dict:
 async def _send_webhook_notifications(project_id: int, execution):
     """执行完成后发送Webhook通知"""
     configs = await WebhookConfig.filter(project_id=project_id, is_active=True)
+    # 执行异常中断的任务即使没有失败用例也按失败通知
+    failed = execution.failed_cases > 0 or getattr(execution, "status", None) == 'failed'
 
     for config in configs:
         # 检查触发条件
         should_send = False
         if config.trigger_on == 'always':
             should_send = True
-        elif config.trigger_on == 'on_failure' and execution.failed_cases > 0:
+        elif config.trigger_on == 'on_failure' and failed:
             should_send = True
-        elif config.trigger_on == 'on_success' and execution.failed_cases == 0:
+        elif config.trigger_on == 'on_success' and not failed:
             should_send = True
 
         if not should_send:
             continue
 
         # 构建通知内容
-        status_icon = "✅" if execution.failed_cases == 0 else "❌"
+        status_icon = "✅" if not failed else "❌"
         title = f"{status_icon} 测试执行完成通知"
         content = (
             f"**执行ID**: {execution.id}\n"
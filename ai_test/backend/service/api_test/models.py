@@ -199,6 +199,7 @@ class ScheduledTask(Model):
         description="执行环境"
     )
     is_active = fields.BooleanField(default=True, description="是否启用")
+    run_mode = fields.CharField(max_length=20, default='full', description="执行模式 full=全量 changed=只执行有变化的用例")
     last_run_at = fields.DatetimeField(null=True, description="上次执行时间")
     next_run_at = fields.DatetimeField(null=True, description="下次执行时间")
     created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
@@ -0,0 +1,267 @@
+"""
+接口测试模块 - 定时任务调度器
+随接口服务进程启动, 按 Cron 表达式定时执行 ScheduledTask 关联的测试任务:
+    - 按下次执行时间维护一个最小堆, 只在最早的任务到期时唤醒, 不轮询扫描定时任务表
+    - 定时任务新增/修改/删除后调用 refresh 更新堆; 另每隔一段时间全量重新加载, 同步其它进程的修改
+    - 多个进程同时部署时, 以 next_run_at 作为条件更新领取本次执行, 同一时刻只有一个进程执行
+    - 错过的执行(服务停机等)按 SCHEDULER_MISFIRE_POLICY 处理:
+        run_once: 补执行一次(默认)  skip: 超过宽限时间的不再补执行  run_all: 每个错过的时间点都补执行
+    - 到期任务随机延迟(SCHEDULER_JITTER_SECONDS)后执行, 避免整点集中触发; 同时执行的任务数受 SCHEDULER_MAX_CONCURRENT 限制
+"""
+import asyncio
+import heapq
+import logging
+import os
+import random
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+from service.api_test.models import ScheduledTask
+from service.test_execution.job_queue import QUEUE_ENABLED, enqueue
+from service.test_execution.models import TestTaskRun
+from utils.cron import CronExpression
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") == "1"
+MAX_CONCURRENT = int(os.getenv("SCHEDULER_MAX_CONCURRENT", 2))
+JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", 10))
+MISFIRE_POLICIES = ("run_once", "skip", "run_all")
+MISFIRE_POLICY = os.getenv("SCHEDULER_MISFIRE_POLICY", "run_once")
+# 到期后多久以内执行不算错过(秒)
+MISFIRE_GRACE_SECONDS = int(os.getenv("SCHEDULER_MISFIRE_GRACE", 300))
+# run_all 策略下最多补执行的次数
+MAX_CATCHUP_RUNS = int(os.getenv("SCHEDULER_MAX_CATCHUP", 10))
+# 全量重新加载间隔(秒)
+RELOAD_SECONDS = int(os.getenv("SCHEDULER_RELOAD_SECONDS", 300))
+
+
+def _local(dt: Optional[datetime]) -> Optional[datetime]:
+    """数据库读出的时间统一转换为本地时间(naive), 与 Cron 表达式的计算方式一致"""
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone().replace(tzinfo=None)
+
+
+class CronScheduler:
+    """定时任务调度器"""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT, jitter: float = JITTER_SECONDS,
+                 misfire_policy: str = MISFIRE_POLICY, misfire_grace: int = MISFIRE_GRACE_SECONDS):
+        if misfire_policy not in MISFIRE_POLICIES:
+            logger.warning(f"未知的错过执行处理策略: {misfire_policy}，使用 run_once")
+            misfire_policy = "run_once"
+        self.max_concurrent = max_concurrent
+        self.jitter = jitter
+        self.misfire_policy = misfire_policy
+        self.misfire_grace = misfire_grace
+        # (下次执行时间, 定时任务ID, 版本号); 任务刷新后版本号加一, 旧的堆元素出堆时丢弃
+        self._heap: List[Tuple[datetime, int, int]] = []
+        self._versions: Dict[int, int] = {}
+        self._crons: Dict[int, CronExpression] = {}
+        # 本进程中正在执行的定时任务ID
+        self._running: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional[asyncio.Task] = None
+
+    @property
+    def started(self) -> bool:
+        return self._loop_task is not None
+
+    async def start(self):
+        if self.started:
+            return
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._wakeup = asyncio.Event()
+        await self.reload()
+        self._loop_task = asyncio.create_task(self._run())
+        logger.info(f"定时任务调度器启动，已加载{len(self._versions)}个定时任务")
+
+    async def stop(self):
+        """停止调度, 正在执行的任务一并取消"""
+        if self._loop_task is None:
+            return
+        self._loop_task.cancel()
+        tasks = [self._loop_task, *self._tasks]
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._tasks.clear()
+        logger.info("定时任务调度器已停止")
+
+    async def reload(self):
+        """全量重新加载定时任务"""
+        self._heap.clear()
+        self._crons.clear()
+        for task_id in list(self._versions):
+            self._versions[task_id] += 1
+        tasks = await ScheduledTask.filter(task_type='cron', is_active=True, cron_expression__isnull=False)
+        for task in tasks:
+            await self._schedule(task)
+
+    async def refresh(self, task_id: int):
+        """定时任务新增/修改/删除后更新调度"""
+        if not self.started:
+            return
+        self._versions[task_id] = self._versions.get(task_id, 0) + 1
+        self._crons.pop(task_id, None)
+        task = await ScheduledTask.get_or_none(id=task_id)
+        if task is not None:
+            await self._schedule(task)
+        self._wakeup.set()
+
+    def next_due(self) -> Optional[datetime]:
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+
+    async def _schedule(self, task: ScheduledTask):
+        """计算任务的下次执行时间并入堆"""
+        if task.task_type != 'cron' or not task.is_active or not task.cron_expression:
+            return
+        try:
+            cron = CronExpression(task.cron_expression)
+        except ValueError as e:
+            logger.warning(f"定时任务{task.id}的Cron表达式无效，跳过调度: {e}")
+            return
+        due = _local(task.next_run_at)
+        if due is None:
+            # 未计算过下次执行时间(如由其它类型修改为 cron)
+            due = cron.next_after(datetime.now())
+            await ScheduledTask.filter(id=task.id, next_run_at__isnull=True).update(next_run_at=due.astimezone())
+        self._crons[task.id] = cron
+        version = self._versions.setdefault(task.id, 0)
+        heapq.heappush(self._heap, (due, task.id, version))
+
+    def _discard_stale(self):
+        while self._heap and self._heap[0][2] != self._versions.get(self._heap[0][1]):
+            heapq.heappop(self._heap)
+
+    async def _run(self):
+        last_reload = asyncio.get_running_loop().time()
+        while True:
+            due = self.next_due()
+            timeout = RELOAD_SECONDS
+            if due is not None:
+                timeout = min(timeout, max(0.0, (due - datetime.now()).total_seconds()))
+            self._wakeup.clear()
+            waiter = asyncio.create_task(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=timeout)
+            finally:
+                waiter.cancel()
+            try:
+                if asyncio.get_running_loop().time() - last_reload >= RELOAD_SECONDS:
+                    await self.reload()
+                    last_reload = asyncio.get_running_loop().time()
+                now = datetime.now()
+                while self.next_due() is not None and self._heap[0][0] <= now:
+                    _, task_id, _ = heapq.heappop(self._heap)
+                    # 出堆后版本号加一, 领取结果重新入堆前不会再次触发
+                    self._versions[task_id] += 1
+                    await self._fire(task_id)
+            except Exception as e:
+                logger.error(f"定时任务调度失败: {e}")
+
+    async def _fire(self, task_id: int):
+        """领取到期任务的本次执行; 领取失败说明已被其它进程执行"""
+        task = await ScheduledTask.get_or_none(id=task_id)
+        cron = self._crons.get(task_id)
+        if task is None or cron is None or not task.is_active or task.task_type != 'cron':
+            return
+        due = _local(task.next_run_at)
+        now = datetime.now()
+        if due is not None and due > now:
+            # 其它进程已执行并更新了下次执行时间
+            await self._schedule(task)
+            return
+        runs = self._count_runs(cron, due, now)
+        new_next = cron.next_after(now)
+        update = {"next_run_at": new_next.astimezone()}
+        if runs:
+            update["last_run_at"] = datetime.now(timezone.utc)
+        query = ScheduledTask.filter(id=task_id)
+        query = query.filter(next_run_at=task.next_run_at) if task.next_run_at is not None \
+            else query.filter(next_run_at__isnull=True)
+        claimed = await query.update(**update)
+        if claimed:
+            heapq.heappush(self._heap, (new_next, task_id, self._versions[task_id]))
+            if runs:
+                self._spawn(self._dispatch(task, runs))
+            else:
+                logger.info(f"定时任务{task_id}({task.name})错过执行时间{due}，按策略跳过")
+        else:
+            task = await ScheduledTask.get_or_none(id=task_id)
+            if task is not None:
+                await self._schedule(task)
+
+    def _count_runs(self, cron: CronExpression, due: Optional[datetime], now: datetime) -> int:
+        """按错过执行处理策略计算本次需要执行的次数"""
+        if due is None or (now - due).total_seconds() <= self.misfire_grace:
+            return 1
+        if self.misfire_policy == "skip":
+            return 0
+        if self.misfire_policy == "run_all":
+            missed = 1
+            for _ in cron.iter_between(due, now):
+                missed += 1
+                if missed >= MAX_CATCHUP_RUNS:
+                    break
+            return missed
+        return 1
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, task: ScheduledTask, runs: int):
+        if self.jitter > 0:
+            await asyncio.sleep(random.uniform(0, self.jitter))
+        for _ in range(runs):
+            if task.id in self._running:
+                logger.warning(f"定时任务{task.id}({task.name})上次执行尚未结束，跳过本次执行")
+                return
+            async with self._semaphore:
+                self._running.add(task.id)
+                try:
+                    await self._execute(task)
+                except Exception as e:
+                    logger.error(f"定时任务{task.id}({task.name})执行失败: {e}")
+                finally:
+                    self._running.discard(task.id)
+
+    async def _execute(self, task: ScheduledTask):
+        """创建任务执行记录并执行; 启用执行队列时写入队列, 由执行工作进程执行"""
+        from service.api_test.api import _collect_task_cases, _execute_task_run
+
+        all_case_ids, suite_info = await _collect_task_cases(task.test_task_id)
+        if not all_case_ids:
+            logger.warning(f"定时任务{task.id}({task.name})关联的测试任务没有用例，跳过执行")
+            return
+        task_run = await TestTaskRun.create(
+            task_id=task.test_task_id,
+            status='running',
+            total_suites=len(suite_info),
+            total_cases=len(all_case_ids),
+            passed_cases=0,
+            failed_cases=0,
+            skipped_cases=0,
+            start_time=datetime.now(timezone.utc),
+            run_mode=task.run_mode,
+        )
+        logger.info(f"定时任务{task.id}({task.name})开始执行，任务运行记录: {task_run.id}")
+        if QUEUE_ENABLED:
+            await enqueue("task_run", {
+                "task_run_id": task_run.id,
+                "suite_info": suite_info,
+                "environment_id": task.environment_id,
+                "project_id": task.project_id,
+            }, lane="scheduled", project_id=task.project_id, task_run_id=task_run.id)
+        else:
+            await _execute_task_run(task_run.id, suite_info, task.environment_id, task.project_id)
+
+
+# 进程内共享的调度器实例
+cron_scheduler = CronScheduler()
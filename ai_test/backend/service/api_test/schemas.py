@@ -763,6 +763,7 @@ class ScheduledTaskCreateRequest(BaseModel):
     test_task_id: int = Field(..., description="关联的测试任务/计划ID")
     environment_id: int = Field(..., description="执行环境ID")
     is_active: bool = Field(True, description="是否启用")
+    run_mode: str = Field('full', pattern="^(full|changed)$", description="执行模式 full=全量 changed=只执行有变化的用例")
 
     class Config:
         from_attributes = True
@@ -779,6 +780,7 @@ class ScheduledTaskResponse(BaseModel):
     environment_id: int = Field(..., description="执行环境ID")
     environment_name: Optional[str] = Field(None, description="环境名称")
     is_active: bool = Field(..., description="是否启用")
+    run_mode: str = Field('full', description="执行模式")
     last_run_at: Optional[datetime] = Field(None, description="上次执行时间")
     next_run_at: Optional[datetime] = Field(None, description="下次执行时间")
     created_at: datetime = Field(..., description="创建时间")
@@ -795,6 +797,7 @@ class ScheduledTaskUpdateRequest(BaseModel):
     test_task_id: Optional[int] = Field(None, description="关联测试任务ID")
     environment_id: Optional[int] = Field(None, description="执行环境ID")
     is_active: Optional[bool] = Field(None, description="是否启用")
+    run_mode: Optional[str] = Field(None, pattern="^(full|changed)$", description="执行模式 full/changed")
 
     class Config:
         from_attributes = True
@@ -813,6 +816,8 @@ class CiTriggerRequest(BaseModel):
     """CI触发执行请求"""
     task_id: int = Field(..., description="定时任务ID或测试任务ID")
     trigger_type: str = Field('scheduled', description="触发来源 scheduled/ci_webhook/manual")
+    run_mode: Optional[str] = Field(None, pattern="^(full|changed)$",
+                                    description="执行模式 full/changed，不传时使用定时任务的配置（默认全量）")
 
     class Config:
         from_attributes = True
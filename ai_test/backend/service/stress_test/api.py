@@ -2,12 +2,14 @@
 压力测试模块 - API路由
 """
 import asyncio
+import hmac
 import json
+import os
 import time
 import logging
 from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Header, Request
 from fastapi.responses import StreamingResponse
 from service.stress_test.models import (
     StressTestScenario, StressTestTask, StressTestResult,
@@ -18,11 +20,15 @@ from service.stress_test.schemas import (
     AIGenerateScenarioRequest, TaskCreate, TaskResponse,
     ResultResponse, MetricResponse,
     BaselineCreate, BaselineUpdate, BaselineResponse,
-    BaselineCompareRequest, AIRecommendConfigRequest
+    BaselineCompareRequest, AIRecommendConfigRequest, AgentRegisterRequest
 )
+from service.stress_test.metric_writer import metric_writer
+from service.stress_test.metric_hub import metric_hub
 from utils.auth import get_current_user
 from service.user.models import User
 from utils.stress_engine import StressEngine
+from utils.stress_samples import task_sample_dir, remove_task_samples, analyze_samples
+from config.settings import STRESS_SAMPLE_PATH
 from utils.stress_ai_analyzer import (
     ai_generate_scenario, ai_recommend_config,
     ai_analyze_report, ai_detect_anomaly, ai_compare_baselines
@@ -34,6 +40,22 @@ router = APIRouter(prefix="/stress-test", tags=["压力测试"])
 # 存储正在运行的压测任务
 _running_tasks = {}
 
+# 在线的分布式压测节点 {agent_id: {host, port, cpu_count, processes, busy, last_seen}}
+_agents = {}
+# 已分配给执行中任务的节点ID; 节点心跳中的 busy 会被下一次心跳覆盖, 分配状态单独维护
+_reserved_agents = set()
+# 超过该时间未收到心跳的节点视为离线(秒)
+AGENT_EXPIRE_SECONDS = 30
+
+
+def _live_agents():
+    """清理过期节点并返回在线节点列表(最近心跳优先)"""
+    now = time.time()
+    for agent_id in [k for k, a in _agents.items() if now - a["last_seen"] > AGENT_EXPIRE_SECONDS]:
+        _agents.pop(agent_id, None)
+        _reserved_agents.discard(agent_id)
+    return sorted(_agents.values(), key=lambda a: a["last_seen"], reverse=True)
+
 
 # ======================== 测试场景 ========================
 
@@ -58,9 +80,12 @@ async def list_scenarios(
                 "id": s.id, "project_id": s.project_id, "name": s.name,
                 "description": s.description, "scenario_type": s.scenario_type,
                 "target_apis": s.target_apis, "think_time": s.think_time,
+                "think_time_distribution": s.think_time_distribution,
+                "think_time_spread": s.think_time_spread, "pacing": s.pacing,
                 "timeout": s.timeout, "ai_generated": s.ai_generated,
                 "parameter_data": s.parameter_data,
                 "parameter_strategy": s.parameter_strategy,
+                "transport_profile": s.transport_profile,
                 "creator_id": s.creator_id,
                 "created_at": s.created_at.isoformat(),
                 "updated_at": s.updated_at.isoformat(),
@@ -81,10 +106,13 @@ async def get_scenario(scenario_id: int, current_user: User = Depends(get_curren
         "id": s.id, "project_id": s.project_id, "name": s.name,
         "description": s.description, "scenario_type": s.scenario_type,
         "target_apis": s.target_apis, "think_time": s.think_time,
+        "think_time_distribution": s.think_time_distribution,
+        "think_time_spread": s.think_time_spread, "pacing": s.pacing,
         "timeout": s.timeout, "ai_generated": s.ai_generated,
         "ai_prompt": s.ai_prompt,
         "parameter_data": s.parameter_data,
         "parameter_strategy": s.parameter_strategy,
+        "transport_profile": s.transport_profile,
         "creator_id": s.creator_id,
         "created_at": s.created_at.isoformat(),
         "updated_at": s.updated_at.isoformat(),
@@ -105,9 +133,13 @@ async def create_scenario(
         scenario_type=data.scenario_type,
         target_apis=[api.dict() for api in data.target_apis],
         think_time=data.think_time,
+        think_time_distribution=data.think_time_distribution,
+        think_time_spread=data.think_time_spread,
+        pacing=data.pacing,
         timeout=data.timeout,
         parameter_data=data.parameter_data,
         parameter_strategy=data.parameter_strategy,
+        transport_profile=data.transport_profile.dict() if data.transport_profile else None,
         creator_id=current_user.id,
     )
     return {"id": scenario.id, "message": "场景创建成功"}
@@ -128,6 +160,8 @@ async def update_scenario(
         update_data["target_apis"] = [
             api.dict() if hasattr(api, "dict") else api for api in update_data["target_apis"]
         ]
+    if update_data.get("transport_profile"):
+        update_data["transport_profile"] = data.transport_profile.dict()
     await StressTestScenario.filter(id=scenario_id).update(**update_data)
     return {"message": "场景更新成功"}
 
@@ -242,6 +276,13 @@ async def list_tasks(
             "ramp_up_time": t.ramp_up_time,
             "ramp_up_steps": t.ramp_up_steps,
             "duration": t.duration, "target_rps": t.target_rps,
+            "arrival_distribution": t.arrival_distribution,
+            "processes": t.processes,
+            "agent_count": t.agent_count,
+            "record_samples": t.record_samples,
+            "trace_phases": t.trace_phases,
+            "stages": t.stages,
+            "capacity_config": t.capacity_config,
             "status": t.status,
             "started_at": t.started_at.isoformat() if t.started_at else None,
             "finished_at": t.finished_at.isoformat() if t.finished_at else None,
@@ -262,6 +303,18 @@ async def create_task(
     scenario = await StressTestScenario.get_or_none(id=data.scenario_id)
     if not scenario:
         raise HTTPException(status_code=404, detail="场景不存在")
+    if data.load_type == "arrival_rate" and data.target_rps <= 0:
+        raise HTTPException(status_code=400, detail="固定到达率模式需要设置目标RPS")
+    if data.load_type == "capacity_search" and data.target_rps <= 0:
+        raise HTTPException(status_code=400, detail="容量探测模式需要设置目标RPS(探测上限)")
+    if data.load_type == "staged":
+        stages = data.stages or []
+        if not stages:
+            raise HTTPException(status_code=400, detail="阶段编排模式需要设置阶段列表")
+        keys = {"target_users" if "target_users" in st else "target_rps" for st in stages}
+        if len(keys) > 1 or any(not st.get("duration") or st["duration"] <= 0 for st in stages) \
+                or any(("target_users" in st) == ("target_rps" in st) for st in stages):
+            raise HTTPException(status_code=400, detail="每个阶段需设置 duration(>0) 以及 target_users 或 target_rps 其一, 且不能混用")
     task = await StressTestTask.create(
         project_id=project_id,
         scenario_id=data.scenario_id,
@@ -272,6 +325,13 @@ async def create_task(
         ramp_up_steps=data.ramp_up_steps,
         duration=data.duration,
         target_rps=data.target_rps,
+        arrival_distribution=data.arrival_distribution,
+        processes=data.processes,
+        agent_count=data.agent_count,
+        record_samples=data.record_samples,
+        trace_phases=data.trace_phases,
+        stages=data.stages,
+        capacity_config=data.capacity_config,
         creator_id=current_user.id,
     )
     return {"id": task.id, "message": "任务创建成功"}
@@ -290,6 +350,37 @@ async def execute_task(task_id: int, current_user: User = Depends(get_current_us
     if not scenario:
         raise HTTPException(status_code=404, detail="关联场景不存在")
 
+    # 容量探测: SLO 阈值取自项目当前生效的性能基线
+    slo_thresholds = None
+    if task.load_type == "capacity_search":
+        baseline = await PerformanceBaseline.filter(
+            project_id=task.project_id, is_active=True
+        ).first()
+        if not baseline or not baseline.thresholds:
+            raise HTTPException(status_code=400, detail="容量探测需要项目存在生效的性能基线阈值")
+        slo_thresholds = baseline.thresholds
+
+    # 分布式执行: 选取空闲的在线节点(容量探测在本机执行)
+    agent_addresses = []
+    reserved = []
+    if task.agent_count > 0 and task.load_type != "capacity_search":
+        idle_agents = [a for a in _live_agents() if not a["busy"] and a["agent_id"] not in _reserved_agents]
+        if len(idle_agents) < task.agent_count:
+            raise HTTPException(
+                status_code=400,
+                detail=f"可用压测节点不足: 需要 {task.agent_count} 个, 当前空闲 {len(idle_agents)} 个"
+            )
+        for agent in idle_agents[:task.agent_count]:
+            reserved.append(agent["agent_id"])
+            agent_addresses.append(f"{agent['host']}:{agent['port']}")
+        _reserved_agents.update(reserved)
+
+    # 原始样本: 每次执行覆盖上一次的样本文件
+    sample_dir = None
+    if task.record_samples:
+        remove_task_samples(STRESS_SAMPLE_PATH, task_id)
+        sample_dir = task_sample_dir(STRESS_SAMPLE_PATH, task_id)
+
     async def event_stream():
         # 更新状态
         await StressTestTask.filter(id=task_id).update(
@@ -298,23 +389,30 @@ async def execute_task(task_id: int, current_user: User = Depends(get_current_us
         yield f"data: {json.dumps({'type': 'status', 'status': 'running', 'message': '压测开始'})}\n\n"
 
         metric_queue = asyncio.Queue()
+        metric_hub.open(task_id)
 
         async def on_metric(snapshot, is_anomaly, anomaly_reason):
-            await metric_queue.put({
-                "type": "metric",
-                "data": {
-                    "timestamp": snapshot.timestamp,
-                    "current_users": snapshot.current_users,
-                    "rps": snapshot.requests_per_second,
-                    "avg_rt": snapshot.avg_response_time,
-                    "error_count": snapshot.error_count,
-                    "active_connections": snapshot.active_connections,
-                    "is_anomaly": is_anomaly,
-                    "anomaly_reason": anomaly_reason,
-                }
-            })
-            # 保存到数据库
-            await StressTestMetric.create(
+            data = {
+                "timestamp": snapshot.timestamp,
+                "current_users": snapshot.current_users,
+                "rps": snapshot.requests_per_second,
+                "avg_rt": snapshot.avg_response_time,
+                "error_count": snapshot.error_count,
+                "active_connections": snapshot.active_connections,
+                "p95_rt": snapshot.p95_response_time,
+                "p99_rt": snapshot.p99_response_time,
+                "is_anomaly": is_anomaly,
+                "anomaly_reason": anomaly_reason,
+            }
+            if snapshot.phases:
+                data["phases"] = snapshot.phases
+            if snapshot.stage:
+                data["stage"] = snapshot.stage
+            await metric_queue.put({"type": "metric", "data": data})
+            # 推送给 /metrics/{task_id}/stream 的订阅者
+            metric_hub.publish(task_id, data)
+            # 交给后台写入器批量入库, 不在采集回调中等待数据库
+            metric_writer.put(StressTestMetric(
                 task_id=task_id,
                 timestamp=snapshot.timestamp,
                 current_users=snapshot.current_users,
@@ -322,22 +420,38 @@ async def execute_task(task_id: int, current_user: User = Depends(get_current_us
                 avg_response_time=snapshot.avg_response_time,
                 error_count=snapshot.error_count,
                 active_connections=snapshot.active_connections,
+                p95_response_time=snapshot.p95_response_time,
+                p99_response_time=snapshot.p99_response_time,
                 is_anomaly=is_anomaly,
                 anomaly_reason=anomaly_reason if is_anomaly else None,
-            )
+                stage=snapshot.stage["index"] if snapshot.stage else None,
+            ))
 
         engine = StressEngine(
             target_apis=scenario.target_apis,
+            scenario_type=scenario.scenario_type,
             concurrency=task.concurrency,
             duration=task.duration,
             load_type=task.load_type,
             ramp_up_time=task.ramp_up_time,
             ramp_up_steps=task.ramp_up_steps,
             target_rps=task.target_rps,
+            arrival_distribution=task.arrival_distribution,
             think_time=scenario.think_time,
+            think_time_distribution=scenario.think_time_distribution,
+            think_time_spread=scenario.think_time_spread,
+            pacing=scenario.pacing,
             timeout=scenario.timeout,
             parameter_data=scenario.parameter_data,
             parameter_strategy=scenario.parameter_strategy,
+            processes=task.processes,
+            agents=agent_addresses,
+            sample_dir=sample_dir,
+            capacity_config=task.capacity_config,
+            slo_thresholds=slo_thresholds,
+            transport_profile=scenario.transport_profile,
+            trace_phases=task.trace_phases,
+            stages=task.stages,
             on_metric=on_metric,
         )
         _running_tasks[task_id] = engine
@@ -355,6 +469,8 @@ async def execute_task(task_id: int, current_user: User = Depends(get_current_us
 
             # 获取最终报告
             report = engine_task.result()
+            # 确保本次压测的秒级指标全部入库
+            await metric_writer.flush()
 
             # 保存结果
             result = await StressTestResult.create(
@@ -372,6 +488,12 @@ async def execute_task(task_id: int, current_user: User = Depends(get_current_us
                 p99_response_time=report.p99_response_time,
                 tps=report.tps,
                 throughput=report.throughput,
+                dropped_requests=report.dropped_requests,
+                late_requests=report.late_requests,
+                capacity_curve=report.capacity_curve or None,
+                saturation_point=report.saturation_point,
+                transport_stats=report.transport,
+                phase_breakdown=report.phase_breakdown or None,
                 api_details=report.api_details,
                 error_distribution=report.error_distribution,
             )
@@ -384,14 +506,24 @@ async def execute_task(task_id: int, current_user: User = Depends(get_current_us
 
         except Exception as e:
             logger.error(f"压测执行失败: {e}")
+            await metric_writer.flush()
             await StressTestTask.filter(id=task_id).update(
                 status="failed", error_message=str(e), finished_at=datetime.now()
             )
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)}, ensure_ascii=False)}\n\n"
         finally:
             _running_tasks.pop(task_id, None)
+            metric_hub.close(task_id)
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+    async def reserved_stream():
+        # 压测结束(包括启动前出错、客户端断开)后释放分配的节点
+        try:
+            async for chunk in event_stream():
+                yield chunk
+        finally:
+            _reserved_agents.difference_update(reserved)
+
+    return StreamingResponse(reserved_stream(), media_type="text/event-stream")
 
 
 @router.post("/tasks/{task_id}/stop")
@@ -415,6 +547,7 @@ async def delete_task(task_id: int, current_user: User = Depends(get_current_use
     deleted = await StressTestTask.filter(id=task_id).delete()
     if not deleted:
         raise HTTPException(status_code=404, detail="任务不存在")
+    remove_task_samples(STRESS_SAMPLE_PATH, task_id)
     return {"message": "任务删除成功"}
 
 
@@ -441,6 +574,41 @@ async def ai_recommend_config_api(
     return {"recommendation": result}
 
 
+# ======================== 分布式压测节点 ========================
+
+@router.post("/agents/register")
+async def register_agent(data: AgentRegisterRequest, request: Request, x_agent_token: Optional[str] = Header(None)):
+    """
+    压测节点注册/心跳（由 utils/stress_agent 定期调用）
+    后端会连接节点并下发包含请求头/令牌的场景配置, 因此必须配置 STRESS_AGENT_TOKEN 才允许注册,
+    且只连接请求来源地址, 不使用请求体中的地址
+    """
+    expected_token = os.getenv("STRESS_AGENT_TOKEN")
+    if not expected_token:
+        raise HTTPException(status_code=403, detail="后端未配置 STRESS_AGENT_TOKEN，不允许注册压测节点")
+    if not hmac.compare_digest(x_agent_token or "", expected_token):
+        raise HTTPException(status_code=401, detail="节点令牌无效")
+    if request.client is None:
+        raise HTTPException(status_code=400, detail="无法获取节点地址")
+    _agents[data.agent_id] = {
+        "agent_id": data.agent_id,
+        "host": request.client.host,
+        "advertise_host": data.host,
+        "port": data.port,
+        "cpu_count": data.cpu_count,
+        "processes": data.processes,
+        "busy": data.busy,
+        "last_seen": time.time(),
+    }
+    return {"message": "注册成功", "expire_seconds": AGENT_EXPIRE_SECONDS}
+
+
+@router.get("/agents")
+async def list_agents(current_user: User = Depends(get_current_user)):
+    """获取在线压测节点"""
+    return {"items": _live_agents()}
+
+
 # ======================== 性能报告 ========================
 
 @router.get("/results/{task_id}")
@@ -471,6 +639,12 @@ async def get_result(task_id: int, current_user: User = Depends(get_current_user
         "p99_response_time": result.p99_response_time,
         "tps": result.tps,
         "throughput": result.throughput,
+        "dropped_requests": result.dropped_requests,
+        "late_requests": result.late_requests,
+        "capacity_curve": result.capacity_curve,
+        "saturation_point": result.saturation_point,
+        "transport_stats": result.transport_stats,
+        "phase_breakdown": result.phase_breakdown,
         "api_details": result.api_details,
         "error_distribution": result.error_distribution,
         "ai_analysis": result.ai_analysis,
@@ -558,41 +732,87 @@ async def get_metrics(
                 "avg_rt": m.avg_response_time,
                 "error_count": m.error_count,
                 "active_connections": m.active_connections,
+                "p95_rt": m.p95_response_time,
+                "p99_rt": m.p99_response_time,
                 "is_anomaly": m.is_anomaly,
                 "anomaly_reason": m.anomaly_reason,
+                "stage": m.stage,
             }
             for m in metrics
         ]
     }
 
 
+@router.get("/metrics/writer/status")
+async def metric_writer_status(current_user: User = Depends(get_current_user)):
+    """指标批量写入器状态(队列深度、写入/丢弃数、最近一次批量写入耗时)"""
+    return metric_writer.stats()
+
+
 @router.get("/metrics/{task_id}/stream")
-async def stream_metrics(task_id: int, current_user: User = Depends(get_current_user)):
-    """SSE实时推送指标"""
-    task = await StressTestTask.get_or_none(id=task_id)
-    if not task or task.status != "running":
+async def stream_metrics(
+    task_id: int,
+    replay: int = Query(300, ge=0, le=3600, description="加入时回放的历史指标条数"),
+    current_user: User = Depends(get_current_user)
+):
+    """SSE实时推送指标(内存广播, 仅在加入时从数据库回放历史)"""
+    # 先订阅再回放, 保证回放与实时推送之间不丢数据
+    sub = metric_hub.subscribe(task_id)
+    if sub is None:
         raise HTTPException(status_code=400, detail="任务未在运行")
 
     async def event_stream():
-        last_id = 0
-        while True:
-            metrics = await StressTestMetric.filter(
-                task_id=task_id, id__gt=last_id
-            ).order_by("id").limit(10)
-
-            for m in metrics:
-                last_id = m.id
-                yield f"data: {json.dumps({'timestamp': m.timestamp, 'current_users': m.current_users, 'rps': m.requests_per_second, 'avg_rt': m.avg_response_time, 'error_count': m.error_count, 'is_anomaly': m.is_anomaly, 'anomaly_reason': m.anomaly_reason})}\n\n"
+        try:
+            last_timestamp = None
+            if replay:
+                # 写入器中尚未入库的指标先落库, 回放才完整
+                await metric_writer.flush()
+                metrics = await StressTestMetric.filter(task_id=task_id).order_by("-timestamp").limit(replay)
+                for m in reversed(metrics):
+                    last_timestamp = m.timestamp
+                    yield f"data: {json.dumps({'timestamp': m.timestamp, 'current_users': m.current_users, 'rps': m.requests_per_second, 'avg_rt': m.avg_response_time, 'error_count': m.error_count, 'active_connections': m.active_connections, 'p95_rt': m.p95_response_time, 'p99_rt': m.p99_response_time, 'is_anomaly': m.is_anomaly, 'anomaly_reason': m.anomaly_reason, 'stage': m.stage, 'replay': True})}\n\n"
+
+            while True:
+                items = await sub.get(timeout=5)
+                for item in items:
+                    # 跳过回放期间已推送过的快照
+                    if last_timestamp is not None and item["timestamp"] <= last_timestamp:
+                        continue
+                    yield f"data: {json.dumps(item, ensure_ascii=False)}\n\n"
+                if sub.closed and not items:
+                    yield f"data: {json.dumps({'type': 'ended'})}\n\n"
+                    break
+                if not items:
+                    yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+        finally:
+            metric_hub.unsubscribe(task_id, sub)
 
-            # 检查任务是否还在运行
-            task_check = await StressTestTask.get_or_none(id=task_id)
-            if not task_check or task_check.status != "running":
-                yield f"data: {json.dumps({'type': 'ended'})}\n\n"
-                break
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
-            await asyncio.sleep(1)
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+@router.get("/samples/{task_id}/analysis")
+async def analyze_task_samples(
+    task_id: int,
+    start: Optional[float] = Query(None, ge=0, description="起始时间(相对压测开始的秒数)"),
+    end: Optional[float] = Query(None, ge=0, description="结束时间(相对压测开始的秒数)"),
+    bucket: float = Query(1.0, ge=0.1, le=3600, description="时间分桶宽度(秒)"),
+    percentiles: str = Query("50,90,95,99", description="百分位列表, 逗号分隔"),
+    current_user: User = Depends(get_current_user)
+):
+    """基于原始样本的事后切片分析: 任意时间段的百分位、延迟热力图、错误时间线"""
+    try:
+        ps = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="百分位格式错误")
+    if any(p < 0 or p > 100 for p in ps):
+        raise HTTPException(status_code=400, detail="百分位需在0~100之间")
+    # 向量化计算在线程中执行, 避免阻塞事件循环
+    result = await asyncio.to_thread(
+        analyze_samples, task_sample_dir(STRESS_SAMPLE_PATH, task_id), start, end, bucket, ps
+    )
+    if result is None:
+        raise HTTPException(status_code=404, detail="该任务未记录原始样本")
+    return result
 
 
 # ======================== 性能基线 ========================
@@ -0,0 +1,50 @@
+"""
+压力测试模块 - 实时指标广播
+运行中的压测任务通过 on_metric 把秒级快照发布到内存中的任务频道,
+任意数量的 SSE 订阅者直接从内存接收, 不再轮询数据库
+"""
+from typing import Dict, Optional, Set
+from utils.subscription import Subscription
+
+
+class MetricHub:
+    """按任务划分的广播频道, 频道在压测开始时打开、结束时关闭"""
+
+    def __init__(self):
+        self._channels: Dict[int, Set[Subscription]] = {}
+
+    def open(self, task_id: int):
+        self._channels.setdefault(task_id, set())
+
+    def is_open(self, task_id: int) -> bool:
+        return task_id in self._channels
+
+    def publish(self, task_id: int, item: Dict):
+        for sub in self._channels.get(task_id, ()):
+            sub.push(item)
+
+    def subscribe(self, task_id: int, maxsize: int = 120) -> Optional[Subscription]:
+        """频道未打开(任务未在本进程运行)时返回 None"""
+        subscribers = self._channels.get(task_id)
+        if subscribers is None:
+            return None
+        sub = Subscription(maxsize)
+        subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, task_id: int, sub: Subscription):
+        subscribers = self._channels.get(task_id)
+        if subscribers is not None:
+            subscribers.discard(sub)
+
+    def close(self, task_id: int):
+        """关闭频道并通知全部订阅者压测已结束"""
+        for sub in self._channels.pop(task_id, ()):
+            sub.close()
+
+    def subscriber_count(self, task_id: int) -> int:
+        return len(self._channels.get(task_id, ()))
+
+
+# 进程内共享的广播实例
+metric_hub = MetricHub()
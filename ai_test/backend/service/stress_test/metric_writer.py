@@ -0,0 +1,131 @@
+"""
+压力测试模块 - 实时指标批量写入
+所有运行中任务的秒级快照先进入内存队列, 后台协程按数量或时间阈值批量 INSERT,
+避免 on_metric 回调中逐条 await 数据库拖慢指标采集
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Optional
+from service.stress_test.models import StressTestMetric
+
+logger = logging.getLogger(__name__)
+
+
+class MetricWriter:
+    """压测指标批量写入器"""
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 2.0, max_queue: int = 20000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: Deque[StressTestMetric] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        # 统计信息
+        self._written = 0
+        self._dropped = 0
+        self._failed_batches = 0
+        self._max_depth = 0
+        self._last_flush_at: Optional[float] = None
+        self._last_flush_ms = 0.0
+        self._last_batch_size = 0
+
+    def put(self, metric: StressTestMetric):
+        """入队(不等待数据库), 队列满时丢弃最旧的记录"""
+        self._ensure_started()
+        if len(self._queue) >= self.max_queue:
+            self._queue.popleft()
+            self._dropped += 1
+        self._queue.append(metric)
+        depth = len(self._queue)
+        if depth > self._max_depth:
+            self._max_depth = depth
+        if depth >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        """立即写出队列中全部记录(任务完成/停止时调用)"""
+        self._ensure_started()
+        while self._queue:
+            if not await self._flush_batch():
+                break
+
+    async def close(self):
+        """应用关闭时写出剩余记录并停止后台协程"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while self._queue:
+            if not await self._flush_batch():
+                break
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": len(self._queue),
+            "max_queue_depth": self._max_depth,
+            "max_queue": self.max_queue,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "written": self._written,
+            "dropped": self._dropped,
+            "failed_batches": self._failed_batches,
+            "last_flush_at": self._last_flush_at,
+            "last_flush_ms": round(self._last_flush_ms, 2),
+            "last_batch_size": self._last_batch_size,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue:
+                if not await self._flush_batch():
+                    break
+                if len(self._queue) < self.batch_size:
+                    break
+
+    async def _flush_batch(self) -> bool:
+        """写出一批记录, 失败时放回队首等待下次重试"""
+        async with self._flush_lock:
+            if not self._queue:
+                return True
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            start = time.perf_counter()
+            try:
+                await StressTestMetric.bulk_create(batch)
+            except Exception as e:
+                self._failed_batches += 1
+                logger.error(f"压测指标批量写入失败({len(batch)}条): {e}")
+                room = self.max_queue - len(self._queue)
+                if room < len(batch):
+                    self._dropped += len(batch) - room
+                    batch = batch[len(batch) - room:] if room > 0 else []
+                self._queue.extendleft(reversed(batch))
+                return False
+            self._written += len(batch)
+            self._last_flush_at = time.time()
+            self._last_flush_ms = (time.perf_counter() - start) * 1000
+            self._last_batch_size = len(batch)
+            return True
+
+
+# 进程内共享的写入器实例
+metric_writer = MetricWriter()
@@ -14,8 +14,12 @@ class StressTestScenario(Model):
                                      description="场景类型: single_api/multi_api/chain_api")
     # 压测配置
     target_apis = fields.JSONField(default=list,
-                                   description="目标API列表: [{method, url, headers, body, params}]")
+                                   description="目标API列表: [{method, url, headers, body, params, extract, weight}]")
     think_time = fields.IntField(default=0, description="思考时间(ms) - 请求间隔")
+    think_time_distribution = fields.CharField(max_length=20, default="constant",
+                                               description="思考时间分布: constant/uniform/normal/exponential")
+    think_time_spread = fields.IntField(default=0, description="思考时间波动(ms): uniform为±范围, normal为标准差")
+    pacing = fields.IntField(default=0, description="节奏控制(ms): 每次迭代固定间隔, 0=不启用")
     timeout = fields.IntField(default=30, description="请求超时时间(秒)")
     # AI 生成标记
     ai_generated = fields.BooleanField(default=False, description="是否由AI生成")
@@ -24,6 +28,10 @@ class StressTestScenario(Model):
     parameter_data = fields.JSONField(null=True, description="参数化数据集 [{key: value}]")
     parameter_strategy = fields.CharField(max_length=20, default="sequential",
                                           description="参数化策略: sequential/random/unique")
+    # 传输层
+    transport_profile = fields.JSONField(null=True,
+                                         description="传输配置 {keep_alive, max_connections, max_connections_per_host, "
+                                                     "keepalive_timeout, dns_cache_ttl, discard_body}")
     creator_id = fields.IntField(description="创建者ID")
     created_at = fields.DatetimeField(auto_now_add=True)
     updated_at = fields.DatetimeField(auto_now=True)
@@ -41,12 +49,22 @@ class StressTestTask(Model):
     name = fields.CharField(max_length=255, description="任务名称")
     # 负载配置
     load_type = fields.CharField(max_length=20, default="constant",
-                                 description="负载类型: constant/ramp_up/spike/soak")
+                                 description="负载类型: constant/ramp_up/spike/soak/arrival_rate/capacity_search/staged")
     concurrency = fields.IntField(default=10, description="并发用户数")
     ramp_up_time = fields.IntField(default=0, description="梯度加压时间(秒)")
     ramp_up_steps = fields.IntField(default=1, description="梯度加压步骤数")
     duration = fields.IntField(default=60, description="持续时间(秒)")
     target_rps = fields.IntField(default=0, description="目标RPS(0=不限制)")
+    arrival_distribution = fields.CharField(max_length=20, default="constant",
+                                            description="到达分布(arrival_rate专用): constant/poisson")
+    processes = fields.IntField(default=1, description="发压进程数(1=单进程, 0=按CPU核数)")
+    agent_count = fields.IntField(default=0, description="分布式压测节点数(0=仅本机执行)")
+    record_samples = fields.BooleanField(default=False, description="是否落盘原始样本(用于事后切片分析)")
+    trace_phases = fields.BooleanField(default=False, description="是否记录请求阶段耗时(DNS/建连/TTFB/传输)")
+    stages = fields.JSONField(null=True,
+                              description="阶段编排(staged专用) [{duration, target_users|target_rps, mode: linear/step, name}]")
+    capacity_config = fields.JSONField(null=True,
+                                       description="容量探测配置 {strategy: step/binary, start_rps, step_rps, hold_seconds, min_samples}")
     # 状态
     status = fields.CharField(max_length=20, default="pending",
                               description="状态: pending/running/completed/failed/stopped")
@@ -85,6 +103,19 @@ class StressTestResult(Model):
     # 吞吐量
     tps = fields.FloatField(default=0, description="TPS(每秒事务数)")
     throughput = fields.FloatField(default=0, description="吞吐量(bytes/s)")
+    # 开放模型
+    dropped_requests = fields.IntField(default=0, description="在途上限导致丢弃的请求数")
+    late_requests = fields.IntField(default=0, description="晚于计划时间发出的请求数")
+    # 容量探测
+    capacity_curve = fields.JSONField(null=True,
+                                      description="吞吐/延迟曲线 [{target_rps, achieved_rps, p99_rt, error_rate, passed}]")
+    saturation_point = fields.JSONField(null=True,
+                                        description="饱和点 {max_sustainable_rps, breached_at_rps, breach_reasons}")
+    # 传输层
+    phase_breakdown = fields.JSONField(null=True,
+                                       description="阶段耗时分布 {queued/dns/connect/send/ttfb/transfer: {avg, p50, p95, p99}}")
+    transport_stats = fields.JSONField(null=True,
+                                       description="传输统计 {profile, new_connections, connection_reuse_rate, connect_time, ttfb}")
     # 按接口明细
     api_details = fields.JSONField(default=list,
                                    description="各接口明细 [{url, method, avg_rt, p99_rt, error_rate, tps}]")
@@ -114,6 +145,9 @@ class StressTestMetric(Model):
     avg_response_time = fields.FloatField(default=0, description="瞬时平均响应时间(ms)")
     error_count = fields.IntField(default=0, description="本周期错误数")
     active_connections = fields.IntField(default=0, description="活跃连接数")
+    p95_response_time = fields.FloatField(default=0, description="瞬时P95响应时间(ms)")
+    p99_response_time = fields.FloatField(default=0, description="瞬时P99响应时间(ms)")
+    stage = fields.IntField(null=True, description="阶段编排的阶段序号")
     # AI异常检测
     is_anomaly = fields.BooleanField(default=False, description="是否异常点")
     anomaly_reason = fields.CharField(max_length=255, null=True, description="异常原因")
@@ -1,7 +1,7 @@
 """
 压力测试模块 - Pydantic Schemas
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
@@ -14,6 +14,20 @@ class TargetApiItem(BaseModel):
     body: Optional[Any] = None
     params: Optional[Dict[str, str]] = None
     name: Optional[str] = None
+    # 链路场景的响应提取规则: [{name, type: jmespath/regex, expression}] 或 [[变量名, jmespath表达式]]
+    extract: Optional[List[Any]] = None
+    # 加权混合中的权重(任一接口设置后按权重随机选择接口)
+    weight: Optional[float] = None
+
+
+class TransportProfile(BaseModel):
+    """传输层配置(默认值与 StressEngine.DEFAULT_TRANSPORT_PROFILE 一致)"""
+    keep_alive: bool = True
+    max_connections: int = 0
+    max_connections_per_host: int = 0
+    keepalive_timeout: float = 15
+    dns_cache_ttl: int = 10
+    discard_body: bool = False
 
 
 class ScenarioCreate(BaseModel):
@@ -22,9 +36,13 @@ class ScenarioCreate(BaseModel):
     scenario_type: str = "single_api"
     target_apis: List[TargetApiItem] = []
     think_time: int = 0
+    think_time_distribution: str = "constant"
+    think_time_spread: int = 0
+    pacing: int = 0
     timeout: int = 30
     parameter_data: Optional[List[Dict]] = None
     parameter_strategy: str = "sequential"
+    transport_profile: Optional[TransportProfile] = None
 
 
 class ScenarioUpdate(BaseModel):
@@ -33,9 +51,13 @@ class ScenarioUpdate(BaseModel):
     scenario_type: Optional[str] = None
     target_apis: Optional[List[TargetApiItem]] = None
     think_time: Optional[int] = None
+    think_time_distribution: Optional[str] = None
+    think_time_spread: Optional[int] = None
+    pacing: Optional[int] = None
     timeout: Optional[int] = None
     parameter_data: Optional[List[Dict]] = None
     parameter_strategy: Optional[str] = None
+    transport_profile: Optional[TransportProfile] = None
 
 
 class ScenarioResponse(BaseModel):
@@ -46,10 +68,14 @@ class ScenarioResponse(BaseModel):
     scenario_type: str
     target_apis: list
     think_time: int
+    think_time_distribution: str = "constant"
+    think_time_spread: int = 0
+    pacing: int = 0
     timeout: int
     ai_generated: bool
     parameter_data: Optional[list]
     parameter_strategy: str
+    transport_profile: Optional[dict] = None
     creator_id: int
     created_at: datetime
     updated_at: datetime
@@ -73,6 +99,13 @@ class TaskCreate(BaseModel):
     ramp_up_steps: int = 1
     duration: int = 60
     target_rps: int = 0
+    arrival_distribution: str = Field("constant", pattern="^(constant|poisson)$")
+    processes: int = 1
+    agent_count: int = 0
+    record_samples: bool = False
+    trace_phases: bool = False
+    capacity_config: Optional[Dict] = None
+    stages: Optional[List[Dict]] = None
 
 
 class TaskResponse(BaseModel):
@@ -86,6 +119,13 @@ class TaskResponse(BaseModel):
     ramp_up_steps: int
     duration: int
     target_rps: int
+    arrival_distribution: str = Field("constant", pattern="^(constant|poisson)$")
+    processes: int = 1
+    agent_count: int = 0
+    record_samples: bool = False
+    trace_phases: bool = False
+    capacity_config: Optional[Dict] = None
+    stages: Optional[list] = None
     status: str
     started_at: Optional[datetime]
     finished_at: Optional[datetime]
@@ -99,6 +139,17 @@ class TaskResponse(BaseModel):
     scenario_name: Optional[str] = None
 
 
+class AgentRegisterRequest(BaseModel):
+    """压测节点注册/心跳"""
+    agent_id: str
+    # 仅用于展示, 后端按请求来源地址连接节点
+    host: Optional[str] = None
+    port: int
+    cpu_count: int = 1
+    processes: int = 1
+    busy: bool = False
+
+
 class AIRecommendConfigRequest(BaseModel):
     """AI推荐压测配置"""
     scenario_id: int
@@ -122,6 +173,12 @@ class ResultResponse(BaseModel):
     p99_response_time: float
     tps: float
     throughput: float
+    dropped_requests: int = 0
+    late_requests: int = 0
+    capacity_curve: Optional[list] = None
+    saturation_point: Optional[dict] = None
+    transport_stats: Optional[dict] = None
+    phase_breakdown: Optional[dict] = None
     api_details: list
     error_distribution: dict
     ai_analysis: Optional[str]
@@ -140,6 +197,9 @@ class MetricResponse(BaseModel):
     avg_response_time: float
     error_count: int
     active_connections: int
+    p95_response_time: float = 0
+    p99_response_time: float = 0
+    stage: Optional[int] = None
     is_anomaly: bool
     anomaly_reason: Optional[str]
 
@@ -1,7 +1,10 @@
 """
 测试执行模块API路由
 """
+import asyncio
+import json
 from fastapi import APIRouter, HTTPException, Depends, status, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 from typing import Tuple, Optional
 from decimal import Decimal
 from datetime import datetime
@@ -15,12 +18,19 @@ from .schemas import RunSingleTestCaseRequest, RunSingleTestCaseResponse, RunTes
     TestSuiteSummary, RunTestTaskRequest, RunTestTaskResponse, TestTaskSummary, RunTestTaskBackgroundRequest, \
     RunTestTaskBackgroundResponse, TaskStatusQueryResponse, ApiCaseRunDetailResponse, ApiCaseRunListResponse, \
     TestSuiteRunListResponse, TestSuiteRunDetailResponse, TestTaskRunListResponse, TestTaskRunDetailResponse
-from api_case_run.execute import TestExecutor
+from api_case_run.execute import AsyncTestExecutor
 from ..test_management.models import SuiteCaseRelation, TestSuite, TestTask, TaskSuiteRelation
 from .models import TestTaskRun
+from .result_sink import CaseResultSink, restore_task_run
+from .case_selection import prepare_task_run
+from .job_queue import QUEUE_ENABLED, enqueue, queue_metrics
+from .run_events import run_event_hub
 
 router = APIRouter()
 
+# 任务不在本进程执行时，SSE 推送数据库统计数的间隔(秒)
+DB_SNAPSHOT_INTERVAL = 2
+
 
 @router.post("/{project_id}/cases/run", response_model=RunSingleTestCaseResponse, summary="运行单条测试用例")
 async def run_single_test_case(
@@ -107,8 +117,8 @@ async def run_single_test_case(
         }
 
         # 6. 调用execute_test_case方法执行用例
-        executor = TestExecutor(test_env_global=test_env_global, db_config=db_config_list)
-        result = executor.execute_test_case(case_data)
+        executor = AsyncTestExecutor(test_env_global=test_env_global, db_config=db_config_list)
+        result = await executor.execute_test_case(case_data)
 
         # 7. 保存执行结果到ApiCaseRun表
         case_run = await ApiCaseRun.create(
@@ -250,12 +260,13 @@ async def run_test_suite(
         suite_data = {
             "id": test_suite.id,
             "name": test_suite.suite_name,
+            "concurrency": test_suite.concurrency,
             "cases_list": cases_list
         }
 
         # 7. 调用execute_test_suite方法执行套件
-        executor = TestExecutor(test_env_global=test_env_global, db_config=db_config_list)
-        execution_result = executor.execute_test_suite(suite_data)
+        executor = AsyncTestExecutor(test_env_global=test_env_global, db_config=db_config_list)
+        execution_result = await executor.execute_test_suite(suite_data)
 
         # 8. 保存执行结果到TestSuiteRun表
         start_time = datetime.now()
@@ -282,6 +293,7 @@ async def run_test_suite(
             failed_cases=summary.get('failed', 0),
             skipped_cases=summary.get('skipped', 0),
             error_cases=summary.get('error', 0),
+            execution_plan=execution_result.get('plan'),
         )
 
         # 9. 保存每个用例的执行结果到ApiCaseRun表
@@ -440,6 +452,7 @@ async def run_test_task(
             suite_data = {
                 "id": suite.id,
                 "name": suite.suite_name,
+                "concurrency": suite.concurrency,
                 "cases_list": cases_list
             }
             suites_list.append(suite_data)
@@ -454,8 +467,8 @@ async def run_test_task(
         }
 
         # 7. 调用execute_test_task方法执行任务
-        executor = TestExecutor(test_env_global=test_env_global, db_config=db_config_list)
-        execution_result = executor.execute_test_task(task_data)
+        executor = AsyncTestExecutor(test_env_global=test_env_global, db_config=db_config_list)
+        execution_result = await executor.execute_test_task(task_data)
 
         # 8. 保存执行结果到TestTaskRun表
         start_time = datetime.now()
@@ -506,7 +519,8 @@ async def run_test_task(
                 total_cases=suite_summary.get('total', 0),
                 passed_cases=suite_summary.get('success', 0),
                 failed_cases=suite_summary.get('fail', 0),
-                skipped_cases=suite_summary.get('skip', 0)
+                skipped_cases=suite_summary.get('skip', 0),
+                execution_plan=suite_result.get('plan')
             )
 
             # 10. 保存每个用例的执行结果到ApiCaseRun表
@@ -557,7 +571,8 @@ async def execute_test_task_background(
         project_id: int,
         task_id: int,
         environment_id: int,
-        task_run_id: int
+        task_run_id: int,
+        resume: bool = False
 ):
     """
     后台执行测试任务的函数
@@ -567,13 +582,17 @@ async def execute_test_task_background(
     - task_id: 测试任务ID
     - environment_id: 测试环境ID
     - task_run_id: 任务执行记录ID
+    - resume: 是否为中断后恢复执行（执行队列租约过期后重新租用，跳过已结束的套件）
     """
     try:
         # 更新任务状态为运行中
         task_run = await TestTaskRun.get(id=task_run_id)
         task_run.status = 'running'
-        task_run.start_time = datetime.now()
+        if not resume or not task_run.start_time:
+            task_run.start_time = datetime.now()
         await task_run.save()
+        # 打开事件频道，订阅者可以实时看到用例执行进度
+        run_event_hub.open(task_run_id)
 
         # 1. 查询测试任务
         test_task = await TestTask.get(id=task_id, project_id=project_id)
@@ -639,10 +658,14 @@ async def execute_test_task_background(
             suite_data = {
                 "id": suite.id,
                 "name": suite.suite_name,
+                "concurrency": suite.concurrency,
                 "cases_list": cases_list
             }
             suites_list.append(suite_data)
 
+        # 计算用例指纹；增量执行模式下只执行有变化或上次未通过的用例
+        suites_list, fingerprints = await prepare_task_run(task_run, suites_list, test_env_global, resume)
+
         # 构建任务数据
         task_data = {
             "id": test_task.id,
@@ -652,13 +675,52 @@ async def execute_test_task_background(
             "suites_list": suites_list
         }
 
-        # 7. 调用execute_test_task方法执行任务
-        executor = TestExecutor(test_env_global=test_env_global, db_config=db_config_list)
-        execution_result = executor.execute_test_task(task_data)
+        # 7. 调用execute_test_task方法执行任务，用例结果在执行过程中批量写入
+        task_run.total_suites = len(suites_list)
+        task_run.total_cases = sum(len(suite_data["cases_list"]) for suite_data in suites_list)
+        await task_run.save()
+        run_event_hub.publish(task_run_id, {"type": "run_started", "total_suites": task_run.total_suites,
+                                            "total_cases": task_run.total_cases})
+        # 恢复执行时跳过已结束的套件
+        finished_suites = await restore_task_run(task_run_id) if resume else {}
+        task_data["suites_list"] = [suite_data for suite_data in suites_list
+                                    if suite_data["id"] not in finished_suites]
+        suite_runs = {}
+
+        async def start_suite(suite_data):
+            # 套件开始执行时创建运行记录，后续用例结果关联到该记录
+            suite_run = await TestSuiteRun.create(
+                suite_id=suite_data["id"],
+                run_task_id=task_run.id,
+                status='running',
+                start_time=datetime.now(),
+                total_cases=len(suite_data["cases_list"])
+            )
+            suite_runs[suite_data["id"]] = suite_run
+            sink.start_suite(suite_run.id)
+            run_event_hub.publish(task_run_id, {"type": "suite_started", "suite_id": suite_data["id"],
+                                                "suite_run_id": suite_run.id, "name": suite_data.get("name"),
+                                                "total_cases": suite_run.total_cases})
+
+        executor = AsyncTestExecutor(test_env_global=test_env_global, db_config=db_config_list,
+                                     on_event=lambda event: run_event_hub.publish(task_run_id, event))
+        async with CaseResultSink(task_run.id, fingerprints=fingerprints) as sink:
+            # 已结束套件的统计数计入实时统计，避免恢复执行后任务统计数回退
+            sink.restore(list(finished_suites.values()))
+            execution_result = await executor.execute_test_task(task_data, on_suite_start=start_suite,
+                                                                on_result=sink.add)
 
         # 8. 更新任务执行结果
         end_time = datetime.now()
         summary = execution_result.get('task_summary', {})
+        # 合并恢复执行前已结束的套件
+        for suite_run in finished_suites.values():
+            summary['total_suites'] += 1
+            summary['total_cases'] += suite_run.total_cases
+            summary['success_cases'] += suite_run.passed_cases
+            summary['failed_cases'] += suite_run.failed_cases
+            summary['error_cases'] += suite_run.error_cases
+            summary['skip_cases'] += suite_run.skipped_cases
 
         # 计算任务执行状态
         if summary.get('error_cases', 0) > 0:
@@ -679,7 +741,7 @@ async def execute_test_task_background(
         task_run.skipped_cases = summary.get('skip_cases', 0)
         await task_run.save()
 
-        # 9. 保存每个套件的执行结果到TestSuiteRun表
+        # 9. 更新每个套件的执行结果(用例结果已在执行过程中写入ApiCaseRun表)
         suite_results = execution_result.get('suite_results', [])
         for suite_result in suite_results:
             suite_summary = suite_result.get('summary', {})
@@ -692,35 +754,19 @@ async def execute_test_task_background(
             else:
                 suite_status = 'completed'
 
-            suite_run = await TestSuiteRun.create(
-                suite_id=suite_result.get('suite_id'),
-                run_task_id=task_run.id,
-                status=suite_status,
-                start_time=task_run.start_time,
-                end_time=end_time,
-                duration=Decimal(str(suite_summary.get('duration', 0))),
-                total_cases=suite_summary.get('total', 0),
-                passed_cases=suite_summary.get('success', 0),
-                failed_cases=suite_summary.get('fail', 0),
-                skipped_cases=suite_summary.get('skip', 0)
-            )
+            suite_run = suite_runs[suite_result.get('suite_id')]
+            suite_run.status = suite_status
+            suite_run.end_time = end_time
+            suite_run.duration = Decimal(str(suite_summary.get('duration', 0)))
+            suite_run.total_cases = suite_summary.get('total', 0)
+            suite_run.passed_cases = suite_summary.get('success', 0)
+            suite_run.failed_cases = suite_summary.get('fail', 0)
+            suite_run.skipped_cases = suite_summary.get('skip', 0)
+            suite_run.error_cases = suite_summary.get('error', 0)
+            suite_run.execution_plan = suite_result.get('plan')
+            await suite_run.save()
 
-            # 10. 保存每个用例的执行结果到ApiCaseRun表
-            case_results = suite_result.get('results', [])
-            for result in case_results:
-                await ApiCaseRun.create(
-                    api_case_id=result.case_id,
-                    suite_run_id=suite_run.id,
-                    case_name=result.case_name,
-                    status=result.status,
-                    start_time=datetime.fromtimestamp(result.start_time) if result.start_time else None,
-                    end_time=datetime.fromtimestamp(result.end_time) if result.end_time else None,
-                    duration=Decimal(str(result.duration)) if result.duration else None,
-                    error_message=result.error_message,
-                    logs=result.logs,
-                    api_requests_info=getattr(result, 'api_requests_info', None),
-                    traceback=result.traceback
-                )
+        run_event_hub.publish(task_run_id, {"type": "run_finished", "status": task_status})
 
     except Exception as e:
         # 如果执行过程中出现异常，更新任务状态为失败
@@ -733,6 +779,9 @@ async def execute_test_task_background(
             await task_run.save()
         except:
             pass
+        run_event_hub.publish(task_run_id, {"type": "run_finished", "status": "failed", "message": str(e)})
+    finally:
+        run_event_hub.close(task_run_id)
 
 
 @router.post("/{project_id}/tasks/run-background", response_model=RunTestTaskBackgroundResponse,
@@ -796,17 +845,26 @@ async def run_test_task_background(
         # 4. 创建任务执行记录
         task_run = await TestTaskRun.create(
             task_id=test_task.id,
-            status='pending'  # 初始状态为待执行
+            status='pending',  # 初始状态为待执行
+            run_mode=request_data.run_mode
         )
 
-        # 5. 添加后台任务
-        background_tasks.add_task(
-            execute_test_task_background,
-            project_id,
-            request_data.task_id,
-            request_data.environment_id,
-            task_run.id
-        )
+        # 5. 提交执行：启用执行队列时写入队列由执行工作进程执行，否则作为当前进程的后台任务执行
+        if QUEUE_ENABLED:
+            await enqueue("task_background", {
+                "project_id": project_id,
+                "task_id": request_data.task_id,
+                "environment_id": request_data.environment_id,
+                "task_run_id": task_run.id,
+            }, lane=request_data.lane, project_id=project_id, task_run_id=task_run.id)
+        else:
+            background_tasks.add_task(
+                execute_test_task_background,
+                project_id,
+                request_data.task_id,
+                request_data.environment_id,
+                task_run.id
+            )
 
         # 6. 立即返回响应
         return RunTestTaskBackgroundResponse(
@@ -865,8 +923,9 @@ async def get_task_run_status(
             )
 
         # 3. 构建响应数据
+        # 执行过程中统计数随用例结果批量写入实时更新
         summary = None
-        if task_run.status in ['completed', 'failed', 'error']:
+        if task_run.status in ['running', 'completed', 'failed', 'error']:
             summary = TestTaskSummary(
                 total_suites=task_run.total_suites,
                 total_cases=task_run.total_cases,
@@ -898,6 +957,115 @@ async def get_task_run_status(
         )
 
 
+@router.get("/{project_id}/tasks/run/{task_run_id}/events", summary="订阅测试任务执行进度(SSE)")
+async def stream_task_run_events(
+        project_id: int,
+        task_run_id: int,
+        project_and_user: Tuple[Project, User] = Depends(verify_admin_or_project_member)
+):
+    """
+    订阅测试任务执行进度接口（Server-Sent Events）
+
+    权限要求：
+    - 只有项目成员和管理员可以访问该接口
+
+    推送内容：
+    - 加入时先推送一次当前状态的快照（type=snapshot），之后推送增量事件：
+      run_started / suite_started / case_started / case_finished / suite_finished / run_finished
+    - 事件带有递增的 seq，快照之后的事件 seq 均大于快照的 seq
+    - 任务不在本进程执行（启用执行队列时由执行工作进程执行）时，任务结束前定时推送数据库中的统计数（type=snapshot），
+      任务结束后推送 ended
+    """
+    task_run = await TestTaskRun.get_or_none(id=task_run_id).prefetch_related('task')
+    if not task_run or task_run.task.project_id != project_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务执行记录不存在"
+        )
+
+    sub, snapshot = run_event_hub.subscribe(task_run_id)
+
+    async def db_snapshots():
+        # 用例结果批量写入时会同步刷新任务运行记录上的统计数，按写入间隔轮询
+        run, last = task_run, None
+        while True:
+            data = {
+                "type": "snapshot",
+                "source": "db",
+                "task_run_id": run.id,
+                "status": run.status,
+                "total_suites": run.total_suites,
+                "total_cases": run.total_cases,
+                "counts": {"passed": run.passed_cases, "failed": run.failed_cases,
+                           "skipped": run.skipped_cases},
+            }
+            if data != last:
+                last = data
+                yield f"data: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+            else:
+                yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+            if run.status not in ('pending', 'running'):
+                break
+            await asyncio.sleep(DB_SNAPSHOT_INTERVAL)
+            run = await TestTaskRun.get_or_none(id=task_run_id)
+            if run is None:
+                break
+        yield f"data: {json.dumps({'type': 'ended'})}\n\n"
+
+    async def event_stream():
+        if sub is None:
+            async for chunk in db_snapshots():
+                yield chunk
+            return
+        try:
+            yield f"data: {json.dumps(snapshot, ensure_ascii=False, default=str)}\n\n"
+            dropped = 0
+            while True:
+                items = await sub.get(timeout=5)
+                if sub.dropped != dropped:
+                    # 消费过慢丢失了部分事件，重新下发快照
+                    dropped = sub.dropped
+                    resync = run_event_hub.snapshot(task_run_id)
+                    if resync is not None:
+                        items = [item for item in items if item["seq"] > resync["seq"]]
+                        yield f"data: {json.dumps(resync, ensure_ascii=False, default=str)}\n\n"
+                for item in items:
+                    yield f"data: {json.dumps(item, ensure_ascii=False, default=str)}\n\n"
+                if sub.closed and not items:
+                    yield f"data: {json.dumps({'type': 'ended'})}\n\n"
+                    break
+                if not items:
+                    yield f"data: {json.dumps({'type': 'heartbeat'})}\n\n"
+        finally:
+            run_event_hub.unsubscribe(task_run_id, sub)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@router.get("/{project_id}/jobs/metrics", summary="查询测试执行队列指标")
+async def get_job_queue_metrics(
+        project_id: int,
+        window_minutes: int = Query(60, ge=1, le=1440, description="等待时长统计的时间窗口（分钟）"),
+        project_and_user: Tuple[Project, User] = Depends(verify_admin_or_project_member)
+):
+    """
+    查询测试执行队列指标
+
+    返回：
+    - depth / lanes: 排队中的任务数及各优先级通道的排队数、最长等待时长（秒）
+    - leased / expired_leases: 执行中的任务数、租约已过期等待重新租用的任务数
+    - wait: 时间窗口内开始执行的任务从入队到开始执行的等待时长（秒）
+    - finished: 时间窗口内结束的任务数（按状态）
+    """
+    try:
+        return await queue_metrics(window_minutes)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查询执行队列指标时发生错误: {str(e)}"
+        )
+
+
 @router.get("/{project_id}/cases/run/{case_run_id}", response_model=ApiCaseRunDetailResponse,
             summary="获取单条测试用例运行详情")
 async def get_case_run_detail(
@@ -1157,6 +1325,7 @@ async def get_suite_run_detail(
             failed_cases=suite_run.failed_cases,
             skipped_cases=suite_run.skipped_cases,
             error_cases=suite_run.error_cases,
+            execution_plan=suite_run.execution_plan,
             case_runs=case_run_details,
             created_at=suite_run.created_at,
             updated_at=suite_run.updated_at
@@ -1301,6 +1470,8 @@ async def get_task_run_detail(
             failed_cases=task_run.failed_cases,
             skipped_cases=task_run.skipped_cases,
             error_cases=error_cases_total,
+            run_mode=task_run.run_mode,
+            selection=task_run.selection,
             suite_runs=suite_run_details,
             created_at=task_run.created_at,
             updated_at=task_run.updated_at
@@ -105,6 +105,7 @@ async def run_single_test_case(
         # 6. 调用execute_test_case方法执行用例
         executor = TestExecutor(test_env_global=test_env_global, db_config=db_config_list)
         result = executor.execute_test_case(case_data)
+        executor.close()
 
         # 7. 保存执行结果到ApiCaseRun表
         case_run = await ApiCaseRun.create(
@@ -249,6 +250,7 @@ async def run_test_suite(
         # 7. 调用execute_test_suite方法执行套件
         executor = TestExecutor(test_env_global=test_env_global, db_config=db_config_list)
         execution_result = executor.execute_test_suite(suite_data)
+        executor.close()
 
         # 8. 保存执行结果到TestSuiteRun表
         start_time = datetime.now()
@@ -448,6 +450,7 @@ async def run_test_task(
         # 7. 调用execute_test_task方法执行任务
         executor = TestExecutor(test_env_global=test_env_global, db_config=db_config_list)
         execution_result = executor.execute_test_task(task_data)
+        executor.close()
 
         # 8. 保存执行结果到TestTaskRun表
         start_time = datetime.now()
@@ -0,0 +1,174 @@
+"""
+测试执行模块 - 增量执行(只执行有变化的用例)
+每条用例执行时记录指纹(用例定义 + 用到的环境变量 : 关联接口定义), 增量执行模式(run_mode=changed)下只执行:
+    - new: 没有执行记录的用例
+    - changed: 请求、断言、前置步骤或用到的环境变量有变化的用例
+    - interface_changed: 关联接口定义有变化的用例
+    - failed: 上次执行未通过的用例(失败或出错, 跳过的用例不算)
+    - dependency: 上述用例依赖的上游用例(读取它们写入的变量)
+    - full_run: 距上次全量执行已达到 CHANGED_ONLY_FULL_RUN_EVERY 次, 本次全量执行
+选择结果和原因记录在任务运行记录的 selection 字段
+"""
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+from tortoise.functions import Max
+from api_case_run.core.dependency import analyse_case, build_case_plan
+from service.api_test.models import ApiInterface, ApiTestCase
+from service.test_execution.models import ApiCaseRun, TestTaskRun
+
+RUN_MODES = ("full", "changed")
+# 每 N 次执行中至少有一次全量执行, 0 表示不做定期全量执行
+FULL_RUN_EVERY = int(os.getenv("CHANGED_ONLY_FULL_RUN_EVERY", 0))
+
+
+def _digest(data) -> str:
+    text = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def case_fingerprint(case_data: dict, env_vars: dict) -> str:
+    """用例定义的指纹, 只包含用例实际读取的环境变量(无法静态分析时包含全部环境变量)"""
+    info = analyse_case(case_data)
+    names = env_vars.keys() if info["dynamic_read"] else info["inputs"] | {"func_global"}
+    return _digest({
+        "preconditions": case_data.get("preconditions") or [],
+        "request": case_data.get("request") or {},
+        "assertions": case_data.get("assertions") or {},
+        "env": {name: env_vars[name] for name in names if name in env_vars},
+    })
+
+
+def interface_fingerprint(interface: ApiInterface) -> str:
+    return _digest({
+        "method": interface.method,
+        "path": interface.path,
+        "parameters": interface.parameters,
+        "request_body": interface.request_body,
+        "responses": interface.responses,
+    })
+
+
+async def compute_fingerprints(cases: List[dict], env_vars: dict) -> Dict[int, str]:
+    """计算用例指纹: {用例ID: "用例指纹:接口指纹"}"""
+    case_ids = {case["id"] for case in cases}
+    links = await ApiTestCase.filter(id__in=case_ids).values_list("id", "base_case__interface_id")
+    case_interfaces = dict(links)
+    interfaces = {interface.id: interface_fingerprint(interface)
+                  for interface in await ApiInterface.filter(id__in=set(case_interfaces.values()))}
+    return {
+        case["id"]: f"{case_fingerprint(case, env_vars)}:{interfaces.get(case_interfaces.get(case['id']), '')}"
+        for case in cases
+    }
+
+
+async def last_case_runs(case_ids) -> Dict[int, dict]:
+    """每条用例最近一次的执行记录: {用例ID: {status, fingerprint}}"""
+    rows = await ApiCaseRun.filter(api_case_id__in=set(case_ids)).annotate(last_id=Max("id")) \
+        .group_by("api_case_id").values_list("api_case_id", "last_id")
+    runs = await ApiCaseRun.filter(id__in=[last_id for _, last_id in rows]) \
+        .values("api_case_id", "status", "fingerprint")
+    return {run["api_case_id"]: run for run in runs}
+
+
+def _change_reason(fingerprint: str, last_run: Optional[dict]) -> Optional[str]:
+    if last_run is None or not last_run["fingerprint"]:
+        return "new"
+    case_fp, _, interface_fp = fingerprint.partition(":")
+    last_case_fp, _, last_interface_fp = last_run["fingerprint"].partition(":")
+    if case_fp != last_case_fp:
+        return "changed"
+    if interface_fp != last_interface_fp:
+        return "interface_changed"
+    # 跳过的用例没有执行结果, 定义未变化时不再选择
+    if last_run["status"] not in ("success", "skip"):
+        return "failed"
+    return None
+
+
+async def need_full_run(task_id: int, every: int) -> bool:
+    """最近 every-1 次执行都是增量执行时, 本次全量执行"""
+    if every <= 0:
+        return False
+    recent = await TestTaskRun.filter(task_id=task_id, status__not_in=['pending', 'running']) \
+        .order_by('-id').limit(every - 1).values("run_mode", "selection")
+    incremental = [run for run in recent
+                   if run["run_mode"] == "changed" and not (run["selection"] or {}).get("full_run")]
+    return len(incremental) >= every - 1
+
+
+def apply_selection(suites: List[dict], selection: dict) -> List[dict]:
+    """按选择结果过滤套件中的用例, 没有用例需要执行的套件不再执行"""
+    selected = selection.get("cases") or {}
+    result = []
+    for suite in suites:
+        cases_list = [case for case in suite["cases_list"] if str(case["id"]) in selected]
+        if cases_list:
+            result.append({**suite, "cases_list": cases_list})
+    return result
+
+
+async def select_cases(task_id: int, suites: List[dict], fingerprints: Dict[int, str],
+                       full_run_every: int = FULL_RUN_EVERY) -> Tuple[List[dict], dict]:
+    """
+    选择需要执行的用例
+    :param suites: [{"id": 套件ID, "cases_list": [用例数据]}], 用例数据与执行器的格式一致
+    :return: (过滤后的套件列表, 选择结果)
+    """
+    full_run = await need_full_run(task_id, full_run_every)
+    last_runs = {} if full_run else await last_case_runs(fingerprints.keys())
+    # 变量在套件之间传递, 依赖关系按整个任务的用例执行顺序分析
+    all_cases = [case for suite in suites for case in suite["cases_list"]]
+    total = len(all_cases)
+    chosen = {}
+    for index, case in enumerate(all_cases):
+        reason = "full_run" if full_run else _change_reason(fingerprints[case["id"]], last_runs.get(case["id"]))
+        if reason:
+            chosen[index] = reason
+    # 被选中用例读取的变量由上游用例(包括之前套件中的用例)写入, 上游用例一并执行
+    nodes = build_case_plan(all_cases)["nodes"] if chosen and not full_run else []
+    stack = list(chosen)
+    while stack:
+        for upstream in nodes[stack.pop()]["depends_on"]:
+            if upstream not in chosen:
+                chosen[upstream] = "dependency"
+                stack.append(upstream)
+    reasons: Dict[str, str] = {}
+    for index in sorted(chosen):
+        reasons.setdefault(str(all_cases[index]["id"]), chosen[index])
+    counts: Dict[str, int] = {}
+    for reason in reasons.values():
+        counts[reason] = counts.get(reason, 0) + 1
+    selection = {
+        "mode": "changed",
+        "full_run": full_run,
+        "full_run_every": full_run_every,
+        "total_cases": total,
+        "selected_cases": 0,
+        "reasons": counts,
+        "cases": reasons,
+    }
+    suites = apply_selection(suites, selection)
+    selection["selected_cases"] = sum(len(suite["cases_list"]) for suite in suites)
+    return suites, selection
+
+
+async def prepare_task_run(task_run: TestTaskRun, suites: List[dict], env_vars: dict,
+                           resume: bool = False) -> Tuple[List[dict], Dict[int, str]]:
+    """
+    执行前计算用例指纹, 增量执行模式下选择需要执行的用例并记录到任务运行记录
+    恢复执行时沿用第一次执行时的选择结果
+    :return: (需要执行的套件列表, 用例指纹)
+    """
+    fingerprints = await compute_fingerprints([case for suite in suites for case in suite["cases_list"]], env_vars)
+    if task_run.run_mode != "changed":
+        return suites, fingerprints
+    if resume and task_run.selection:
+        return apply_selection(suites, task_run.selection), fingerprints
+    suites, selection = await select_cases(task_run.task_id, suites, fingerprints)
+    task_run.selection = selection
+    task_run.total_suites = len(suites)
+    task_run.total_cases = selection["selected_cases"]
+    await task_run.save(update_fields=["selection", "total_suites", "total_cases"])
+    return suites, fingerprints
@@ -0,0 +1,161 @@
+"""
+测试执行模块 - 持久化执行队列
+启用后(EXECUTION_QUEUE_ENABLED=1)后台执行的测试任务不再在接口进程中运行, 而是写入 execution_job 表,
+由独立的执行工作进程(executor_worker.py)租用执行:
+    - 租用: 按优先级通道(debug > manual > ci > scheduled)和入队顺序取任务, 条件更新保证同一任务只被一个进程租到
+    - 续租: 执行期间定时延长租约; 进程退出或卡死导致租约过期后, 其它工作进程重新租用并从未完成的套件继续执行
+    - 租用次数超过上限的任务标记为失败
+    - 队列深度、等待时长等指标从表中统计, 多个进程看到的数据一致
+"""
+import logging
+import os
+from datetime import timedelta
+from typing import List, Optional
+from tortoise import timezone
+from tortoise.expressions import F, Q
+from tortoise.functions import Count, Min
+from service.test_execution.models import ExecutionJob, TestTaskRun
+
+logger = logging.getLogger(__name__)
+
+QUEUE_ENABLED = os.getenv("EXECUTION_QUEUE_ENABLED", "0") == "1"
+# 租约时长(秒), 执行期间每 1/3 租约时长续租一次
+LEASE_SECONDS = int(os.getenv("EXECUTION_LEASE_SECONDS", 60))
+MAX_ATTEMPTS = int(os.getenv("EXECUTION_MAX_ATTEMPTS", 3))
+# 优先级通道: 数字越小越先执行
+LANES = {"debug": 0, "manual": 10, "ci": 20, "scheduled": 30}
+
+
+async def enqueue(job_type: str, payload: dict, lane: str = "manual", project_id: Optional[int] = None,
+                  task_run_id: Optional[int] = None) -> ExecutionJob:
+    """任务入队"""
+    if lane not in LANES:
+        raise ValueError(f"未知的优先级通道: {lane}")
+    return await ExecutionJob.create(
+        job_type=job_type,
+        lane=lane,
+        priority=LANES[lane],
+        payload=payload,
+        project_id=project_id,
+        task_run_id=task_run_id,
+        max_attempts=MAX_ATTEMPTS,
+    )
+
+
+async def lease(worker_id: str, lease_seconds: int = LEASE_SECONDS, candidates: int = 5) -> Optional[ExecutionJob]:
+    """
+    租用一个任务(排队中的任务, 或租约已过期且未超过租用次数的任务)
+    以 (status, attempts) 作为条件更新, 多个进程同时抢同一个任务时只有一个能更新成功
+    """
+    now = timezone.now()
+    jobs = await ExecutionJob.filter(
+        Q(status='queued') | Q(status='leased', lease_expires_at__lt=now)
+    ).order_by('priority', 'id').limit(candidates)
+    for job in jobs:
+        if job.status == 'leased' and job.attempts >= job.max_attempts:
+            continue
+        updated = await ExecutionJob.filter(id=job.id, status=job.status, attempts=job.attempts).update(
+            status='leased',
+            attempts=job.attempts + 1,
+            lease_owner=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            started_at=job.started_at or now,
+        )
+        if updated:
+            return await ExecutionJob.get(id=job.id)
+    return None
+
+
+async def renew(job_id: int, worker_id: str, lease_seconds: int = LEASE_SECONDS) -> bool:
+    """续租, 返回False表示租约已被其它进程接管"""
+    updated = await ExecutionJob.filter(id=job_id, status='leased', lease_owner=worker_id).update(
+        lease_expires_at=timezone.now() + timedelta(seconds=lease_seconds)
+    )
+    return bool(updated)
+
+
+async def release(job_id: int, worker_id: str):
+    """
+    工作进程退出时归还租约, 其它进程可以立即继续执行
+    主动归还不是执行失败, 本次租用不计入租用次数
+    """
+    await ExecutionJob.filter(id=job_id, status='leased', lease_owner=worker_id, attempts__gt=0).update(
+        lease_expires_at=timezone.now(), attempts=F('attempts') - 1
+    )
+
+
+async def complete(job_id: int, worker_id: str):
+    await ExecutionJob.filter(id=job_id, lease_owner=worker_id).update(
+        status='completed', finished_at=timezone.now(), lease_expires_at=None
+    )
+
+
+async def fail(job_id: int, worker_id: str, error: str):
+    await ExecutionJob.filter(id=job_id, lease_owner=worker_id).update(
+        status='failed', finished_at=timezone.now(), lease_expires_at=None, error=error
+    )
+
+
+async def reap_expired() -> List[int]:
+    """租约过期且租用次数已达上限的任务标记为失败, 同时把关联的任务运行记录标记为失败"""
+    now = timezone.now()
+    jobs = await ExecutionJob.filter(status='leased', lease_expires_at__lt=now)
+    reaped = []
+    for job in jobs:
+        if job.attempts < job.max_attempts:
+            continue
+        updated = await ExecutionJob.filter(id=job.id, status='leased', attempts=job.attempts).update(
+            status='failed', finished_at=now, error=f"租约超时{job.attempts}次，放弃执行"
+        )
+        if not updated:
+            continue
+        reaped.append(job.id)
+        logger.warning(f"执行任务{job.id}租约超时{job.attempts}次，标记为失败")
+        if job.task_run_id:
+            await TestTaskRun.filter(id=job.task_run_id, status__in=['pending', 'running']).update(
+                status='failed', end_time=now
+            )
+    return reaped
+
+
+async def queue_metrics(window_minutes: int = 60) -> dict:
+    """队列指标: 各通道排队数、最长等待时长、正在执行数, 以及最近一段时间的等待时长分布"""
+    now = timezone.now()
+    lanes = {lane: {"queued": 0, "oldest_wait": 0.0} for lane in LANES}
+    rows = await ExecutionJob.filter(status='queued').annotate(
+        count=Count('id'), oldest=Min('created_at')
+    ).group_by('lane').values('lane', 'count', 'oldest')
+    for row in rows:
+        lane = lanes.setdefault(row["lane"], {"queued": 0, "oldest_wait": 0.0})
+        lane["queued"] = row["count"]
+        if row["oldest"]:
+            lane["oldest_wait"] = round((now - row["oldest"]).total_seconds(), 3)
+    leased = await ExecutionJob.filter(status='leased', lease_expires_at__gte=now).count()
+    expired = await ExecutionJob.filter(status='leased', lease_expires_at__lt=now).count()
+    since = now - timedelta(minutes=window_minutes)
+    started = await ExecutionJob.filter(started_at__gte=since).values_list('created_at', 'started_at')
+    waits = sorted((s - c).total_seconds() for c, s in started if c and s)
+    finished = await ExecutionJob.filter(finished_at__gte=since).annotate(count=Count('id')) \
+        .group_by('status').values('status', 'count')
+
+    def percentile(p):
+        if not waits:
+            return 0.0
+        return round(waits[min(len(waits) - 1, int(len(waits) * p / 100))], 3)
+
+    return {
+        "queue_enabled": QUEUE_ENABLED,
+        "depth": sum(lane["queued"] for lane in lanes.values()),
+        "lanes": lanes,
+        "leased": leased,
+        "expired_leases": expired,
+        "window_minutes": window_minutes,
+        "wait": {
+            "count": len(waits),
+            "avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "max": round(waits[-1], 3) if waits else 0.0,
+        },
+        "finished": {row["status"]: row["count"] for row in finished},
+    }
@@ -29,6 +29,7 @@ class ApiCaseRun(Model):
     duration = fields.FloatField(null=True, description="执行时长（秒）")
     logs = fields.JSONField(null=True, description="执行日志列表")
     api_requests_info = fields.JSONField(null=True, description="接口请求信息列表")
+    fingerprint = fields.CharField(max_length=80, null=True, description="执行时的用例指纹（用例定义:接口定义）")
     created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
     # 执行结果 success  failed error
     status = fields.CharField(max_length=20, null=True, description="执行结果")
@@ -73,6 +74,8 @@ class TestSuiteRun(Model):
     start_time = fields.DatetimeField(null=True, description="套件执行开始时间")
     end_time = fields.DatetimeField(null=True, description="套件执行结束时间")
     duration = fields.FloatField(null=True, description="执行时长（秒）")
+    execution_plan = fields.JSONField(null=True,
+                                      description="执行计划 {nodes: [{index, case_id, depends_on, inputs, outputs, level}], levels, max_parallelism}")
     created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
     updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
 
@@ -109,9 +112,47 @@ class TestTaskRun(Model):
     start_time = fields.DatetimeField(null=True, description="任务执行开始时间")
     end_time = fields.DatetimeField(null=True, description="任务执行结束时间")
     duration = fields.FloatField(null=True, description="执行时长（秒）")
+    run_mode = fields.CharField(max_length=20, default='full', description="执行模式 full=全量 changed=只执行有变化的用例")
+    selection = fields.JSONField(null=True, description="增量执行的用例选择结果 {total_cases, selected_cases, reasons, cases}")
     created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
     updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
 
     class Meta:
         table = "test_task_run"
         table_description = "API测试任务运行记录表"
+
+
+class ExecutionJob(Model):
+    """测试执行队列表(由执行工作进程租用执行)"""
+    id = fields.IntField(pk=True, description="主键ID")
+    job_type = fields.CharField(max_length=50, description="任务类型: task_background/task_run")
+    lane = fields.CharField(max_length=20, default='manual', description="优先级通道: debug/manual/ci/scheduled")
+    priority = fields.IntField(default=10, description="优先级(数字越小越先执行)")
+    payload = fields.JSONField(description="任务参数")
+    project_id = fields.IntField(null=True, description="所属项目ID")
+    task_run_id = fields.IntField(null=True, description="关联的任务运行记录ID")
+    status = fields.CharField(
+        max_length=20,
+        choices=[
+            ('queued', 'Queued'),
+            ('leased', 'Leased'),
+            ('completed', 'Completed'),
+            ('failed', 'Failed')
+        ],
+        default='queued',
+        description="队列状态"
+    )
+    attempts = fields.IntField(default=0, description="已租用次数")
+    max_attempts = fields.IntField(default=3, description="最大租用次数")
+    lease_owner = fields.CharField(max_length=100, null=True, description="租用的工作进程")
+    lease_expires_at = fields.DatetimeField(null=True, description="租约到期时间")
+    started_at = fields.DatetimeField(null=True, description="首次开始执行时间")
+    finished_at = fields.DatetimeField(null=True, description="执行结束时间")
+    error = fields.TextField(null=True, description="失败原因")
+    created_at = fields.DatetimeField(auto_now_add=True, description="入队时间")
+    updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
+
+    class Meta:
+        table = "execution_job"
+        table_description = "测试执行队列表"
+        indexes = (("status", "priority", "id"),)
@@ -0,0 +1,190 @@
+"""
+测试执行模块 - 用例结果批量写入
+任务执行过程中每条用例的结果先进入内存缓冲, 按数量或时间阈值批量 INSERT 到 ApiCaseRun,
+每次写入后同步刷新套件/任务运行记录上的统计数, 状态查询接口可以看到实时进度
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from api_case_run.core.test_result import TestResult
+from service.test_execution.models import ApiCaseRun, TestSuiteRun, TestTaskRun
+
+logger = logging.getLogger(__name__)
+
+
+def _new_counts() -> dict:
+    return {"passed": 0, "failed": 0, "skipped": 0, "error": 0}
+
+
+class CaseResultSink:
+    """
+    单次任务执行的用例结果写入器
+    用法:
+        async with CaseResultSink(task_run_id) as sink:
+            sink.start_suite(suite_run.id)
+            await executor.execute_test_suite(suite_data, on_result=sink.add)
+    """
+
+    def __init__(self, task_run_id: Optional[int] = None, batch_size: int = 50, flush_interval: float = 2.0,
+                 fingerprints: Optional[Dict[int, str]] = None):
+        self.task_run_id = task_run_id
+        # 用例ID -> 用例指纹, 随执行结果保存, 增量执行时与之比较
+        self.fingerprints = fingerprints or {}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[ApiCaseRun] = []
+        # 已写入数据库的用例统计(按套件运行记录ID)
+        self.suite_counts: Dict[int, dict] = {}
+        self.task_counts = _new_counts()
+        # 缓冲中尚未写入的用例统计
+        self._pending: Dict[int, dict] = {}
+        self._dirty_suites = set()
+        self._suite_run_id: Optional[int] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_flush_at = time.monotonic()
+        # 统计信息
+        self.written = 0
+        self.failed_batches = 0
+
+    def restore(self, suite_runs: List[TestSuiteRun]):
+        """恢复执行时, 把已完成套件的用例统计计入任务统计"""
+        for suite_run in suite_runs:
+            self.task_counts["passed"] += suite_run.passed_cases
+            self.task_counts["failed"] += suite_run.failed_cases
+            self.task_counts["skipped"] += suite_run.skipped_cases
+            self.task_counts["error"] += suite_run.error_cases
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def start_suite(self, suite_run_id: int, skipped: int = 0):
+        """
+        开始一个套件, 之后 add 的结果都记录到该套件运行记录下
+        :param skipped: 执行前已确定跳过的用例数(如已删除的用例)
+        """
+        self._suite_run_id = suite_run_id
+        self.suite_counts.setdefault(suite_run_id, _new_counts())
+        if skipped:
+            self._count(suite_run_id, "skip", skipped)
+
+    def suite_summary(self, suite_run_id: int) -> dict:
+        """套件的用例统计(包括尚未写入的结果)"""
+        counts = dict(self.suite_counts.get(suite_run_id) or _new_counts())
+        for key, value in (self._pending.get(suite_run_id) or {}).items():
+            counts[key] += value
+        return counts
+
+    async def add(self, result: TestResult):
+        """保存一条用例结果(作为执行器的 on_result 回调), 达到批量大小时立即写入"""
+        self._buffer.append(ApiCaseRun(
+            suite_run_id=self._suite_run_id,
+            api_case_id=result.case_id,
+            case_name=result.case_name,
+            status=result.status,
+            error_message=result.error_message,
+            traceback=result.traceback,
+            start_time=datetime.fromtimestamp(result.start_time) if result.start_time else None,
+            end_time=datetime.fromtimestamp(result.end_time) if result.end_time else None,
+            duration=result.duration,
+            logs=result.logs,
+            api_requests_info=getattr(result, 'api_requests_info', None),
+            fingerprint=self.fingerprints.get(result.case_id),
+        ))
+        self._count(self._suite_run_id, result.status)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """写出缓冲中的全部结果并刷新统计数"""
+        async with self._lock:
+            self._last_flush_at = time.monotonic()
+            batch, pending = self._buffer, self._pending
+            self._buffer, self._pending = [], {}
+            if batch:
+                try:
+                    await ApiCaseRun.bulk_create(batch)
+                except Exception as e:
+                    self.failed_batches += 1
+                    logger.error(f"用例执行结果批量写入失败({len(batch)}条): {e}")
+                    # 放回缓冲, 下次写入时重试
+                    self._buffer[:0] = batch
+                    for suite_run_id, counts in pending.items():
+                        for key, value in counts.items():
+                            self._pending.setdefault(suite_run_id, _new_counts())[key] += value
+                    return
+                self.written += len(batch)
+            for suite_run_id, counts in pending.items():
+                for key, value in counts.items():
+                    self.suite_counts.setdefault(suite_run_id, _new_counts())[key] += value
+                    self.task_counts[key] += value
+                self._dirty_suites.add(suite_run_id)
+            await self._update_counters()
+
+    async def close(self):
+        """停止定时写入并写出剩余结果"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def _count(self, suite_run_id: int, status: str, number: int = 1):
+        key = {"success": "passed", "failed": "failed", "skip": "skipped"}.get(status, "error")
+        self._pending.setdefault(suite_run_id, _new_counts())[key] += number
+
+    async def _update_counters(self):
+        """按已写入的结果刷新套件/任务运行记录上的统计数"""
+        if not self._dirty_suites:
+            return
+        try:
+            for suite_run_id in self._dirty_suites:
+                counts = self.suite_counts[suite_run_id]
+                await TestSuiteRun.filter(id=suite_run_id).update(
+                    passed_cases=counts["passed"],
+                    failed_cases=counts["failed"],
+                    skipped_cases=counts["skipped"],
+                    error_cases=counts["error"],
+                )
+            if self.task_run_id is not None:
+                # 任务记录没有单独的错误数, 执行出错的用例计入失败数
+                await TestTaskRun.filter(id=self.task_run_id).update(
+                    passed_cases=self.task_counts["passed"],
+                    failed_cases=self.task_counts["failed"] + self.task_counts["error"],
+                    skipped_cases=self.task_counts["skipped"],
+                )
+        except Exception as e:
+            logger.error(f"刷新执行进度失败: {e}")
+            return
+        self._dirty_suites.clear()
+
+    async def _run(self):
+        """定时写入: 用例执行较慢时也能按时间间隔看到进度"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if time.monotonic() - self._last_flush_at >= self.flush_interval:
+                await self.flush()
+
+
+async def restore_task_run(task_run_id: int) -> Dict[int, TestSuiteRun]:
+    """
+    恢复中断的任务运行(执行队列租约过期后由其它工作进程继续执行)
+    已结束的套件运行记录保留, 未结束的套件运行记录连同其用例结果删除后重新执行
+    :return: {套件ID: 已结束的套件运行记录}
+    """
+    finished = {}
+    for suite_run in await TestSuiteRun.filter(run_task_id=task_run_id):
+        if suite_run.status in ('pending', 'running'):
+            await suite_run.delete()
+        else:
+            finished[suite_run.suite_id] = suite_run
+    return finished
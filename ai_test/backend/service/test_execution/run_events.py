@@ -0,0 +1,135 @@
+"""
+测试执行模块 - 任务执行事件广播
+后台执行的任务把每条用例的开始/结束事件发布到内存中的任务运行频道,
+SSE 订阅者加入时先收到当前状态的快照, 之后只接收增量事件
+    - 频道只保存统计数、正在执行的用例和最近结束的若干条用例, 内存占用与用例总数无关
+    - 订阅者消费过慢导致事件被丢弃时, 重新下发一次快照
+"""
+import time
+from collections import deque
+from typing import Dict, Optional, Set, Tuple
+from utils.subscription import Subscription
+
+# 快照中保留的最近结束的用例条数
+RECENT_SIZE = 20
+
+
+def _case_key(event: Dict) -> str:
+    return f"{event.get('suite_id')}:{event.get('index')}"
+
+
+class RunChannel:
+    """单个任务运行的频道: 维护可随时生成快照的精简状态"""
+
+    def __init__(self, task_run_id: int):
+        self.task_run_id = task_run_id
+        self.seq = 0
+        self.status = "running"
+        self.total_suites = 0
+        self.total_cases = 0
+        self.counts = {"passed": 0, "failed": 0, "skipped": 0, "error": 0}
+        self.suite: Optional[Dict] = None
+        self.running: Dict[str, Dict] = {}
+        self.recent = deque(maxlen=RECENT_SIZE)
+        self.subscribers: Set[Subscription] = set()
+        self.started_at = time.time()
+
+    def apply(self, event: Dict):
+        """把事件合并到频道状态"""
+        event_type = event["type"]
+        if event_type == "run_started":
+            self.total_suites = event.get("total_suites", 0)
+            self.total_cases = event.get("total_cases", 0)
+        elif event_type == "suite_started":
+            self.suite = {k: event.get(k) for k in ("suite_id", "suite_run_id", "name", "total_cases")}
+            # 执行前已确定跳过的用例(如已删除的用例)
+            self.counts["skipped"] += event.get("skipped", 0)
+        elif event_type == "case_started":
+            self.running[_case_key(event)] = {k: event.get(k) for k in ("suite_id", "case_id", "name", "time")}
+        elif event_type == "case_finished":
+            self.running.pop(_case_key(event), None)
+            key = {"success": "passed", "failed": "failed", "skip": "skipped"}.get(event.get("status"), "error")
+            self.counts[key] += 1
+            self.recent.append({k: event.get(k) for k in ("suite_id", "case_id", "name", "status", "duration")})
+        elif event_type == "suite_finished":
+            self.suite = None
+        elif event_type == "run_finished":
+            self.status = event.get("status", "completed")
+            self.running.clear()
+
+    def snapshot(self) -> Dict:
+        return {
+            "type": "snapshot",
+            "seq": self.seq,
+            "task_run_id": self.task_run_id,
+            "status": self.status,
+            "total_suites": self.total_suites,
+            "total_cases": self.total_cases,
+            "finished_cases": sum(self.counts.values()),
+            "counts": dict(self.counts),
+            "suite": self.suite,
+            "running": list(self.running.values()),
+            "recent": list(self.recent),
+            "elapsed": round(time.time() - self.started_at, 3),
+        }
+
+
+class RunEventHub:
+    """按任务运行记录划分的事件频道, 频道在任务开始执行时打开、结束时关闭"""
+
+    def __init__(self):
+        self._channels: Dict[int, RunChannel] = {}
+
+    def open(self, task_run_id: int):
+        self._channels.setdefault(task_run_id, RunChannel(task_run_id))
+
+    def is_open(self, task_run_id: int) -> bool:
+        return task_run_id in self._channels
+
+    def publish(self, task_run_id: int, event: Dict):
+        """发布事件(频道未打开时忽略)"""
+        channel = self._channels.get(task_run_id)
+        if channel is None:
+            return
+        channel.seq += 1
+        event = {**event, "seq": channel.seq}
+        event.setdefault("time", time.time())
+        channel.apply(event)
+        for sub in channel.subscribers:
+            sub.push(event)
+
+    def subscribe(self, task_run_id: int, maxsize: int = 500) -> Tuple[Optional[Subscription], Optional[Dict]]:
+        """
+        订阅频道, 返回 (订阅者, 当前快照); 快照之后的事件 seq 都大于快照的 seq
+        频道未打开(任务未在本进程运行)时返回 (None, None)
+        """
+        channel = self._channels.get(task_run_id)
+        if channel is None:
+            return None, None
+        sub = Subscription(maxsize)
+        channel.subscribers.add(sub)
+        return sub, channel.snapshot()
+
+    def snapshot(self, task_run_id: int) -> Optional[Dict]:
+        channel = self._channels.get(task_run_id)
+        return channel.snapshot() if channel is not None else None
+
+    def unsubscribe(self, task_run_id: int, sub: Subscription):
+        channel = self._channels.get(task_run_id)
+        if channel is not None:
+            channel.subscribers.discard(sub)
+
+    def close(self, task_run_id: int):
+        """关闭频道并通知全部订阅者任务已结束"""
+        channel = self._channels.pop(task_run_id, None)
+        if channel is not None:
+            for sub in channel.subscribers:
+                sub.close()
+
+    def subscriber_count(self, task_run_id: int) -> int:
+        channel = self._channels.get(task_run_id)
+        return len(channel.subscribers) if channel is not None else 0
+
+
+# 进程内共享的事件广播实例
+run_event_hub = RunEventHub()
@@ -106,6 +106,10 @@ class RunTestTaskBackgroundRequest(BaseModel):
     """后台运行测试任务请求模型"""
     task_id: int = Field(..., description="测试任务ID")
     environment_id: int = Field(..., description="测试环境ID")
+    lane: str = Field("manual", pattern="^(debug|manual)$",
+                      description="执行队列优先级通道：debug(调试，优先执行)/manual(手动)")
+    run_mode: str = Field("full", pattern="^(full|changed)$",
+                          description="执行模式：full(全量)/changed(只执行有变化或上次失败的用例)")
 
     class Config:
         from_attributes = True
@@ -234,6 +238,7 @@ class TestSuiteRunDetailResponse(BaseModel):
     start_time: Optional[datetime] = Field(None, description="套件执行开始时间")
     end_time: Optional[datetime] = Field(None, description="套件执行结束时间")
     duration: Optional[float] = Field(None, description="执行时长（秒）")
+    execution_plan: Optional[dict] = Field(None, description="用例依赖图执行计划")
     created_at: datetime = Field(..., description="创建时间")
     updated_at: datetime = Field(..., description="更新时间")
     case_runs: List[ApiCaseRunListItem] = Field(..., description="用例运行记录列表")
@@ -288,6 +293,8 @@ class TestTaskRunDetailResponse(BaseModel):
     start_time: Optional[datetime] = Field(None, description="任务执行开始时间")
     end_time: Optional[datetime] = Field(None, description="任务执行结束时间")
     duration: Optional[float] = Field(None, description="执行时长（秒）")
+    run_mode: str = Field("full", description="执行模式 full/changed")
+    selection: Optional[Dict[str, Any]] = Field(None, description="增量执行的用例选择结果及原因")
     created_at: datetime = Field(..., description="创建时间")
     updated_at: datetime = Field(..., description="更新时间")
     suite_runs: List[TestSuiteRunListItem] = Field(..., description="套件运行记录列表")
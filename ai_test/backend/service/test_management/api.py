@@ -62,6 +62,7 @@ async def create_test_suite(
             suite_name=suite_data.suite_name,
             description=suite_data.description,
             type=suite_data.type,
+            concurrency=suite_data.concurrency,
             project_id=project_id
         )
 
@@ -70,6 +71,7 @@ async def create_test_suite(
             suite_name=test_suite.suite_name,
             description=test_suite.description,
             type=test_suite.type,
+            concurrency=test_suite.concurrency,
             project_id=project_id,
             created_at=test_suite.created_at,
             updated_at=test_suite.updated_at
@@ -178,6 +180,7 @@ async def get_test_suites(
                 suite_name=suite.suite_name,
                 description=suite.description,
                 type=suite.type,
+                concurrency=suite.concurrency,
                 project_id=suite.project_id,
                 created_at=suite.created_at,
                 updated_at=suite.updated_at
@@ -251,6 +254,7 @@ async def get_test_suite_detail(
             suite_name=suite.suite_name,
             description=suite.description,
             type=suite.type,
+            concurrency=suite.concurrency,
             project_id=project.id,
             created_at=suite.created_at,
             updated_at=suite.updated_at,
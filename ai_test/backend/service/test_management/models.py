@@ -56,6 +56,7 @@ class TestSuite(Model):
         choices=[('api', 'API'), ('ui', 'UI')],
         description="套件类型（接口 / UI）"
     )
+    concurrency = fields.IntField(default=5, description="套件内用例的最大并发数（共享变量的用例仍按顺序执行）")
     created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
     updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
 
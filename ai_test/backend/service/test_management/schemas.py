@@ -11,6 +11,7 @@ class TestSuiteCreateRequest(BaseModel):
     suite_name: str = Field(..., min_length=1, max_length=100, description="套件名称")
     description: Optional[str] = Field(None, max_length=500, description="套件描述")
     type: str = Field(..., description="套件类型：api/ui")
+    concurrency: int = Field(5, ge=1, le=50, description="套件内用例的最大并发数")
 
     class Config:
         from_attributes = True
@@ -30,6 +31,7 @@ class TestSuiteResponse(BaseModel):
     suite_name: str = Field(..., description="套件名称")
     description: Optional[str] = Field(None, description="套件描述")
     type: str = Field(..., description="套件类型")
+    concurrency: int = Field(5, description="套件内用例的最大并发数")
     project_id: int = Field(..., description="所属项目ID")
     created_at: datetime = Field(..., description="创建时间")
     updated_at: datetime = Field(..., description="更新时间")
@@ -67,6 +69,7 @@ class TestSuiteDetailResponse(BaseModel):
     suite_name: str = Field(..., description="套件名称")
     description: Optional[str] = Field(None, description="套件描述")
     type: str = Field(..., description="套件类型")
+    concurrency: int = Field(5, description="套件内用例的最大并发数")
     project_id: int = Field(..., description="所属项目ID")
     created_at: datetime = Field(..., description="创建时间")
     updated_at: datetime = Field(..., description="更新时间")
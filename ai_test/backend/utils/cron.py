@@ -0,0 +1,142 @@
+"""
+Cron 表达式解析 - 标准5段格式: 分 时 日 月 周
+    - 支持 *、数值、范围(1-5)、步长(*/15、10-50/10)、列表(1,3,5)、月份/星期英文缩写(JAN、MON)、? (同 *)
+    - 星期 0 和 7 都表示周日
+    - 日和周都不以 * 开头时按“或”匹配, 否则按“且”匹配(与 crontab 一致, 如 0 0 */2 * MON 为奇数日且为周一)
+    - 支持 @yearly/@annually/@monthly/@weekly/@daily/@midnight/@hourly
+时间按本地时间(naive datetime)计算
+"""
+import calendar
+from datetime import datetime, timedelta
+from typing import Iterator, List, Set
+
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+MONTH_NAMES = {name: i for i, name in enumerate(
+    ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"], start=1)}
+WEEKDAY_NAMES = {name: i for i, name in enumerate(["SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"])}
+# 字段名称 -> (最小值, 最大值, 名称映射)
+FIELDS = [
+    ("分钟", 0, 59, {}),
+    ("小时", 0, 23, {}),
+    ("日", 1, 31, {}),
+    ("月", 1, 12, MONTH_NAMES),
+    ("星期", 0, 7, WEEKDAY_NAMES),
+]
+# 查找下次执行时间时最多向后搜索的年数(如 2月30日 这种永远不会执行的表达式)
+MAX_SEARCH_YEARS = 5
+
+
+def _parse_value(token: str, names: dict, field: str) -> int:
+    token = token.upper()
+    if token in names:
+        return names[token]
+    if not token.isdigit():
+        raise ValueError(f"{field}字段的值无效: {token}")
+    return int(token)
+
+
+def _parse_field(expr: str, field: str, low: int, high: int, names: dict) -> Set[int]:
+    values = set()
+    for part in expr.split(","):
+        if not part:
+            raise ValueError(f"{field}字段格式错误: {expr}")
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/", 1)
+            if not step_str.isdigit() or int(step_str) == 0:
+                raise ValueError(f"{field}字段的步长无效: {step_str}")
+            step = int(step_str)
+        if part in ("*", "?"):
+            start, end = low, high
+        elif "-" in part:
+            start_str, end_str = part.split("-", 1)
+            start, end = _parse_value(start_str, names, field), _parse_value(end_str, names, field)
+        else:
+            start = _parse_value(part, names, field)
+            # 10/5 表示从10开始每5个单位
+            end = high if step > 1 else start
+        if not (low <= start <= high and low <= end <= high) or start > end:
+            raise ValueError(f"{field}字段超出范围({low}-{high}): {part}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """解析后的 Cron 表达式"""
+
+    def __init__(self, expression: str):
+        self.expression = expression.strip()
+        source = MACROS.get(self.expression.lower(), self.expression)
+        parts = source.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron表达式需要5个字段(分 时 日 月 周): {expression}")
+        parsed = [_parse_field(part, *field) for part, field in zip(parts, FIELDS)]
+        self.minutes: List[int] = sorted(parsed[0])
+        self.hours: List[int] = sorted(parsed[1])
+        self.days: Set[int] = parsed[2]
+        self.months: Set[int] = parsed[3]
+        # 统一为 0=周日 ... 6=周六
+        self.weekdays: Set[int] = {w % 7 for w in parsed[4]}
+        # 与 crontab 一致: 以 * 开头的字段(包括 */2 这类带步长的)视为不限制, 日和周按“且”匹配
+        self.day_any = parts[2].startswith(("*", "?"))
+        self.weekday_any = parts[4].startswith(("*", "?"))
+        self._check_reachable()
+
+    def _check_reachable(self):
+        """日和月的组合必须存在(如 2月30日 永远不会执行)"""
+        if not self.day_any and self.weekday_any:
+            if not any(day <= (29 if month == 2 else calendar.monthrange(2001, month)[1])
+                       for month in self.months for day in self.days):
+                raise ValueError(f"Cron表达式没有可执行的时间: {self.expression}")
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        # datetime.weekday(): 0=周一, 转换为 0=周日
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.day_any or self.weekday_any:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, dt: datetime) -> datetime:
+        """返回严格晚于 dt 的下一次执行时间"""
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt.year + MAX_SEARCH_YEARS
+        while t.year <= limit:
+            if t.month not in self.months:
+                # 跳到下个月1日 00:00
+                t = (t.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if t.hour not in self.hours:
+                next_hour = next((h for h in self.hours if h > t.hour), None)
+                if next_hour is None:
+                    t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+                else:
+                    t = t.replace(hour=next_hour, minute=0)
+                continue
+            next_minute = next((m for m in self.minutes if m >= t.minute), None)
+            if next_minute is None:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+                continue
+            return t.replace(minute=next_minute)
+        raise ValueError(f"Cron表达式在{MAX_SEARCH_YEARS}年内没有可执行的时间: {self.expression}")
+
+    def iter_between(self, start: datetime, end: datetime) -> Iterator[datetime]:
+        """依次返回 (start, end] 之间的执行时间"""
+        t = self.next_after(start)
+        while t <= end:
+            yield t
+            t = self.next_after(t)
+
+    def __repr__(self):
+        return f"CronExpression({self.expression!r})"
@@ -0,0 +1,170 @@
+"""
+分布式压测节点(agent)
+- 启动后监听控制端口, 并定期向后端注册/心跳
+- 收到 START 帧后以分片配置运行 StressEngine, 每秒回传二进制窗口帧, 结束时回传最终聚合状态
+- 一个节点同一时间只执行一个分片
+
+启动: STRESS_AGENT_TOKEN=xxx python -m utils.stress_agent --host 0.0.0.0 --port 9100 --backend http://127.0.0.1:8000
+    后端和节点需要配置相同的 STRESS_AGENT_TOKEN: 后端未配置时拒绝节点注册, 节点未配置时拒绝启动;
+    START 帧中的令牌不一致时节点拒绝执行, 避免被任意连接方用作发压代理
+    默认只监听 127.0.0.1, 需要后端跨主机连接时通过 --host 指定监听地址
+"""
+import argparse
+import asyncio
+import hmac
+import logging
+import os
+import socket
+import uuid
+from typing import Optional
+import aiohttp
+from utils import stress_protocol
+from utils.stress_engine import StressEngine
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 10  # 秒
+
+
+class StressAgent:
+    """压测节点"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 9100,
+        backend_url: Optional[str] = None,
+        advertise_host: Optional[str] = None,
+        processes: int = 1,
+        token: Optional[str] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.backend_url = backend_url.rstrip("/") if backend_url else None
+        self.advertise_host = advertise_host or socket.gethostname()
+        self.processes = processes
+        self.token = token
+        self.agent_id = f"{self.advertise_host}:{port}-{uuid.uuid4().hex[:6]}"
+        self._engine: Optional[StressEngine] = None
+
+    @property
+    def busy(self) -> bool:
+        return self._engine is not None
+
+    async def serve(self):
+        if not self.token:
+            raise RuntimeError("未配置 STRESS_AGENT_TOKEN，拒绝启动压测节点")
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"压测节点已启动: {self.agent_id}, 监听 {self.host}:{self.port}")
+        heartbeat = asyncio.create_task(self._heartbeat()) if self.backend_url else None
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if heartbeat:
+                heartbeat.cancel()
+
+    async def _heartbeat(self):
+        """定期向后端注册, 后端据此维护在线节点列表"""
+        headers = {"X-Agent-Token": self.token} if self.token else {}
+        payload = {
+            "agent_id": self.agent_id,
+            "host": self.advertise_host,
+            "port": self.port,
+            "cpu_count": os.cpu_count() or 1,
+            "processes": self.processes,
+        }
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+            while True:
+                try:
+                    payload["busy"] = self.busy
+                    async with session.post(
+                        f"{self.backend_url}/stress-test/agents/register", json=payload, headers=headers
+                    ) as resp:
+                        if resp.status != 200:
+                            logger.warning(f"节点注册失败: HTTP {resp.status}")
+                except Exception as e:
+                    logger.warning(f"节点注册失败: {e}")
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """单个控制连接: START -> (WINDOW)* -> FINAL/ERROR"""
+        try:
+            frame_type, payload = await stress_protocol.read_frame(reader)
+            if frame_type != stress_protocol.FRAME_START:
+                return
+            config = stress_protocol.decode_json(payload)
+            token = str(config.pop("token", None) or "")
+            if not self.token or not hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8")):
+                peer = writer.get_extra_info("peername")
+                logger.warning(f"拒绝来自 {peer} 的压测请求: 令牌无效")
+                writer.write(stress_protocol.pack_frame(stress_protocol.FRAME_ERROR, "令牌无效".encode("utf-8")))
+                await writer.drain()
+                return
+            if self.busy:
+                writer.write(stress_protocol.pack_frame(stress_protocol.FRAME_ERROR, "节点忙".encode("utf-8")))
+                await writer.drain()
+                return
+            config["processes"] = self.processes
+            engine = StressEngine(**config)
+            engine._frame_sink = lambda frame: writer.write(stress_protocol.pack_frame(
+                stress_protocol.FRAME_WINDOW, stress_protocol.encode_window(frame)
+            ))
+            self._engine = engine
+
+            async def watch_control():
+                # 协调者发送 STOP 或断开连接时停止本分片
+                try:
+                    while True:
+                        ctrl_type, _ = await stress_protocol.read_frame(reader)
+                        if ctrl_type == stress_protocol.FRAME_STOP:
+                            break
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    pass
+                engine.stop()
+
+            watcher = asyncio.create_task(watch_control())
+            try:
+                await engine.run()
+            except Exception as e:
+                logger.error(f"分片执行失败: {e}")
+                writer.write(stress_protocol.pack_frame(stress_protocol.FRAME_ERROR, str(e).encode("utf-8")))
+            else:
+                writer.write(stress_protocol.pack_frame(
+                    stress_protocol.FRAME_FINAL, stress_protocol.encode_json(engine.export_state())
+                ))
+            finally:
+                watcher.cancel()
+                self._engine = None
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            logger.warning(f"控制连接中断: {e}")
+        finally:
+            writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分布式压测节点")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址(默认仅本机, 跨主机压测时指定如 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=9100, help="控制端口")
+    parser.add_argument("--backend", default=os.getenv("STRESS_BACKEND_URL"), help="后端地址, 不填则不注册")
+    parser.add_argument("--advertise-host", default=None, help="注册到后端展示的主机名(后端按请求来源地址连接本节点)")
+    parser.add_argument("--processes", type=int, default=1, help="本节点发压进程数(0=按CPU核数)")
+    args = parser.parse_args()
+    if not os.getenv("STRESS_AGENT_TOKEN"):
+        parser.error("未配置 STRESS_AGENT_TOKEN，拒绝启动压测节点")
+
+    logging.basicConfig(level=logging.INFO)
+    agent = StressAgent(
+        host=args.host,
+        port=args.port,
+        backend_url=args.backend,
+        advertise_host=args.advertise_host,
+        processes=args.processes,
+        token=os.getenv("STRESS_AGENT_TOKEN"),
+    )
+    asyncio.run(agent.serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -127,7 +127,7 @@ async def ai_recommend_config(
 请返回JSON格式：
 ```json
 {{
-    "load_type": "constant/ramp_up/spike/soak",
+    "load_type": "constant/ramp_up/spike/soak/arrival_rate/capacity_search",
     "load_type_reason": "选择此负载类型的原因",
     "concurrency": 并发用户数,
     "concurrency_reason": "并发数设置依据",
@@ -1,18 +1,44 @@
 """
 压力测试引擎 - 基于 asyncio + aiohttp 实现高并发压测
 支持多种负载模型: 恒定(constant), 梯度加压(ramp_up), 尖峰(spike), 耐久(soak)
+以及开放模型: 固定到达率(arrival_rate), 按 target_rps 调度发送, 不受服务端变慢影响
+容量探测(capacity_search): 逐级(或倍增+二分)提升到达率, 每级按 SLO 阈值判定, 输出吞吐/延迟曲线与饱和点
+阶段编排(staged): 按声明式阶段列表在用户数(或RPS)之间平滑过渡, 减少用户时在迭代边界退出虚拟用户
+可选多进程模式: 协调者将并发与目标RPS拆分到 N 个子进程, 汇总各进程的秒级窗口与最终直方图
+可选分布式模式: 同样的拆分与汇总, 分片通过控制协议(utils/stress_protocol)下发到远程压测节点
 """
 import asyncio
+import multiprocessing
+import os
+import queue
+import random
 import time
 import statistics
 import logging
-from typing import List, Dict, Any, Optional, Callable
+from typing import List, Dict, Any, Optional, Callable, Tuple, Union
 from dataclasses import dataclass, field
 import aiohttp
-import json
+from utils import stress_protocol
+from utils.stress_protocol import PHASE_NAMES
+from utils.stress_metrics import LatencyHistogram, RequestStats, MetricWindow
+from utils.stress_samples import SampleRecorder, write_sample_meta
+from utils.stress_template import AliasTable, CompiledRequest, compile_apis
 
 logger = logging.getLogger(__name__)
 
+# 传输层配置(场景级), 未设置的项取默认值
+# aiohttp 不支持 HTTP/1.1 管线化, 连接复用程度通过连接池上限与空闲保持时间控制
+DEFAULT_TRANSPORT_PROFILE = {
+    "keep_alive": True,             # False: 每个请求新建连接(请求结束即关闭)
+    "max_connections": 0,           # 连接池总上限, 0=并发数*2
+    "max_connections_per_host": 0,  # 单主机连接上限, 0=不限制
+    "keepalive_timeout": 15,        # 空闲连接保持时间(秒)
+    "dns_cache_ttl": 10,            # DNS缓存有效期(秒), 0=不缓存(每次新建连接都解析)
+    "discard_body": False,          # 流式读取并只计字节数, 不缓存响应体(链路提取仍读取完整响应体)
+}
+DISCARD_CHUNK_SIZE = 64 * 1024
+STAGE_TICK = 0.2  # 阶段控制器调整用户数/RPS的间隔(秒)
+
 
 @dataclass
 class RequestResult:
@@ -25,6 +51,11 @@ class RequestResult:
     success: bool
     error: Optional[str] = None
     timestamp: float = 0
+    body: Optional[bytes] = None  # 仅在需要执行提取规则时保留响应体
+    connect_time: float = 0  # ms, 新建连接耗时(含DNS/TLS), 复用连接为0
+    ttfb: float = 0  # ms, 从实际发出到收到响应头
+    new_connection: bool = False
+    phases: Optional[Dict[str, float]] = None  # 阶段耗时(ms), 仅开启阶段追踪时记录
 
 
 @dataclass
@@ -36,6 +67,10 @@ class MetricSnapshot:
     avg_response_time: float
     error_count: int
     active_connections: int
+    p95_response_time: float = 0
+    p99_response_time: float = 0
+    phases: Optional[Dict[str, float]] = None  # 本秒各阶段平均耗时(ms), 仅开启阶段追踪时有值
+    stage: Optional[Dict] = None  # 阶段编排的当前阶段 {index, name, target}
 
 
 @dataclass
@@ -57,6 +92,16 @@ class StressTestReport:
     api_details: list = field(default_factory=list)
     error_distribution: dict = field(default_factory=dict)
     duration: float = 0
+    # 开放模型(arrival_rate)专用
+    dropped_requests: int = 0  # 在途请求达到上限而丢弃的调度数
+    late_requests: int = 0     # 实际发出时间晚于计划时间的请求数
+    # 容量探测(capacity_search)专用
+    capacity_curve: list = field(default_factory=list)  # 每级到达率的吞吐/延迟/判定结果
+    saturation_point: Optional[dict] = None  # 最大可持续RPS与首次突破SLO的级别
+    # 传输层: 使用的传输配置、新建连接数/复用率、建连耗时与TTFB分布
+    transport: dict = field(default_factory=dict)
+    # 阶段耗时分布 {阶段: {count, avg, p50, p95, p99, max}}, 仅开启阶段追踪时有值
+    phase_breakdown: dict = field(default_factory=dict)
 
 
 class StressEngine:
@@ -65,56 +110,142 @@ class StressEngine:
     def __init__(
         self,
         target_apis: List[Dict],
+        scenario_type: str = "single_api",
         concurrency: int = 10,
         duration: int = 60,
         load_type: str = "constant",
         ramp_up_time: int = 0,
         ramp_up_steps: int = 1,
         target_rps: int = 0,
+        arrival_distribution: str = "constant",
         think_time: int = 0,
+        think_time_distribution: str = "constant",
+        think_time_spread: int = 0,
+        pacing: int = 0,
         timeout: int = 30,
         parameter_data: Optional[List[Dict]] = None,
         parameter_strategy: str = "sequential",
+        processes: int = 1,  # 发压进程数(1=当前进程内运行, 0=按CPU核数)
+        agents: Optional[List[str]] = None,  # 分布式压测节点地址 ["host:port"]
+        sample_dir: Optional[str] = None,  # 原始样本落盘目录(按任务), None=不记录
+        capacity_config: Optional[Dict] = None,  # 容量探测配置 {strategy, start_rps, step_rps, hold_seconds, min_samples}
+        slo_thresholds: Optional[Dict] = None,  # 容量探测的SLO阈值(取自性能基线) {p99_rt_max, error_rate_max, avg_rt_max}
+        transport_profile: Optional[Dict] = None,  # 传输层配置, 见 DEFAULT_TRANSPORT_PROFILE
+        trace_phases: bool = False,  # 记录每个请求的 排队/DNS/建连/发送/TTFB/传输 阶段耗时
+        stages: Optional[List[Dict]] = None,  # 阶段列表 [{duration, target_users|target_rps, mode: linear/step, name}]
         on_metric: Optional[Callable] = None,  # 实时指标回调
         on_anomaly: Optional[Callable] = None,  # 异常检测回调
     ):
         self.target_apis = target_apis
+        self.scenario_type = scenario_type  # single_api/multi_api/chain_api
         self.concurrency = concurrency
         self.duration = duration
         self.load_type = load_type
         self.ramp_up_time = ramp_up_time
         self.ramp_up_steps = ramp_up_steps
         self.target_rps = target_rps
+        self.arrival_distribution = arrival_distribution  # constant/poisson
         self.think_time = think_time / 1000.0 if think_time else 0  # convert ms to sec
+        # 思考时间分布: constant/uniform(±spread)/normal(标准差spread)/exponential(均值think_time)
+        self.think_time_distribution = think_time_distribution
+        self.think_time_spread = think_time_spread / 1000.0 if think_time_spread else 0
+        # 节奏控制: 每次迭代固定间隔(秒), 与响应时间无关; 开启后迭代间不再叠加思考时间
+        self.pacing = pacing / 1000.0 if pacing else 0
         self.timeout = timeout
         self.parameter_data = parameter_data or []
-        self.parameter_strategy = parameter_strategy
+        self.parameter_strategy = parameter_strategy  # sequential/random/unique
+        self.processes = processes if processes > 0 else (os.cpu_count() or 1)
+        self.agents = agents or []
+        self.sample_dir = sample_dir
+        self.capacity_config = capacity_config or {}
+        self.slo_thresholds = slo_thresholds or {}
+        self.transport_profile = {**DEFAULT_TRANSPORT_PROFILE, **(transport_profile or {})}
+        self.trace_phases = trace_phases
+        # 阶段编排: 总时长为各阶段时长之和; 全部阶段使用同一种目标(用户数或RPS)
+        self.stages = stages or []
+        self._stage_key = "target_rps" if any("target_rps" in st for st in self.stages) else "target_users"
+        if load_type == "staged" and self.stages:
+            self.duration = sum(st.get("duration", 0) for st in self.stages)
         self.on_metric = on_metric
         self.on_anomaly = on_anomaly
 
         # 运行状态
         self._running = False
         self._stop_event = asyncio.Event()
-        self._results: List[RequestResult] = []
+        # 流式聚合: 全局 + 按接口, 内存为 O(接口数) 而非 O(请求数)
+        self._stats = RequestStats()
+        self._api_stats: Dict[str, RequestStats] = {}
+        # 链路场景的事务(整条链路一次迭代)统计, 不计入请求总数
+        self._transaction_stats = RequestStats()
+        # 秒级窗口环形缓冲区, 采集协程每秒轮转一次
+        self._window = MetricWindow()
         self._metrics: List[MetricSnapshot] = []
+        # 场景加载时预编译请求模板, 每次请求只做占位符拼接
+        self._compiled = compile_apis(target_apis)
+        # 任一接口设置了权重时按加权混合选择接口(别名表 O(1) 抽样), 否则保持轮询
+        self._alias: Optional[AliasTable] = None
+        # 原始样本记录: 接口分组键 -> 样本文件中的接口ID
+        self._api_ids: Dict[str, int] = {}
+        for c in self._compiled:
+            self._api_ids.setdefault(c.key, len(self._api_ids))
+        self._recorder: Optional[SampleRecorder] = None
+        if scenario_type != "chain_api" and any(c.weight is not None for c in self._compiled):
+            self._alias = AliasTable([max(0.0, float(c.weight or 0)) for c in self._compiled])
+        # 参数化数据的共享游标(单事件循环内读写, unique 策略下每行只会被取用一次)
         self._param_index = 0
         self._current_users = 0
         self._active_connections = 0
-        self._lock = asyncio.Lock()
+        self._dropped_requests = 0
+        self._late_requests = 0
+        # 阶段控制器要求退出的虚拟用户数, 由工作协程在迭代边界认领
+        self._retire_pending = 0
+        # 子进程模式下的窗口上报函数(由 _run_slice_process 设置)
+        self._frame_sink: Optional[Callable[[Dict], Any]] = None
+        # 多进程模式下的跨进程停止信号
+        self._process_stop = None
+        # 多进程/分布式模式下各分片的最新状态 {slice: (users, connections)} 与失败信息
+        self._slice_state: Dict[int, tuple] = {}
+        self._slice_errors: List[str] = []
+        # 容量探测: 当前级别的独立统计、各级结果与饱和点
+        self._level_stats: Optional[RequestStats] = None
+        self._capacity_curve: List[Dict] = []
+        self._saturation_point: Optional[Dict] = None
+        # 传输层统计: 建连耗时仅统计新建连接, TTFB 统计每个收到响应头的请求
+        self._connect_hist = LatencyHistogram()
+        self._ttfb_hist = LatencyHistogram()
+        self._new_connections = 0
+        # 阶段耗时直方图(仅开启阶段追踪时创建)
+        self._phase_hists: Dict[str, LatencyHistogram] = (
+            {name: LatencyHistogram() for name in PHASE_NAMES} if trace_phases else {}
+        )
 
         # 异常检测用
         self._recent_rt_values: List[float] = []
 
     async def run(self) -> StressTestReport:
         """执行压测"""
+        if self.load_type == "capacity_search":
+            # 逐级判定依赖完整的级别统计, 容量探测固定在当前进程内执行
+            if self.agents or min(self.processes, self.concurrency) > 1:
+                logger.info("容量探测在当前进程内执行, 忽略多进程/分布式配置")
+        elif self.agents:
+            return await self._run_distributed()
+        elif min(self.processes, self.concurrency) > 1:
+            return await self._run_multiprocess()
+
         self._running = True
         self._stop_event.clear()
         start_time = time.time()
+        if self.sample_dir:
+            if self._frame_sink is None:
+                write_sample_meta(self.sample_dir, list(self._api_ids), start_time)
+            self._recorder = SampleRecorder(self.sample_dir)
 
-        connector = aiohttp.TCPConnector(limit=self.concurrency * 2, force_close=False)
         timeout_config = aiohttp.ClientTimeout(total=self.timeout)
 
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout_config) as session:
+        async with aiohttp.ClientSession(
+            connector=self._build_connector(), timeout=timeout_config, trace_configs=self._trace_configs()
+        ) as session:
             # 启动指标采集
             metric_task = asyncio.create_task(self._collect_metrics(start_time))
 
@@ -126,6 +257,12 @@ class StressEngine:
                 await self._run_spike(session, start_time)
             elif self.load_type == "soak":
                 await self._run_constant(session, start_time)  # soak = long constant
+            elif self.load_type == "arrival_rate":
+                await self._run_arrival_rate(session, start_time)
+            elif self.load_type == "capacity_search":
+                await self._run_capacity_search(session, start_time)
+            elif self.load_type == "staged":
+                await self._run_staged(session, start_time)
 
             self._running = False
             metric_task.cancel()
@@ -134,13 +271,330 @@ class StressEngine:
             except asyncio.CancelledError:
                 pass
 
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
         total_duration = time.time() - start_time
         return self._generate_report(total_duration)
 
+    def _build_connector(self) -> aiohttp.TCPConnector:
+        """按传输配置创建连接池"""
+        profile = self.transport_profile
+        keep_alive = bool(profile["keep_alive"])
+        dns_ttl = profile["dns_cache_ttl"]
+        return aiohttp.TCPConnector(
+            limit=profile["max_connections"] or self.concurrency * 2,
+            limit_per_host=profile["max_connections_per_host"] or 0,
+            force_close=not keep_alive,
+            keepalive_timeout=profile["keepalive_timeout"] if keep_alive else None,
+            use_dns_cache=bool(dns_ttl),
+            ttl_dns_cache=dns_ttl or None,
+        )
+
+    def _trace_configs(self) -> List[aiohttp.TraceConfig]:
+        """
+        默认只挂载建连钩子: 复用连接时不触发, 对请求路径几乎无额外开销
+        开启阶段追踪时再挂载请求开始/排队/DNS/请求头发出钩子, 时间戳统一用 perf_counter_ns
+        """
+
+        async def on_create_start(session, ctx, params):
+            if ctx.trace_request_ctx is not None:
+                ctx.trace_request_ctx["connect_start"] = time.perf_counter_ns()
+
+        async def on_create_end(session, ctx, params):
+            timing = ctx.trace_request_ctx
+            if timing is not None and "connect_start" in timing:
+                timing["connect_end"] = time.perf_counter_ns()
+                timing["connect_time"] = (timing["connect_end"] - timing["connect_start"]) / 1e6
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_start.append(on_create_start)
+        trace.on_connection_create_end.append(on_create_end)
+        if not self.trace_phases:
+            return [trace]
+
+        def mark(key):
+            async def hook(session, ctx, params):
+                if ctx.trace_request_ctx is not None:
+                    ctx.trace_request_ctx[key] = time.perf_counter_ns()
+            return hook
+
+        trace.on_request_start.append(mark("request_start"))
+        trace.on_connection_queued_start.append(mark("queued_start"))
+        trace.on_connection_queued_end.append(mark("queued_end"))
+        trace.on_dns_resolvehost_start.append(mark("dns_start"))
+        trace.on_dns_resolvehost_end.append(mark("dns_end"))
+        trace.on_request_headers_sent.append(mark("headers_sent"))
+        return [trace]
+
+    @staticmethod
+    def _phase_timings(timing: Dict, headers_at: int, end_at: int) -> Dict[str, float]:
+        """
+        由钩子时间戳(ns)拆分请求阶段(ms):
+        queued 等待连接池 / dns 域名解析 / connect 建连(TCP+TLS, 不含DNS) /
+        send 连接就绪到请求头发出 / ttfb 请求头发出到收到响应头 / transfer 读取响应体
+        aiohttp 未提供 TLS 握手钩子, TLS 耗时计入 connect
+        """
+        start = timing.get("request_start", headers_at)
+        dns = timing["dns_end"] - timing["dns_start"] if "dns_end" in timing else 0
+        connect = timing["connect_end"] - timing["connect_start"] - dns if "connect_end" in timing else 0
+        queued = timing["queued_end"] - timing["queued_start"] if "queued_end" in timing else 0
+        ready = max(start, timing.get("queued_end", 0), timing.get("connect_end", 0))
+        sent = timing.get("headers_sent", ready)
+        return {
+            "queued": queued / 1e6,
+            "dns": dns / 1e6,
+            "connect": max(connect, 0) / 1e6,
+            "send": max(sent - ready, 0) / 1e6,
+            "ttfb": max(headers_at - sent, 0) / 1e6,
+            "transfer": max(end_at - headers_at, 0) / 1e6,
+        }
+
     def stop(self):
         """停止压测"""
         self._stop_event.set()
         self._running = False
+        if self._process_stop is not None:
+            self._process_stop.set()
+
+    # ======================== 多进程协调 ========================
+
+    def _slice_configs(self, n: int) -> List[Dict]:
+        """将并发、目标RPS和参数化数据拆分为 n 个子进程的构造参数"""
+        configs = []
+        for i in range(n):
+            concurrency = self.concurrency // n + (1 if i < self.concurrency % n else 0)
+            duration = self.duration
+            if self.parameter_strategy == "unique" and self.parameter_data:
+                # unique 策略严格分片, 保证跨进程/节点每行也只被使用一次; 分不到数据的分片不发压
+                parameter_data = self.parameter_data[i::n]
+                if not parameter_data:
+                    duration = 0
+            elif len(self.parameter_data) >= n:
+                parameter_data = self.parameter_data[i::n]
+            else:
+                parameter_data = self.parameter_data
+            configs.append({
+                "target_apis": self.target_apis,
+                "scenario_type": self.scenario_type,
+                "concurrency": concurrency,
+                "duration": duration,
+                "load_type": self.load_type,
+                "ramp_up_time": self.ramp_up_time,
+                "ramp_up_steps": self.ramp_up_steps,
+                "target_rps": self.target_rps / n if self.target_rps else 0,
+                "arrival_distribution": self.arrival_distribution,
+                "think_time": int(self.think_time * 1000),
+                "think_time_distribution": self.think_time_distribution,
+                "think_time_spread": int(self.think_time_spread * 1000),
+                "pacing": int(self.pacing * 1000),
+                "timeout": self.timeout,
+                "parameter_data": parameter_data,
+                "parameter_strategy": self.parameter_strategy,
+                "processes": 1,
+                "sample_dir": self.sample_dir,
+                "transport_profile": self.transport_profile,
+                "trace_phases": self.trace_phases,
+                "stages": [self._slice_stage(st, i, n) for st in self.stages],
+            })
+        return configs
+
+    @staticmethod
+    def _slice_stage(stage: Dict, i: int, n: int) -> Dict:
+        """按分片拆分阶段目标: 用户数按余数分配, RPS 平均分配"""
+        stage = dict(stage)
+        if "target_users" in stage:
+            users = int(stage["target_users"])
+            stage["target_users"] = users // n + (1 if i < users % n else 0)
+        if "target_rps" in stage:
+            stage["target_rps"] = stage["target_rps"] / n
+        return stage
+
+    async def _run_multiprocess(self) -> StressTestReport:
+        """多进程模式: 每个子进程独立运行事件循环和 aiohttp 会话, 本进程只负责汇总"""
+        n = min(self.processes, self.concurrency)
+        ctx = multiprocessing.get_context("spawn")
+        frame_queue = ctx.Queue()
+        self._process_stop = ctx.Event()
+
+        self._running = True
+        self._stop_event.clear()
+        start_time = time.time()
+        if self.sample_dir:
+            write_sample_meta(self.sample_dir, list(self._api_ids), start_time)
+
+        procs = []
+        for i, config in enumerate(self._slice_configs(n)):
+            proc = ctx.Process(
+                target=_run_slice_process, args=(config, i, frame_queue, self._process_stop), daemon=True
+            )
+            proc.start()
+            procs.append(proc)
+
+        metric_task = asyncio.create_task(self._collect_metrics(start_time))
+        self._reset_slices()
+        finished = 0
+        try:
+            while finished < n:
+                try:
+                    frame = await asyncio.to_thread(frame_queue.get, True, 0.5)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in procs):
+                        break
+                    continue
+                if self._apply_frame(frame):
+                    finished += 1
+        finally:
+            self._process_stop.set()
+            for proc in procs:
+                await asyncio.to_thread(proc.join, 5)
+                if proc.is_alive():
+                    proc.terminate()
+            self._running = False
+            metric_task.cancel()
+            try:
+                await metric_task
+            except asyncio.CancelledError:
+                pass
+
+        if len(self._slice_errors) >= n:
+            raise RuntimeError(f"所有压测分片均执行失败: {self._slice_errors[0]}")
+
+        total_duration = time.time() - start_time
+        return self._generate_report(total_duration)
+
+    async def _run_distributed(self) -> StressTestReport:
+        """分布式模式: 按节点数拆分配置, 通过控制协议下发到各压测节点并汇总结果"""
+        n = len(self.agents)
+        self._running = True
+        self._stop_event.clear()
+        start_time = time.time()
+
+        metric_task = asyncio.create_task(self._collect_metrics(start_time))
+        self._reset_slices()
+        try:
+            configs = self._slice_configs(n)
+            for config in configs:
+                config["sample_dir"] = None  # 样本目录仅对本机有效, 远程节点不落盘
+            await asyncio.gather(*[
+                self._drive_agent(i, address, config)
+                for i, (address, config) in enumerate(zip(self.agents, configs))
+            ])
+        finally:
+            self._running = False
+            metric_task.cancel()
+            try:
+                await metric_task
+            except asyncio.CancelledError:
+                pass
+
+        if len(self._slice_errors) >= n:
+            raise RuntimeError(f"所有压测分片均执行失败: {self._slice_errors[0]}")
+
+        total_duration = time.time() - start_time
+        return self._generate_report(total_duration)
+
+    async def _drive_agent(self, index: int, address: str, config: Dict):
+        """与单个压测节点的会话: 下发配置, 接收秒级窗口帧和最终状态, 转发停止信号"""
+        host, _, port = address.rpartition(":")
+        try:
+            reader, writer = await asyncio.open_connection(host, int(port))
+        except OSError as e:
+            self._apply_frame({"type": "error", "slice": index, "message": f"{address} 连接失败: {e}"})
+            return
+
+        async def forward_stop():
+            await self._stop_event.wait()
+            writer.write(stress_protocol.pack_frame(stress_protocol.FRAME_STOP))
+            await writer.drain()
+
+        stop_task = asyncio.create_task(forward_stop())
+        try:
+            # 节点校验 START 帧中的令牌, 与节点注册使用同一个 STRESS_AGENT_TOKEN
+            start = {**config, "token": os.getenv("STRESS_AGENT_TOKEN") or ""}
+            writer.write(stress_protocol.pack_frame(
+                stress_protocol.FRAME_START, stress_protocol.encode_json(start)
+            ))
+            await writer.drain()
+            while True:
+                frame_type, payload = await stress_protocol.read_frame(reader)
+                if frame_type == stress_protocol.FRAME_WINDOW:
+                    frame = stress_protocol.decode_window(payload)
+                elif frame_type == stress_protocol.FRAME_FINAL:
+                    frame = {"type": "final", "state": stress_protocol.decode_json(payload)}
+                elif frame_type == stress_protocol.FRAME_ERROR:
+                    frame = {"type": "error", "message": f"{address}: {payload.decode('utf-8', 'replace')}"}
+                else:
+                    continue
+                frame["slice"] = index
+                if self._apply_frame(frame):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self._apply_frame({"type": "error", "slice": index, "message": f"{address} 连接中断: {e}"})
+        finally:
+            stop_task.cancel()
+            writer.close()
+
+    def _reset_slices(self):
+        self._slice_state = {}
+        self._slice_errors = []
+
+    def _apply_frame(self, frame: Dict) -> bool:
+        """合并一个分片(子进程/远程节点)上报的帧, 返回该分片是否已结束"""
+        kind = frame.get("type")
+        index = frame.get("slice")
+        if kind == "window":
+            self._window.current.merge_dict(frame["window"])
+            self._slice_state[index] = (frame["current_users"], frame["active_connections"])
+            self._current_users = sum(u for u, _ in self._slice_state.values())
+            self._active_connections = sum(c for _, c in self._slice_state.values())
+            return False
+        if kind == "final":
+            self.merge_state(frame["state"])
+        elif kind == "error":
+            logger.error(f"压测分片 {index} 异常: {frame.get('message')}")
+            self._slice_errors.append(frame.get("message"))
+        else:
+            return False
+        self._slice_state.pop(index, None)
+        self._current_users = sum(u for u, _ in self._slice_state.values())
+        self._active_connections = sum(c for _, c in self._slice_state.values())
+        return True
+
+    def export_state(self) -> Dict:
+        """导出可合并的聚合状态(直方图 + 计数器), 用于跨进程/跨节点汇总"""
+        return {
+            "stats": self._stats.to_dict(),
+            "api_stats": {key: stats.to_dict() for key, stats in self._api_stats.items()},
+            "transaction_stats": self._transaction_stats.to_dict(),
+            "dropped_requests": self._dropped_requests,
+            "late_requests": self._late_requests,
+            "connect_histogram": self._connect_hist.to_dict(),
+            "ttfb_histogram": self._ttfb_hist.to_dict(),
+            "new_connections": self._new_connections,
+            "phase_histograms": {name: hist.to_dict() for name, hist in self._phase_hists.items()},
+        }
+
+    def merge_state(self, state: Dict):
+        """合并 export_state() 导出的聚合状态"""
+        self._stats.merge(RequestStats.from_dict(state.get("stats", {})))
+        for key, data in state.get("api_stats", {}).items():
+            stats = self._api_stats.get(key)
+            if stats is None:
+                stats = self._api_stats[key] = RequestStats()
+            stats.merge(RequestStats.from_dict(data))
+        if state.get("transaction_stats"):
+            self._transaction_stats.merge(RequestStats.from_dict(state["transaction_stats"]))
+        self._dropped_requests += state.get("dropped_requests", 0)
+        self._late_requests += state.get("late_requests", 0)
+        self._connect_hist.merge_dict(state.get("connect_histogram", {}))
+        self._ttfb_hist.merge_dict(state.get("ttfb_histogram", {}))
+        self._new_connections += state.get("new_connections", 0)
+        for name, data in state.get("phase_histograms", {}).items():
+            hist = self._phase_hists.get(name)
+            if hist is None:
+                hist = self._phase_hists[name] = LatencyHistogram()
+            hist.merge_dict(data)
 
     async def _run_constant(self, session: aiohttp.ClientSession, start_time: float):
         """恒定负载"""
@@ -176,138 +630,541 @@ class StressEngine:
         await asyncio.gather(*tasks, return_exceptions=True)
 
     async def _run_spike(self, session: aiohttp.ClientSession, start_time: float):
-        """尖峰负载: 正常10%并发 -> 突然拉满 -> 恢复"""
+        """尖峰负载: 正常10%并发 -> 突然拉满(30%时) -> 恢复(60%时), 尖峰用户在迭代边界退出"""
         base_users = max(1, self.concurrency // 10)
-        spike_at = self.duration * 0.3   # 30%时开始尖峰
-        spike_end = self.duration * 0.6  # 60%时恢复
+        self.stages = [
+            {"name": "base", "duration": self.duration * 0.3, "target_users": base_users, "mode": "step"},
+            {"name": "spike", "duration": self.duration * 0.3, "target_users": self.concurrency, "mode": "step"},
+            {"name": "recovery", "duration": self.duration * 0.4, "target_users": base_users, "mode": "step"},
+        ]
+        self._stage_key = "target_users"
+        await self._run_user_stages(session, start_time)
 
-        tasks = []
-        # Phase 1: 基础负载
-        for i in range(base_users):
-            tasks.append(asyncio.create_task(self._worker(session, i, start_time)))
-        self._current_users = base_users
+    async def _run_staged(self, session: aiohttp.ClientSession, start_time: float):
+        """
+        阶段编排: 每个阶段从上一阶段的目标(首阶段从0)线性过渡到本阶段目标, mode=step 时在阶段开始直接切换
+        - target_users: 闭环模型, 控制器每 STAGE_TICK 按插值增减虚拟用户
+        - target_rps: 开放模型, 到达率按插值实时变化
+        """
+        if not self.stages:
+            raise ValueError("staged 负载类型需要设置阶段列表")
+        if self._stage_key == "target_rps":
+            if any("target_users" in st for st in self.stages):
+                raise ValueError("阶段列表不能混用 target_users 与 target_rps")
+            deadline = time.perf_counter() + self.duration - (time.time() - start_time)
+            await self._arrive(session, lambda: self._stage_position(time.time() - start_time)[1], deadline)
+            return
+        await self._run_user_stages(session, start_time)
 
-        # 等到尖峰时间
-        while time.time() - start_time < spike_at and not self._stop_event.is_set():
-            await asyncio.sleep(0.5)
+    async def _run_user_stages(self, session: aiohttp.ClientSession, start_time: float):
+        """按阶段调整虚拟用户数: 增加时启动新用户, 减少时登记退出数, 由用户在完成当前迭代后自行退出"""
+        workers = set()
+        worker_id = 0
+        self._retire_pending = 0
+        while not self._stop_event.is_set():
+            elapsed = time.time() - start_time
+            if elapsed >= self.duration:
+                break
+            desired = int(round(self._stage_position(elapsed)[1]))
+            self._retire_pending = min(self._retire_pending, len(workers))
+            live = len(workers) - self._retire_pending
+            if desired > live:
+                # 先撤回尚未生效的退出登记, 再补足新用户
+                revoked = min(self._retire_pending, desired - live)
+                self._retire_pending -= revoked
+                for _ in range(desired - live - revoked):
+                    task = asyncio.create_task(self._worker(session, worker_id, start_time))
+                    workers.add(task)
+                    task.add_done_callback(workers.discard)
+                    worker_id += 1
+            elif desired < live:
+                self._retire_pending += live - desired
+            self._current_users = desired
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=STAGE_TICK)
+            except asyncio.TimeoutError:
+                pass
 
-        # Phase 2: 尖峰
-        spike_tasks = []
-        for i in range(base_users, self.concurrency):
-            spike_tasks.append(asyncio.create_task(self._worker(session, i, start_time)))
-        self._current_users = self.concurrency
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+        self._retire_pending = 0
 
-        # 等到恢复时间
-        while time.time() - start_time < spike_end and not self._stop_event.is_set():
-            await asyncio.sleep(0.5)
+    def _stage_position(self, elapsed: float) -> Tuple[int, float]:
+        """返回 elapsed 秒时所处的阶段序号与插值后的目标值(用户数或RPS)"""
+        key = self._stage_key
+        previous = 0.0
+        offset = 0.0
+        for index, stage in enumerate(self.stages):
+            target = float(stage.get(key, 0))
+            duration = stage.get("duration", 0)
+            if elapsed < offset + duration:
+                if stage.get("mode") == "step":
+                    return index, target
+                return index, previous + (target - previous) * (elapsed - offset) / duration
+            previous = target
+            offset += duration
+        return max(0, len(self.stages) - 1), previous
 
-        # Phase 3: 恢复 - 取消额外任务
-        for t in spike_tasks:
-            t.cancel()
-        self._current_users = base_users
+    def _retire(self) -> bool:
+        """迭代边界检查: 认领一个退出名额则结束当前虚拟用户"""
+        if self._retire_pending > 0:
+            self._retire_pending -= 1
+            return True
+        return False
 
-        await asyncio.gather(*tasks, return_exceptions=True)
+    async def _run_arrival_rate(self, session: aiohttp.ClientSession, start_time: float):
+        """
+        开放模型: 按计划时间表(恒定间隔或泊松过程)以 target_rps 发出请求
+        - 在途请求数上限为 concurrency, 达到上限时丢弃本次调度并计数
+        - 延迟从计划发送时间开始计算, 避免协调遗漏(coordinated omission)
+        """
+        if self.target_rps <= 0:
+            raise ValueError("arrival_rate 负载类型需要设置 target_rps")
+        remaining = self.duration - (time.time() - start_time)
+        await self._arrive(session, self.target_rps, time.perf_counter() + remaining)
+
+    async def _arrive(
+        self, session: aiohttp.ClientSession, rate: Union[float, Callable[[], float]], deadline: float
+    ):
+        """
+        以 rate 的到达率发送请求直到 deadline(perf_counter 时刻), 返回前等待在途请求完成
+        rate 可为函数(阶段编排), 每次调度时取当前到达率; 到达率为0时暂停调度
+        """
+        rate_of = rate if callable(rate) else None
+        max_in_flight = max(1, self.concurrency)
+        in_flight = set()
+        api_index = 0
+
+        # 到达间隔以"到达率 x 时间"的累积量衡量: 恒定间隔每次累积1, 泊松过程累积 Exp(1)
+        # 到达率可变时每步最多推进 STAGE_TICK, 到达率变化后按新值继续累积(非齐次过程的时间变换)
+        scheduled_at = time.perf_counter()
+        need = 0.0
+        while not self._stop_event.is_set():
+            if need <= 0:
+                need = random.expovariate(1.0) if self.arrival_distribution == "poisson" else 1.0
+            current = rate_of() if rate_of else rate
+            if current > 0:
+                step = need / current
+                if rate_of is not None and step > STAGE_TICK:
+                    step = STAGE_TICK
+            else:
+                # 到达率为0: 暂停调度, 不累积落后时间
+                scheduled_at = max(scheduled_at, time.perf_counter())
+                step = STAGE_TICK
+            if scheduled_at + step >= deadline:
+                break
+            scheduled_at += step
+            if current > 0:
+                need -= current * step
+            if need > 1e-9:
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                continue
+            need = 0.0
+            late_tolerance = min(1.0 / current, 0.01)  # 超过计划时间该阈值视为迟发
+
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if time.perf_counter() - scheduled_at > late_tolerance:
+                self._late_requests += 1
+
+            if len(in_flight) >= max_in_flight:
+                self._dropped_requests += 1
+                continue
+
+            params = self._next_params()
+            if params is None:
+                break
+            if self.scenario_type == "chain_api":
+                # 开放模型下每次到达视为一个新用户, 完整执行一遍链路
+                task = asyncio.create_task(self._run_chain(session, params, {}, scheduled_at))
+            else:
+                compiled = self._pick_api(api_index)
+                api_index += 1
+                task = asyncio.create_task(self._fire(session, compiled, params, scheduled_at))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            self._current_users = len(in_flight)
+
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        self._current_users = 0
+
+    async def _run_capacity_search(self, session: aiohttp.ClientSession, start_time: float):
+        """
+        容量探测: 以开放模型逐级提升到达率, target_rps 为探测上限, duration 为总时间预算
+        - step: 从 start_rps 起每级增加 step_rps, 首次突破 SLO 即停止
+        - binary: 从 start_rps 起倍增直到突破 SLO, 再在最后通过/首次失败之间二分, 精度为 step_rps
+        每级至少保持 hold_seconds, 且保证采到 min_samples 个样本, 使 P99 统计稳定
+        """
+        if self.target_rps <= 0:
+            raise ValueError("capacity_search 负载类型需要设置 target_rps(探测上限)")
+        if not any(self.slo_thresholds.get(k) is not None for k in ("p99_rt_max", "error_rate_max", "avg_rt_max")):
+            raise ValueError("capacity_search 负载类型需要 SLO 阈值(p99_rt_max/error_rate_max/avg_rt_max)")
+        cfg = self.capacity_config
+        max_rps = self.target_rps
+        start_rps = min(max_rps, cfg.get("start_rps") or max(1, max_rps // 10))
+        step_rps = cfg.get("step_rps") or max(1, max_rps // 10)
+        hold_seconds = cfg.get("hold_seconds") or 30
+        min_samples = cfg.get("min_samples") or 1000
+        budget_end = start_time + self.duration
+
+        async def probe(rate: float) -> Optional[Dict]:
+            level_hold = max(hold_seconds, min_samples / rate)
+            remaining = budget_end - time.time()
+            if self._stop_event.is_set() or remaining < min(level_hold, hold_seconds):
+                return None
+            level_hold = min(level_hold, remaining)
+            self._level_stats = RequestStats()
+            dropped_before = self._dropped_requests
+            level_start = time.perf_counter()
+            await self._arrive(session, rate, level_start + level_hold)
+            elapsed = time.perf_counter() - level_start
+            point = self._evaluate_level(rate, self._level_stats, elapsed, self._dropped_requests - dropped_before)
+            self._level_stats = None
+            self._capacity_curve.append(point)
+            logger.info(f"容量探测 {rate} RPS: {'通过' if point['passed'] else '未通过 ' + '; '.join(point['reasons'])}")
+            return point
+
+        if cfg.get("strategy") == "binary":
+            passed, failed = None, None
+            rate = start_rps
+            while True:
+                point = await probe(rate)
+                if point is None:
+                    break
+                if not point["passed"]:
+                    failed = rate
+                    break
+                passed = rate
+                if rate >= max_rps:
+                    break
+                rate = min(max_rps, rate * 2)
+            low = passed or 0
+            while failed is not None and failed - low > step_rps:
+                rate = (low + failed) // 2
+                point = await probe(rate)
+                if point is None:
+                    break
+                if point["passed"]:
+                    low = rate
+                else:
+                    failed = rate
+        else:
+            rate = start_rps
+            while rate <= max_rps:
+                point = await probe(rate)
+                if point is None or not point["passed"]:
+                    break
+                rate += step_rps
+
+        self._saturation_point = self._find_saturation()
+
+    def _evaluate_level(self, rate: float, stats: RequestStats, elapsed: float, dropped: int) -> Dict:
+        """按 SLO 阈值判定单级结果"""
+        n = stats.total
+        hist = stats.histogram
+        pct = hist.percentiles([50, 95, 99])
+        error_rate = stats.fail_count / n * 100 if n else 0
+        achieved = n / elapsed if elapsed > 0 else 0
+        slo = self.slo_thresholds
+        reasons = []
+        if not n:
+            reasons.append("无完成的请求")
+        if slo.get("p99_rt_max") is not None and pct[99] > slo["p99_rt_max"]:
+            reasons.append(f"P99 {pct[99]:.0f}ms 超过阈值 {slo['p99_rt_max']}ms")
+        if slo.get("avg_rt_max") is not None and hist.mean > slo["avg_rt_max"]:
+            reasons.append(f"平均响应时间 {hist.mean:.0f}ms 超过阈值 {slo['avg_rt_max']}ms")
+        if slo.get("error_rate_max") is not None and error_rate > slo["error_rate_max"]:
+            reasons.append(f"错误率 {error_rate:.2f}% 超过阈值 {slo['error_rate_max']}%")
+        # 在途请求达到并发上限而丢弃调度, 说明服务端已无法按该到达率消化请求
+        if dropped > rate * elapsed * 0.01:
+            reasons.append(f"在途请求达到上限, 丢弃 {dropped} 次调度")
+        return {
+            "target_rps": rate,
+            "achieved_rps": round(achieved, 2),
+            "total": n,
+            "avg_rt": round(hist.mean, 2),
+            "p50_rt": round(pct[50], 2),
+            "p95_rt": round(pct[95], 2),
+            "p99_rt": round(pct[99], 2),
+            "error_rate": round(error_rate, 2),
+            "dropped": dropped,
+            "duration": round(elapsed, 2),
+            "passed": not reasons,
+            "reasons": reasons,
+        }
+
+    def _find_saturation(self) -> Optional[Dict]:
+        """饱和点: 通过 SLO 的最高到达率, 以及高于它的最低未通过级别"""
+        if not self._capacity_curve:
+            return None
+        passed = [p for p in self._capacity_curve if p["passed"]]
+        best = max(passed, key=lambda p: p["target_rps"]) if passed else None
+        floor = best["target_rps"] if best else 0
+        failed = [p for p in self._capacity_curve if not p["passed"] and p["target_rps"] > floor]
+        breach = min(failed, key=lambda p: p["target_rps"]) if failed else None
+        return {
+            "max_sustainable_rps": floor,
+            "achieved_rps": best["achieved_rps"] if best else 0,
+            "p99_rt": best["p99_rt"] if best else None,
+            "breached_at_rps": breach["target_rps"] if breach else None,
+            "breach_reasons": breach["reasons"] if breach else [],
+            "saturated": breach is not None,
+        }
+
+    async def _fire(
+        self, session: aiohttp.ClientSession, compiled: CompiledRequest, params: Dict, scheduled_at: float
+    ):
+        """开放模型下的单次请求"""
+        result = await self._send_request(session, compiled.render(params), scheduled_at=scheduled_at)
+        self._record(compiled.key, result)
 
     async def _worker(self, session: aiohttp.ClientSession, worker_id: int, start_time: float):
         """单个虚拟用户的工作循环"""
+        if self.scenario_type == "chain_api":
+            await self._chain_worker(session, start_time)
+            return
         api_index = 0
         while not self._stop_event.is_set() and (time.time() - start_time) < self.duration:
-            api = self.target_apis[api_index % len(self.target_apis)]
+            if self._retire():
+                break
+            iteration_start = time.perf_counter()
+            # 参数化替换
+            params = self._next_params()
+            if params is None:
+                break
+            compiled = self._pick_api(api_index)
             api_index += 1
 
-            # 参数化替换
-            resolved_api = self._resolve_parameters(api)
+            result = await self._send_request(session, compiled.render(params))
+            self._record(compiled.key, result)
+
+            await self._pause(iteration_start)
+
+    def _pick_api(self, api_index: int) -> CompiledRequest:
+        """选择本次请求的接口: 加权混合或轮询"""
+        if self._alias is not None:
+            return self._compiled[self._alias.sample(random.random)]
+        return self._compiled[api_index % len(self._compiled)]
 
-            result = await self._send_request(session, resolved_api)
-            async with self._lock:
-                self._results.append(result)
+    def _think_delay(self) -> float:
+        """按配置的分布抽取一次思考时间(秒)"""
+        base = self.think_time
+        if base <= 0 and self.think_time_spread <= 0:
+            return 0
+        dist = self.think_time_distribution
+        if dist == "uniform":
+            return max(0.0, random.uniform(base - self.think_time_spread, base + self.think_time_spread))
+        if dist == "normal":
+            return max(0.0, random.gauss(base, self.think_time_spread))
+        if dist == "exponential":
+            return random.expovariate(1.0 / base) if base > 0 else 0
+        return base
 
-            if self.think_time > 0:
-                await asyncio.sleep(self.think_time)
+    async def _pause(self, iteration_start: float):
+        """迭代结束后的等待: 开启节奏控制时补齐到固定间隔, 否则按分布思考"""
+        if self.pacing > 0:
+            remaining = self.pacing - (time.perf_counter() - iteration_start)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            return
+        delay = self._think_delay()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _chain_worker(self, session: aiohttp.ClientSession, start_time: float):
+        """链路场景的虚拟用户: 按顺序执行整条链路, 会话变量在迭代间保留(如登录token)"""
+        variables: Dict[str, Any] = {}
+        while not self._stop_event.is_set() and (time.time() - start_time) < self.duration:
+            if self._retire():
+                break
+            iteration_start = time.perf_counter()
+            params = self._next_params()
+            if params is None:
+                break
+            await self._run_chain(session, params, variables, think=True)
+            await self._pause(iteration_start)
 
-    async def _send_request(self, session: aiohttp.ClientSession, api: Dict) -> RequestResult:
-        """发送单个请求"""
-        method = api.get("method", "GET").upper()
-        url = api.get("url", "")
-        headers = api.get("headers", {})
-        body = api.get("body")
-        params = api.get("params")
+    async def _run_chain(
+        self,
+        session: aiohttp.ClientSession,
+        params: Dict,
+        variables: Dict,
+        scheduled_at: Optional[float] = None,
+        think: bool = False,
+    ) -> bool:
+        """
+        执行一次链路迭代: 每步响应按预编译规则提取变量并代入后续请求
+        某一步失败时中断本次迭代; 整条链路耗时计入事务统计
+        """
+        chain_start = scheduled_at if scheduled_at is not None else time.perf_counter()
+        success = True
+        last = len(self._compiled) - 1
+        for i, compiled in enumerate(self._compiled):
+            values = {**params, **variables} if variables else params
+            result = await self._send_request(
+                session, compiled.render(values), scheduled_at=scheduled_at, keep_body=bool(compiled.extractors)
+            )
+            scheduled_at = None  # 仅第一步从计划时间起计
+            self._record(compiled.key, result)
+            if not result.success:
+                success = False
+                break
+            if compiled.extractors:
+                compiled.extract(result.body, variables)
+                result.body = None
+            if think and i < last:
+                delay = self._think_delay()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        elapsed = (time.perf_counter() - chain_start) * 1000
+        self._transaction_stats.record(elapsed, success, 0, None if success else "链路中断")
+        return success
+
+    async def _send_request(
+        self,
+        session: aiohttp.ClientSession,
+        api: Dict,
+        scheduled_at: Optional[float] = None,
+        keep_body: bool = False,
+    ) -> RequestResult:
+        """
+        发送单个请求(api 为 CompiledRequest.render() 的结果, body 已预编码为 bytes)
+        scheduled_at 为 perf_counter 计划时间, 传入时从计划时间起计延迟
+        """
+        method = api["method"]
+        url = api["url"]
 
-        async with self._lock:
-            self._active_connections += 1
+        # 单事件循环内的计数器自增不会被打断, 无需加锁
+        self._active_connections += 1
 
-        start = time.time()
+        sent_at = time.perf_counter()
+        start = scheduled_at if scheduled_at is not None else sent_at
+        timing = {}
         try:
-            kwargs = {"headers": headers, "params": params}
-            if body and method in ("POST", "PUT", "PATCH"):
-                if isinstance(body, dict):
-                    kwargs["json"] = body
+            async with session.request(
+                method, url, headers=api["headers"], params=api["params"], data=api["data"],
+                trace_request_ctx=timing,
+            ) as resp:
+                # TTFB 从实际发出计算, 不含开放模型下的调度等待
+                ttfb = (time.perf_counter() - sent_at) * 1000
+                headers_at = time.perf_counter_ns() if self.trace_phases else 0
+                content = None
+                if keep_body or not self.transport_profile["discard_body"]:
+                    content = await resp.read()
+                    size = len(content)
                 else:
-                    kwargs["data"] = body
-
-            async with session.request(method, url, **kwargs) as resp:
-                content = await resp.read()
-                elapsed = (time.time() - start) * 1000
+                    size = 0
+                    async for chunk in resp.content.iter_chunked(DISCARD_CHUNK_SIZE):
+                        size += len(chunk)
+                elapsed = (time.perf_counter() - start) * 1000
                 return RequestResult(
                     url=url,
                     method=method,
                     status_code=resp.status,
                     response_time=elapsed,
-                    content_length=len(content),
+                    content_length=size,
                     success=200 <= resp.status < 400,
-                    timestamp=time.time()
+                    timestamp=time.time(),
+                    body=content if keep_body else None,
+                    connect_time=timing.get("connect_time", 0),
+                    ttfb=ttfb,
+                    new_connection="connect_time" in timing,
+                    phases=self._phase_timings(timing, headers_at, time.perf_counter_ns())
+                    if self.trace_phases else None,
                 )
         except asyncio.TimeoutError:
-            elapsed = (time.time() - start) * 1000
+            elapsed = (time.perf_counter() - start) * 1000
             return RequestResult(
                 url=url, method=method, status_code=0,
                 response_time=elapsed, content_length=0,
                 success=False, error="Timeout", timestamp=time.time()
             )
         except Exception as e:
-            elapsed = (time.time() - start) * 1000
+            elapsed = (time.perf_counter() - start) * 1000
             return RequestResult(
                 url=url, method=method, status_code=0,
                 response_time=elapsed, content_length=0,
                 success=False, error=str(e), timestamp=time.time()
             )
         finally:
-            async with self._lock:
-                self._active_connections -= 1
+            self._active_connections -= 1
 
-    def _resolve_parameters(self, api: Dict) -> Dict:
-        """参数化替换"""
-        if not self.parameter_data:
-            return api
+    def _record(self, api_key: str, result: RequestResult):
+        """将单次请求结果就地累加到聚合结构(同步执行, 无需加锁)"""
+        error_key = None
+        if not result.success:
+            error_key = str(result.status_code) if result.status_code else (result.error or "Unknown")
+        self._window.record(result.response_time, result.success)
+        self._stats.record(result.response_time, result.success, result.content_length, error_key)
+        stats = self._api_stats.get(api_key)
+        if stats is None:
+            stats = self._api_stats[api_key] = RequestStats()
+        stats.record(result.response_time, result.success, result.content_length, error_key)
+        if result.new_connection:
+            self._new_connections += 1
+            self._connect_hist.record(result.connect_time)
+        if result.ttfb:
+            self._ttfb_hist.record(result.ttfb)
+        if result.phases:
+            self._window.record_phases(result.phases)
+            for name, value in result.phases.items():
+                self._phase_hists[name].record(value)
+        if self._level_stats is not None:
+            self._level_stats.record(result.response_time, result.success, result.content_length, error_key)
+        if self._recorder is not None:
+            self._recorder.append(
+                result.timestamp, self._api_ids.get(api_key, 0), result.status_code,
+                result.response_time, result.content_length,
+            )
 
+    def _next_params(self) -> Optional[Dict]:
+        """
+        取下一行参数化数据
+        - sequential: 循环顺序取用; random: 随机取用
+        - unique: 共享游标顺序取用, 每行只取一次, 取完返回 None 并结束压测
+        """
+        if not self.parameter_data:
+            return {}
         if self.parameter_strategy == "random":
-            import random
-            params = random.choice(self.parameter_data)
-        else:  # sequential
-            params = self.parameter_data[self._param_index % len(self.parameter_data)]
+            return random.choice(self.parameter_data)
+        if self.parameter_strategy == "unique":
+            if self._param_index >= len(self.parameter_data):
+                if not self._stop_event.is_set():
+                    logger.info("参数化数据已全部使用(unique), 停止发压")
+                    self._stop_event.set()
+                return None
+            params = self.parameter_data[self._param_index]
             self._param_index += 1
-
-        # 替换 url, headers, body 中的 {{key}} 占位符
-        api_str = json.dumps(api, ensure_ascii=False)
-        for key, value in params.items():
-            api_str = api_str.replace(f"{{{{{key}}}}}", str(value))
-        return json.loads(api_str)
+            return params
+        params = self.parameter_data[self._param_index % len(self.parameter_data)]
+        self._param_index += 1
+        return params
 
     async def _collect_metrics(self, start_time: float):
         """每秒采集指标"""
-        last_count = 0
-        last_error_count = 0
         while self._running:
             await asyncio.sleep(1)
             current_time = time.time()
 
-            async with self._lock:
-                current_count = len(self._results)
-                current_errors = sum(1 for r in self._results[last_count:] if not r.success)
-                recent_rts = [r.response_time for r in self._results[last_count:] if r.success]
-
-            rps = current_count - last_count
-            avg_rt = statistics.mean(recent_rts) if recent_rts else 0
+            # 轮转窗口: 之后的请求写入新槽位, 已关闭的槽位只由本协程读取
+            window = self._window.rotate()
+            if self._frame_sink is not None:
+                # 子进程只上报原始窗口, 快照与异常检测由协调者统一完成
+                self._frame_sink({
+                    "type": "window",
+                    "window": window.to_dict(),
+                    "current_users": self._current_users,
+                    "active_connections": self._active_connections,
+                })
+                continue
+            rps = window.count
+            current_errors = window.errors
+            avg_rt = window.avg_success_rt
+            window_pct = window.histogram.percentiles([95, 99])
 
             snapshot = MetricSnapshot(
                 timestamp=current_time,
@@ -315,7 +1172,11 @@ class StressEngine:
                 requests_per_second=rps,
                 avg_response_time=round(avg_rt, 2),
                 error_count=current_errors,
-                active_connections=self._active_connections
+                active_connections=self._active_connections,
+                p95_response_time=round(window_pct[95], 2),
+                p99_response_time=round(window_pct[99], 2),
+                phases=window.phase_averages() or None,
+                stage=self._stage_marker(current_time - start_time),
             )
             self._metrics.append(snapshot)
 
@@ -338,67 +1199,166 @@ class StressEngine:
                 except Exception as e:
                     logger.error(f"Metric callback error: {e}")
 
-            last_count = current_count
+    def _stage_marker(self, elapsed: float) -> Optional[Dict]:
+        """指标流上的阶段标记(未使用阶段编排时为 None)"""
+        if not self.stages:
+            return None
+        index, target = self._stage_position(elapsed)
+        return {
+            "index": index,
+            "name": self.stages[index].get("name") or f"stage-{index + 1}",
+            "target_key": self._stage_key,
+            "target": round(target, 2),
+        }
 
     def _generate_report(self, total_duration: float) -> StressTestReport:
         """生成最终报告"""
-        if not self._results:
-            return StressTestReport(duration=total_duration)
-
-        rts = [r.response_time for r in self._results]
-        success_rts = [r.response_time for r in self._results if r.success]
-        sorted_rts = sorted(rts)
-        n = len(sorted_rts)
-
-        success_count = sum(1 for r in self._results if r.success)
-        fail_count = n - success_count
-        total_bytes = sum(r.content_length for r in self._results)
-
-        # 按接口分组统计
-        api_stats: Dict[str, List[RequestResult]] = {}
-        error_dist: Dict[str, int] = {}
-        for r in self._results:
-            key = f"{r.method} {r.url}"
-            api_stats.setdefault(key, []).append(r)
-            if not r.success:
-                err_key = str(r.status_code) if r.status_code else (r.error or "Unknown")
-                error_dist[err_key] = error_dist.get(err_key, 0) + 1
+        stats = self._stats
+        n = stats.total
+        if not n:
+            return StressTestReport(
+                duration=total_duration,
+                dropped_requests=self._dropped_requests,
+                late_requests=self._late_requests,
+                capacity_curve=self._capacity_curve,
+                saturation_point=self._saturation_point,
+                transport=self._transport_summary(0),
+                phase_breakdown=self._phase_summary(),
+            )
+
+        hist = stats.histogram
+        pct = hist.percentiles([50, 90, 95, 99])
 
+        # 加权混合: 计划占比(按权重)与实际占比
+        intended_mix = {}
+        if self._alias is not None:
+            total_weight = sum(max(0.0, float(c.weight or 0)) for c in self._compiled)
+            for c in self._compiled:
+                intended_mix[c.key] = intended_mix.get(c.key, 0) + max(0.0, float(c.weight or 0)) / total_weight * 100
+
+        # 按接口明细直接取自各接口的聚合结构
         api_details = []
-        for key, results in api_stats.items():
+        for key, api_stats in self._api_stats.items():
             parts = key.split(" ", 1)
-            api_rts = sorted([r.response_time for r in results])
-            api_n = len(api_rts)
-            api_errors = sum(1 for r in results if not r.success)
+            api_hist = api_stats.histogram
+            api_n = api_stats.total
+            api_pct = api_hist.percentiles([50, 90, 95, 99])
             api_details.append({
                 "method": parts[0],
                 "url": parts[1] if len(parts) > 1 else "",
                 "total": api_n,
-                "success": api_n - api_errors,
-                "avg_rt": round(statistics.mean(api_rts), 2),
-                "p99_rt": round(api_rts[int(api_n * 0.99)] if api_n > 0 else 0, 2),
-                "error_rate": round(api_errors / api_n * 100, 2) if api_n > 0 else 0,
+                "success": api_stats.success_count,
+                "avg_rt": round(api_hist.mean, 2),
+                "min_rt": round(api_hist.min, 2),
+                "max_rt": round(api_hist.max, 2),
+                "p50_rt": round(api_pct[50], 2),
+                "p90_rt": round(api_pct[90], 2),
+                "p95_rt": round(api_pct[95], 2),
+                "p99_rt": round(api_pct[99], 2),
+                "error_rate": round(api_stats.fail_count / api_n * 100, 2) if api_n > 0 else 0,
                 "tps": round(api_n / total_duration, 2) if total_duration > 0 else 0,
             })
+            if intended_mix:
+                api_details[-1]["intended_pct"] = round(intended_mix.get(key, 0), 2)
+                api_details[-1]["actual_pct"] = round(api_n / n * 100, 2)
+
+        # 链路事务明细
+        transaction = self._transaction_stats
+        if transaction.total:
+            tx_hist = transaction.histogram
+            tx_pct = tx_hist.percentiles([50, 90, 95, 99])
+            api_details.append({
+                "type": "transaction",
+                "method": "CHAIN",
+                "url": " -> ".join(c.name or c.key for c in self._compiled),
+                "total": transaction.total,
+                "success": transaction.success_count,
+                "avg_rt": round(tx_hist.mean, 2),
+                "min_rt": round(tx_hist.min, 2),
+                "max_rt": round(tx_hist.max, 2),
+                "p50_rt": round(tx_pct[50], 2),
+                "p90_rt": round(tx_pct[90], 2),
+                "p95_rt": round(tx_pct[95], 2),
+                "p99_rt": round(tx_pct[99], 2),
+                "error_rate": round(transaction.fail_count / transaction.total * 100, 2),
+                "tps": round(transaction.total / total_duration, 2) if total_duration > 0 else 0,
+            })
 
         return StressTestReport(
             total_requests=n,
-            success_count=success_count,
-            fail_count=fail_count,
-            error_rate=round(fail_count / n * 100, 2) if n > 0 else 0,
-            avg_response_time=round(statistics.mean(rts), 2),
-            min_response_time=round(min(rts), 2),
-            max_response_time=round(max(rts), 2),
-            p50_response_time=round(sorted_rts[int(n * 0.50)], 2),
-            p90_response_time=round(sorted_rts[int(n * 0.90)], 2),
-            p95_response_time=round(sorted_rts[int(n * 0.95)], 2),
-            p99_response_time=round(sorted_rts[min(int(n * 0.99), n - 1)], 2),
+            success_count=stats.success_count,
+            fail_count=stats.fail_count,
+            error_rate=round(stats.fail_count / n * 100, 2) if n > 0 else 0,
+            avg_response_time=round(hist.mean, 2),
+            min_response_time=round(hist.min, 2),
+            max_response_time=round(hist.max, 2),
+            p50_response_time=round(pct[50], 2),
+            p90_response_time=round(pct[90], 2),
+            p95_response_time=round(pct[95], 2),
+            p99_response_time=round(pct[99], 2),
             tps=round(n / total_duration, 2) if total_duration > 0 else 0,
-            throughput=round(total_bytes / total_duration, 2) if total_duration > 0 else 0,
+            throughput=round(stats.total_bytes / total_duration, 2) if total_duration > 0 else 0,
             api_details=api_details,
-            error_distribution=error_dist,
+            error_distribution=dict(stats.errors),
             duration=round(total_duration, 2),
+            dropped_requests=self._dropped_requests,
+            late_requests=self._late_requests,
+            capacity_curve=self._capacity_curve,
+            saturation_point=self._saturation_point,
+            transport=self._transport_summary(n),
+            phase_breakdown=self._phase_summary(),
         )
 
+    def _transport_summary(self, total: int) -> Dict:
+        """传输层汇总, 便于对比不同传输配置下的建连开销与TTFB"""
+        return {
+            "profile": self.transport_profile,
+            "new_connections": self._new_connections,
+            "connection_reuse_rate": round((1 - self._new_connections / total) * 100, 2) if total else 0,
+            "connect_time": _describe_histogram(self._connect_hist),
+            "ttfb": _describe_histogram(self._ttfb_hist),
+        }
+
+    def _phase_summary(self) -> Dict:
+        """各阶段耗时分布(未开启阶段追踪时为空)"""
+        return {name: _describe_histogram(hist) for name, hist in self._phase_hists.items() if hist.total_count}
+
     def get_metrics(self) -> List[MetricSnapshot]:
         return self._metrics
+
+
+def _describe_histogram(hist: LatencyHistogram) -> Dict:
+    pct = hist.percentiles([50, 95, 99])
+    return {
+        "count": hist.total_count,
+        "avg": round(hist.mean, 2),
+        "p50": round(pct[50], 2),
+        "p95": round(pct[95], 2),
+        "p99": round(pct[99], 2),
+        "max": round(hist.max, 2),
+    }
+
+
+def _run_slice_process(config: Dict, index: int, frame_queue, stop_flag):
+    """多进程模式的子进程入口: 运行一个分片并通过队列回传窗口帧与最终聚合状态"""
+
+    async def main():
+        engine = StressEngine(**config)
+        engine._frame_sink = lambda frame: frame_queue.put({**frame, "slice": index})
+
+        async def watch_stop():
+            while not stop_flag.is_set():
+                await asyncio.sleep(0.2)
+            engine.stop()
+
+        watcher = asyncio.create_task(watch_stop())
+        try:
+            await engine.run()
+        finally:
+            watcher.cancel()
+        frame_queue.put({"type": "final", "slice": index, "state": engine.export_state()})
+
+    try:
+        asyncio.run(main())
+    except Exception as e:
+        frame_queue.put({"type": "error", "slice": index, "message": str(e)})
@@ -0,0 +1,323 @@
+"""
+压测指标聚合 - 固定内存的延迟直方图与计数器
+HDR 风格的对数-线性分桶: 相对误差 < 1%, 内存与请求数无关, 多个直方图可直接合并
+"""
+import math
+from typing import Dict, List, Optional
+
+# 子桶位数: 每个数量级 128 个线性子桶, 相对误差 <= 1/128
+SUB_BUCKET_BITS = 8
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+# 最大可记录值(微秒): 2^32us ≈ 71分钟, 超出部分截断到最大桶
+MAX_VALUE_BITS = 32
+BUCKET_COUNT = SUB_BUCKET_COUNT + (MAX_VALUE_BITS - SUB_BUCKET_BITS) * SUB_BUCKET_HALF
+MAX_TRACKABLE_US = (1 << MAX_VALUE_BITS) - 1
+
+
+def _bucket_index(value_us: int) -> int:
+    """微秒值 -> 桶下标"""
+    if value_us < SUB_BUCKET_COUNT:
+        return value_us if value_us > 0 else 0
+    if value_us > MAX_TRACKABLE_US:
+        value_us = MAX_TRACKABLE_US
+    shift = value_us.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + ((value_us >> shift) - SUB_BUCKET_HALF)
+
+
+def _bucket_value(index: int) -> float:
+    """桶下标 -> 桶代表值(微秒, 取桶区间中点)"""
+    if index < SUB_BUCKET_COUNT:
+        return float(index)
+    offset = index - SUB_BUCKET_COUNT
+    shift = offset // SUB_BUCKET_HALF + 1
+    sub = offset % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    lower = sub << shift
+    return lower + ((1 << shift) - 1) / 2.0
+
+
+class LatencyHistogram:
+    """固定内存的延迟直方图(输入输出单位均为 ms, 内部以微秒分桶)"""
+
+    __slots__ = ("counts", "total_count", "total_sum", "min_value", "max_value")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * BUCKET_COUNT
+        self.total_count = 0
+        self.total_sum = 0.0  # ms
+        self.min_value = math.inf
+        self.max_value = 0.0
+
+    def record(self, value_ms: float, count: int = 1):
+        """记录一次(或 count 次)延迟"""
+        if value_ms < 0:
+            value_ms = 0.0
+        self.counts[_bucket_index(int(value_ms * 1000))] += count
+        self.total_count += count
+        self.total_sum += value_ms * count
+        if value_ms < self.min_value:
+            self.min_value = value_ms
+        if value_ms > self.max_value:
+            self.max_value = value_ms
+
+    def merge(self, other: "LatencyHistogram"):
+        """合并另一个直方图(原地)"""
+        if not other.total_count:
+            return
+        counts = self.counts
+        for i, c in enumerate(other.counts):
+            if c:
+                counts[i] += c
+        self.total_count += other.total_count
+        self.total_sum += other.total_sum
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+
+    def merge_dict(self, data: Dict):
+        """合并 to_dict() 的稀疏序列化结果, 避免先反序列化出完整桶数组"""
+        total_count = data.get("total_count", 0)
+        if not total_count:
+            return
+        counts = self.counts
+        for i, c in data.get("counts", {}).items():
+            counts[int(i)] += c
+        self.total_count += total_count
+        self.total_sum += data.get("total_sum", 0.0)
+        self.min_value = min(self.min_value, data.get("min", 0))
+        self.max_value = max(self.max_value, data.get("max", 0.0))
+
+    def reset(self):
+        """清空(复用已分配的桶数组)"""
+        counts = self.counts
+        for i in range(BUCKET_COUNT):
+            counts[i] = 0
+        self.total_count = 0
+        self.total_sum = 0.0
+        self.min_value = math.inf
+        self.max_value = 0.0
+
+    def percentile(self, p: float) -> float:
+        """百分位值(ms), p 取 0~100"""
+        if not self.total_count:
+            return 0
+        target = max(1, math.ceil(self.total_count * p / 100.0))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                if seen >= target:
+                    value = _bucket_value(i) / 1000.0
+                    # 桶代表值不应越过真实的最小/最大值
+                    return min(max(value, self.min_value), self.max_value)
+        return self.max_value
+
+    def percentiles(self, ps: List[float]) -> Dict[float, float]:
+        """一次扫描计算多个百分位"""
+        result = {p: 0 for p in ps}
+        if not self.total_count:
+            return result
+        targets = sorted((max(1, math.ceil(self.total_count * p / 100.0)), p) for p in ps)
+        ti = 0
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if not c:
+                continue
+            seen += c
+            while ti < len(targets) and seen >= targets[ti][0]:
+                value = _bucket_value(i) / 1000.0
+                result[targets[ti][1]] = min(max(value, self.min_value), self.max_value)
+                ti += 1
+            if ti >= len(targets):
+                break
+        return result
+
+    @property
+    def mean(self) -> float:
+        return self.total_sum / self.total_count if self.total_count else 0
+
+    @property
+    def min(self) -> float:
+        return self.min_value if self.total_count else 0
+
+    @property
+    def max(self) -> float:
+        return self.max_value
+
+    def to_dict(self) -> Dict:
+        """稀疏序列化(仅非零桶), 用于跨进程/跨节点传输"""
+        return {
+            "counts": {i: c for i, c in enumerate(self.counts) if c},
+            "total_count": self.total_count,
+            "total_sum": self.total_sum,
+            "min": self.min,
+            "max": self.max_value,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LatencyHistogram":
+        hist = cls()
+        for i, c in data.get("counts", {}).items():
+            hist.counts[int(i)] = c
+        hist.total_count = data.get("total_count", 0)
+        hist.total_sum = data.get("total_sum", 0.0)
+        hist.min_value = data.get("min", 0) if hist.total_count else math.inf
+        hist.max_value = data.get("max", 0.0)
+        return hist
+
+
+class RequestStats:
+    """请求聚合统计: 延迟直方图 + 成功数/字节数/错误分布计数器"""
+
+    __slots__ = ("histogram", "success_count", "fail_count", "total_bytes", "errors")
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.success_count = 0
+        self.fail_count = 0
+        self.total_bytes = 0
+        self.errors: Dict[str, int] = {}
+
+    def record(self, response_time: float, success: bool, content_length: int,
+               error_key: Optional[str] = None):
+        self.histogram.record(response_time)
+        self.total_bytes += content_length
+        if success:
+            self.success_count += 1
+        else:
+            self.fail_count += 1
+            key = error_key or "Unknown"
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def merge(self, other: "RequestStats"):
+        self.histogram.merge(other.histogram)
+        self.success_count += other.success_count
+        self.fail_count += other.fail_count
+        self.total_bytes += other.total_bytes
+        for key, count in other.errors.items():
+            self.errors[key] = self.errors.get(key, 0) + count
+
+    @property
+    def total(self) -> int:
+        return self.success_count + self.fail_count
+
+    def to_dict(self) -> Dict:
+        return {
+            "histogram": self.histogram.to_dict(),
+            "success_count": self.success_count,
+            "fail_count": self.fail_count,
+            "total_bytes": self.total_bytes,
+            "errors": dict(self.errors),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RequestStats":
+        stats = cls()
+        stats.histogram = LatencyHistogram.from_dict(data.get("histogram", {}))
+        stats.success_count = data.get("success_count", 0)
+        stats.fail_count = data.get("fail_count", 0)
+        stats.total_bytes = data.get("total_bytes", 0)
+        stats.errors = dict(data.get("errors", {}))
+        return stats
+
+
+class WindowSlot:
+    """单个秒级窗口的计数器"""
+
+    __slots__ = ("count", "errors", "success_rt_sum", "histogram", "phases")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.success_rt_sum = 0.0
+        self.histogram = LatencyHistogram()
+        # 阶段耗时(仅开启阶段追踪时写入) {阶段: [耗时和ms, 次数]}
+        self.phases: Dict[str, List[float]] = {}
+
+    def reset(self):
+        self.count = 0
+        self.errors = 0
+        self.success_rt_sum = 0.0
+        self.histogram.reset()
+        self.phases.clear()
+
+    def to_dict(self) -> Dict:
+        data = {
+            "count": self.count,
+            "errors": self.errors,
+            "success_rt_sum": self.success_rt_sum,
+            "histogram": self.histogram.to_dict(),
+        }
+        if self.phases:
+            data["phases"] = {name: list(v) for name, v in self.phases.items()}
+        return data
+
+    def merge_dict(self, data: Dict):
+        """合并其他进程/节点上报的窗口"""
+        self.count += data.get("count", 0)
+        self.errors += data.get("errors", 0)
+        self.success_rt_sum += data.get("success_rt_sum", 0.0)
+        self.histogram.merge_dict(data.get("histogram", {}))
+        for name, (total, count) in data.get("phases", {}).items():
+            acc = self.phases.get(name)
+            if acc is None:
+                self.phases[name] = [total, count]
+            else:
+                acc[0] += total
+                acc[1] += count
+
+    def phase_averages(self) -> Dict[str, float]:
+        """各阶段在本窗口内的平均耗时(ms)"""
+        return {name: round(total / count, 2) for name, (total, count) in self.phases.items() if count}
+
+    @property
+    def avg_success_rt(self) -> float:
+        success = self.count - self.errors
+        return self.success_rt_sum / success if success > 0 else 0
+
+
+class MetricWindow:
+    """
+    秒级指标环形缓冲区
+    - 写入方(worker)直接累加当前槽位, 单事件循环内无 await, 不需要加锁
+    - 采集方每秒调用 rotate() 切换到下一个槽位, 返回刚结束的窗口
+    """
+
+    def __init__(self, size: int = 8):
+        self._slots = [WindowSlot() for _ in range(max(2, size))]
+        self._index = 0
+
+    @property
+    def current(self) -> WindowSlot:
+        return self._slots[self._index]
+
+    def record(self, response_time: float, success: bool):
+        slot = self._slots[self._index]
+        slot.count += 1
+        if success:
+            slot.success_rt_sum += response_time
+        else:
+            slot.errors += 1
+        slot.histogram.record(response_time)
+
+    def record_phases(self, phases: Dict[str, float]):
+        acc = self._slots[self._index].phases
+        for name, value in phases.items():
+            entry = acc.get(name)
+            if entry is None:
+                acc[name] = [value, 1]
+            else:
+                entry[0] += value
+                entry[1] += 1
+
+    def rotate(self) -> WindowSlot:
+        """关闭当前窗口并切换到下一个(已清空的)槽位"""
+        closed = self._slots[self._index]
+        self._index = (self._index + 1) % len(self._slots)
+        self._slots[self._index].reset()
+        return closed
+
+    def recent(self, n: int) -> List[WindowSlot]:
+        """最近 n 个已关闭窗口(由新到旧)"""
+        size = len(self._slots)
+        n = min(n, size - 1)
+        return [self._slots[(self._index - i) % size] for i in range(1, n + 1)]
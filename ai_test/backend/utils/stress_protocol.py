@@ -0,0 +1,109 @@
+"""
+分布式压测控制协议 - 后端(协调者)与压测节点(agent)之间的 TCP 帧格式
+帧结构: 4字节负载长度 + 1字节帧类型 + 负载
+- START/FINAL 使用 JSON 负载(每次任务各一帧)
+- WINDOW 为每秒上报的紧凑二进制帧(计数器 + 稀疏直方图桶 + 可选的阶段耗时)
+"""
+import asyncio
+import json
+import struct
+from typing import Dict, Tuple
+
+FRAME_START = 0x01   # 协调者 -> 节点: 场景与分片配置
+FRAME_STOP = 0x02    # 协调者 -> 节点: 停止压测
+FRAME_WINDOW = 0x10  # 节点 -> 协调者: 秒级窗口
+FRAME_FINAL = 0x11   # 节点 -> 协调者: 最终聚合状态(直方图 + 计数器)
+FRAME_ERROR = 0x12   # 节点 -> 协调者: 执行失败
+
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+_HEADER = struct.Struct("!IB")
+# current_users, active_connections, count, errors, success_rt_sum, total_sum, min, max, bucket_count
+_WINDOW = struct.Struct("!IIIIddddH")
+_BUCKET = struct.Struct("!HI")
+# 阶段耗时: 阶段序号, 耗时和(ms), 次数; 序号对应 PHASE_NAMES
+_PHASE = struct.Struct("!BdI")
+PHASE_NAMES = ("queued", "dns", "connect", "send", "ttfb", "transfer")
+
+
+def pack_frame(frame_type: int, payload: bytes = b"") -> bytes:
+    return _HEADER.pack(len(payload), frame_type) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """读取一帧, 连接关闭时抛出 asyncio.IncompleteReadError"""
+    header = await reader.readexactly(_HEADER.size)
+    length, frame_type = _HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ValueError(f"帧过大: {length} bytes")
+    payload = await reader.readexactly(length) if length else b""
+    return frame_type, payload
+
+
+def encode_json(data: Dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def decode_json(payload: bytes) -> Dict:
+    return json.loads(payload.decode("utf-8"))
+
+
+def encode_window(frame: Dict) -> bytes:
+    """将引擎上报的窗口帧编码为紧凑二进制"""
+    window = frame["window"]
+    hist = window["histogram"]
+    buckets = hist.get("counts", {})
+    parts = [_WINDOW.pack(
+        frame["current_users"], frame["active_connections"],
+        window["count"], window["errors"], window["success_rt_sum"],
+        hist.get("total_sum", 0.0), hist.get("min", 0), hist.get("max", 0.0),
+        len(buckets),
+    )]
+    for index, count in buckets.items():
+        parts.append(_BUCKET.pack(int(index), count))
+    phases = window.get("phases")
+    if phases:
+        parts.append(struct.pack("!B", len(phases)))
+        for name, (total, count) in phases.items():
+            parts.append(_PHASE.pack(PHASE_NAMES.index(name), total, count))
+    return b"".join(parts)
+
+
+def decode_window(payload: bytes) -> Dict:
+    """解码为与 StressEngine 子进程帧相同结构的字典"""
+    (users, connections, count, errors, success_rt_sum,
+     total_sum, min_value, max_value, bucket_count) = _WINDOW.unpack_from(payload, 0)
+    counts = {}
+    offset = _WINDOW.size
+    for _ in range(bucket_count):
+        index, bucket = _BUCKET.unpack_from(payload, offset)
+        counts[index] = bucket
+        offset += _BUCKET.size
+    window = {
+        "count": count,
+        "errors": errors,
+        "success_rt_sum": success_rt_sum,
+        "histogram": {
+            "counts": counts,
+            "total_count": count,
+            "total_sum": total_sum,
+            "min": min_value,
+            "max": max_value,
+        },
+    }
+    # 阶段耗时段为可选尾部, 未开启阶段追踪的节点不发送
+    if offset < len(payload):
+        (phase_count,) = struct.unpack_from("!B", payload, offset)
+        offset += 1
+        phases = {}
+        for _ in range(phase_count):
+            index, total, phase_n = _PHASE.unpack_from(payload, offset)
+            phases[PHASE_NAMES[index]] = [total, phase_n]
+            offset += _PHASE.size
+        window["phases"] = phases
+    return {
+        "type": "window",
+        "current_users": users,
+        "active_connections": connections,
+        "window": window,
+    }
@@ -0,0 +1,206 @@
+"""
+压测原始样本落盘 - 按列追加写入, 可内存映射的列式文件
+每个任务一个目录, 每个写入进程一个分片子目录, 每列一个定长二进制文件:
+    ts.f64(时间戳秒) / api.u16(接口ID) / status.u16(状态码, 0=网络异常) / latency.u32(微秒) / bytes.u32
+压测结束后可对任意时间段做事后切片分析(百分位、延迟热力图、错误时间线)
+"""
+import json
+import os
+import shutil
+from array import array
+from typing import Dict, List, Optional
+
+# 列名 -> (array typecode, numpy dtype)
+COLUMNS = {
+    "ts": ("d", "<f8"),
+    "api": ("H", "<u2"),
+    "status": ("H", "<u2"),
+    "latency": ("I", "<u4"),
+    "bytes": ("I", "<u4"),
+}
+FLUSH_THRESHOLD = 8192  # 缓冲满该条数后追加写盘
+# 热力图延迟分桶边界(ms)
+HEATMAP_LATENCY_EDGES = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, float("inf")]
+META_FILE = "meta.json"
+
+
+def task_sample_dir(root: str, task_id: int) -> str:
+    return os.path.join(root, f"task_{task_id}")
+
+
+def remove_task_samples(root: str, task_id: int):
+    shutil.rmtree(task_sample_dir(root, task_id), ignore_errors=True)
+
+
+def write_sample_meta(task_dir: str, api_keys: List[str], start_time: float):
+    """写入任务级元数据(接口ID映射、压测开始时间), 由协调进程在发压前调用"""
+    os.makedirs(task_dir, exist_ok=True)
+    with open(os.path.join(task_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"api_keys": api_keys, "start_time": start_time,
+                   "columns": {k: v[1] for k, v in COLUMNS.items()}}, f, ensure_ascii=False)
+
+
+class SampleRecorder:
+    """单进程的样本写入器: 内存中按列缓冲, 满阈值后整块追加到列文件"""
+
+    def __init__(self, task_dir: str):
+        self.task_dir = task_dir
+        self.shard_dir = os.path.join(task_dir, f"shard-{os.getpid()}")
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self._buffers = {name: array(code) for name, (code, _) in COLUMNS.items()}
+        self._files = {name: open(os.path.join(self.shard_dir, f"{name}.bin"), "ab") for name in COLUMNS}
+
+    def append(self, ts: float, api_id: int, status: int, latency_ms: float, size: int):
+        b = self._buffers
+        b["ts"].append(ts)
+        b["api"].append(api_id)
+        b["status"].append(status)
+        b["latency"].append(min(int(latency_ms * 1000), 0xFFFFFFFF))
+        b["bytes"].append(min(size, 0xFFFFFFFF))
+        if len(b["ts"]) >= FLUSH_THRESHOLD:
+            self.flush()
+
+    def flush(self):
+        for name, buf in self._buffers.items():
+            if buf:
+                buf.tofile(self._files[name])
+                del buf[:]
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+
+
+def _load_columns(task_dir: str) -> Optional[Dict]:
+    """内存映射所有分片的列文件; 多分片时拼接"""
+    import numpy as np
+
+    if not os.path.exists(os.path.join(task_dir, META_FILE)):
+        return None
+    shards = sorted(d for d in os.listdir(task_dir) if d.startswith("shard-"))
+    parts = {name: [] for name in COLUMNS}
+    for shard in shards:
+        shard_dir = os.path.join(task_dir, shard)
+        sizes = {}
+        for name, (_, dtype) in COLUMNS.items():
+            path = os.path.join(shard_dir, f"{name}.bin")
+            sizes[name] = os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0
+        # 进程异常退出时各列长度可能不一致, 以最短列为准
+        n = min(sizes.values())
+        if n == 0:
+            continue
+        for name, (_, dtype) in COLUMNS.items():
+            parts[name].append(np.memmap(os.path.join(shard_dir, f"{name}.bin"), dtype=dtype, mode="r", shape=(n,)))
+    if not parts["ts"]:
+        return {name: np.empty(0, dtype=dtype) for name, (_, dtype) in COLUMNS.items()}
+    return {name: arrs[0] if len(arrs) == 1 else np.concatenate(arrs) for name, arrs in parts.items()}
+
+
+def analyze_samples(
+    task_dir: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    bucket_seconds: float = 1.0,
+    percentiles: Optional[List[float]] = None,
+) -> Optional[Dict]:
+    """
+    对任意时间段做事后分析(start/end 为相对压测开始的秒数)
+    返回总体与按接口百分位、延迟热力图、错误时间线
+    """
+    import numpy as np
+
+    cols = _load_columns(task_dir)
+    if cols is None:
+        return None
+    with open(os.path.join(task_dir, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    api_keys = meta.get("api_keys", [])
+    base = meta.get("start_time", 0)
+    percentiles = percentiles or [50, 90, 95, 99]
+
+    rel = cols["ts"] - base
+    mask = np.ones(rel.shape, dtype=bool)
+    if start is not None:
+        mask &= rel >= start
+    if end is not None:
+        mask &= rel < end
+    rel = rel[mask]
+    latency_ms = cols["latency"][mask] / 1000.0
+    status = cols["status"][mask]
+    api = cols["api"][mask]
+    size = cols["bytes"][mask]
+    errors = (status == 0) | (status >= 400)
+
+    total = int(rel.size)
+    result = {
+        "range": {"start": start, "end": end},
+        "total": total,
+        "errors": int(errors.sum()),
+        "bytes": int(size.sum()) if total else 0,
+        "percentiles": {},
+        "per_api": [],
+        "heatmap": None,
+        "error_timeline": [],
+    }
+    if not total:
+        return result
+
+    def pct(values):
+        return {f"p{p:g}": round(float(v), 2) for p, v in zip(percentiles, np.percentile(values, percentiles))}
+
+    result["percentiles"] = pct(latency_ms)
+    result["percentiles"].update({
+        "min": round(float(latency_ms.min()), 2),
+        "max": round(float(latency_ms.max()), 2),
+        "avg": round(float(latency_ms.mean()), 2),
+    })
+
+    # 按接口: 对接口ID排序分组, 避免逐接口全量扫描
+    order = np.argsort(api, kind="stable")
+    sorted_api = api[order]
+    ids, starts = np.unique(sorted_api, return_index=True)
+    bounds = list(starts[1:]) + [sorted_api.size]
+    for api_id, lo, hi in zip(ids, starts, bounds):
+        idx = order[lo:hi]
+        api_errors = int(errors[idx].sum())
+        result["per_api"].append({
+            "api": api_keys[api_id] if api_id < len(api_keys) else str(api_id),
+            "total": int(idx.size),
+            "error_rate": round(api_errors / idx.size * 100, 2),
+            **pct(latency_ms[idx]),
+        })
+
+    # 时间分桶
+    t0 = start if start is not None else float(np.floor(rel.min()))
+    time_idx = np.floor((rel - t0) / bucket_seconds).astype(np.int64)
+    n_buckets = int(time_idx.max()) + 1
+    time_axis = [round(t0 + i * bucket_seconds, 3) for i in range(n_buckets)]
+
+    # 延迟热力图: 时间桶 x 延迟桶
+    lat_idx = np.searchsorted(HEATMAP_LATENCY_EDGES, latency_ms, side="right") - 1
+    n_lat = len(HEATMAP_LATENCY_EDGES) - 1
+    heat = np.bincount(time_idx * n_lat + lat_idx, minlength=n_buckets * n_lat).reshape(n_buckets, n_lat)
+    result["heatmap"] = {
+        "time_buckets": time_axis,
+        "latency_edges_ms": [e if e != float("inf") else None for e in HEATMAP_LATENCY_EDGES],
+        "counts": heat.tolist(),
+    }
+
+    # 错误时间线: 每个时间桶的请求数、错误数及按状态码分布
+    totals = np.bincount(time_idx, minlength=n_buckets)
+    err_totals = np.bincount(time_idx[errors], minlength=n_buckets)
+    by_status = {}
+    for code in np.unique(status[errors]):
+        counts = np.bincount(time_idx[errors & (status == code)], minlength=n_buckets)
+        by_status[str(int(code)) if code else "network_error"] = counts
+    for i in range(n_buckets):
+        result["error_timeline"].append({
+            "t": time_axis[i],
+            "total": int(totals[i]),
+            "errors": int(err_totals[i]),
+            "by_status": {k: int(v[i]) for k, v in by_status.items() if v[i]},
+        })
+    return result
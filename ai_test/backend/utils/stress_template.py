@@ -0,0 +1,211 @@
+"""
+压测请求模板 - 场景加载时将 target_apis 预编译一次
+记录 url / headers / params / body 中 {{key}} 占位符的位置, 每次请求只做片段拼接;
+body 预先编码为 bytes, 无占位符时直接复用同一份字节串
+链路场景的响应提取规则同样预编译, 直接作用于原始响应字节
+"""
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import jmespath
+
+# 参数名不限于 \w(如 {{user-id}}), 与原先按 "{{key}}" 直接替换的行为一致
+PLACEHOLDER_PATTERN = re.compile(r"\{\{([^{}]+)\}\}")
+
+
+class StringTemplate:
+    """字符串模板: 字面量与占位符交替的片段列表"""
+
+    __slots__ = ("parts", "is_static", "source")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.parts: List[Tuple[bool, str]] = []  # (是否占位符, 字面量/参数名)
+        pos = 0
+        for m in PLACEHOLDER_PATTERN.finditer(source):
+            if m.start() > pos:
+                self.parts.append((False, source[pos:m.start()]))
+            self.parts.append((True, m.group(1)))
+            pos = m.end()
+        if pos < len(source):
+            self.parts.append((False, source[pos:]))
+        self.is_static = not any(is_key for is_key, _ in self.parts)
+
+    def render(self, params: Dict) -> str:
+        if self.is_static or not params:
+            return self.source
+        out = []
+        for is_key, text in self.parts:
+            if is_key and text in params:
+                out.append(str(params[text]))
+            elif is_key:
+                out.append("{{" + text + "}}")  # 未提供的参数保留原占位符
+            else:
+                out.append(text)
+        return "".join(out)
+
+
+class BytesTemplate:
+    """预编码的请求体模板, json_escape=True 时代入值按 JSON 字符串转义"""
+
+    __slots__ = ("parts", "is_static", "source", "json_escape")
+
+    def __init__(self, source: str, json_escape: bool = False):
+        self.source = source.encode("utf-8")
+        self.json_escape = json_escape
+        self.parts: List[Tuple[bool, Union[bytes, str]]] = []
+        pos = 0
+        for m in PLACEHOLDER_PATTERN.finditer(source):
+            if m.start() > pos:
+                self.parts.append((False, source[pos:m.start()].encode("utf-8")))
+            self.parts.append((True, m.group(1)))
+            pos = m.end()
+        if pos < len(source):
+            self.parts.append((False, source[pos:].encode("utf-8")))
+        self.is_static = not any(is_key for is_key, _ in self.parts)
+
+    def render(self, params: Dict) -> bytes:
+        if self.is_static or not params:
+            return self.source
+        out = []
+        for is_key, chunk in self.parts:
+            if not is_key:
+                out.append(chunk)
+            elif chunk in params:
+                value = str(params[chunk])
+                if self.json_escape:
+                    value = json.dumps(value, ensure_ascii=False)[1:-1]
+                out.append(value.encode("utf-8"))
+            else:
+                out.append(b"{{" + chunk.encode("utf-8") + b"}}")
+        return b"".join(out)
+
+
+class Extractor:
+    """
+    预编译的响应提取规则(链路场景使用), 规则格式兼容 BaseTestCase.extract_data:
+    - [变量名, jmespath表达式]
+    - {"name": 变量名, "type": "jmespath"|"regex", "expression": 表达式}
+    正则直接在原始响应字节上匹配, 取第1个分组(无分组时取整体匹配)
+    """
+
+    __slots__ = ("name", "type", "expression", "_compiled")
+
+    def __init__(self, rule: Union[Dict, List, Tuple]):
+        if isinstance(rule, dict):
+            self.name = rule["name"]
+            self.type = rule.get("type", "jmespath")
+            self.expression = rule["expression"]
+        else:
+            self.name, self.expression = rule[0], rule[1]
+            self.type = "jmespath"
+        if self.type == "regex":
+            self._compiled = re.compile(self.expression.encode("utf-8"))
+        else:
+            self._compiled = jmespath.compile(self.expression)
+
+    def extract(self, body: bytes, parsed: Dict) -> Any:
+        """parsed 用于在同一响应的多条 jmespath 规则间复用 JSON 解析结果"""
+        if self.type == "regex":
+            m = self._compiled.search(body)
+            if not m:
+                return None
+            return (m.group(1) if m.groups() else m.group()).decode("utf-8", "replace")
+        if "json" not in parsed:
+            try:
+                parsed["json"] = json.loads(body)
+            except ValueError:
+                parsed["json"] = None
+        if parsed["json"] is None:
+            return None
+        return self._compiled.search(parsed["json"])
+
+
+class CompiledRequest:
+    """单个目标API的预编译请求"""
+
+    def __init__(self, api: Dict):
+        self.method = api.get("method", "GET").upper()
+        self.url = StringTemplate(api.get("url", ""))
+        # 分组键使用模板URL, 保证按接口统计的分组数量有界
+        self.key = f"{self.method} {self.url.source}"
+        self.name = api.get("name")
+        # 任务混合权重(None 表示未设置, 按轮询执行)
+        self.weight = api.get("weight")
+        self.extractors = [Extractor(rule) for rule in (api.get("extract") or [])]
+        self.headers = {k: StringTemplate(str(v)) for k, v in (api.get("headers") or {}).items()}
+        self.params = {k: StringTemplate(str(v)) for k, v in (api.get("params") or {}).items()} \
+            if api.get("params") else None
+        self.body: Optional[BytesTemplate] = None
+        body = api.get("body")
+        if body and self.method in ("POST", "PUT", "PATCH"):
+            if isinstance(body, (dict, list)):
+                self.body = BytesTemplate(json.dumps(body, ensure_ascii=False), json_escape=True)
+                if not any(k.lower() == "content-type" for k in self.headers):
+                    self.headers["Content-Type"] = StringTemplate("application/json")
+            else:
+                self.body = BytesTemplate(str(body))
+        self._static_headers = all(t.is_static for t in self.headers.values())
+        self._static_params = self.params is None or all(t.is_static for t in self.params.values())
+        self._header_cache = {k: t.source for k, t in self.headers.items()}
+        self._param_cache = {k: t.source for k, t in self.params.items()} if self.params else None
+
+    def extract(self, body: bytes, variables: Dict):
+        """执行本接口的提取规则, 结果写入虚拟用户的会话变量(提取不到时保留旧值)"""
+        parsed = {}
+        for extractor in self.extractors:
+            value = extractor.extract(body, parsed)
+            if value is not None:
+                variables[extractor.name] = value
+
+    def render(self, params: Optional[Dict] = None) -> Dict[str, Any]:
+        """代入参数, 返回 _send_request 使用的请求描述"""
+        params = params or {}
+        return {
+            "method": self.method,
+            "url": self.url.render(params),
+            "headers": self._header_cache if self._static_headers or not params
+            else {k: t.render(params) for k, t in self.headers.items()},
+            "params": self._param_cache if self._static_params or not params
+            else {k: t.render(params) for k, t in self.params.items()},
+            "data": self.body.render(params) if self.body else None,
+        }
+
+
+def compile_apis(target_apis: List[Dict]) -> List[CompiledRequest]:
+    return [CompiledRequest(api) for api in target_apis]
+
+
+class AliasTable:
+    """
+    加权随机选择的别名表(Vose alias method)
+    构建 O(n), 每次抽样 O(1): 一次均匀取下标 + 一次与该下标概率比较
+    """
+
+    __slots__ = ("_prob", "_alias", "_n")
+
+    def __init__(self, weights: List[float]):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("权重之和必须大于0")
+        scaled = [w * n / total for w in weights]
+        self._prob = [0.0] * n
+        self._alias = [0] * n
+        self._n = n
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in large + small:
+            self._prob[i] = 1.0
+
+    def sample(self, rand: Callable[[], float]) -> int:
+        """rand 为返回 [0, 1) 均匀随机数的函数"""
+        u = rand() * self._n
+        i = int(u)
+        return i if (u - i) < self._prob[i] else self._alias[i]
@@ -0,0 +1,40 @@
+"""
+内存广播的订阅者队列
+压测实时指标(MetricHub)和任务执行事件(RunEventHub)共用: 每个 SSE 订阅者一个有界队列,
+消费过慢时丢弃最旧的数据并记录丢弃条数
+"""
+import asyncio
+from collections import deque
+from typing import Dict, List
+
+
+class Subscription:
+    """单个订阅者: 有界队列, 消费过慢时丢弃最旧的数据"""
+
+    def __init__(self, maxsize: int = 120):
+        self._items = deque(maxlen=maxsize)
+        self._event = asyncio.Event()
+        self.closed = False
+        self.dropped = 0
+
+    def push(self, item: Dict):
+        if len(self._items) == self._items.maxlen:
+            self.dropped += 1
+        self._items.append(item)
+        self._event.set()
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+
+    async def get(self, timeout: float) -> List[Dict]:
+        """等待并取出当前积压的全部数据, 超时返回空列表"""
+        if not self._items and not self.closed:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._event.clear()
+        items = list(self._items)
+        self._items.clear()
+        return items
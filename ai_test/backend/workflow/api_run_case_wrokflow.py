@@ -104,6 +104,7 @@ class ApiRunCaseGeneratorWorkFlow:
             case_ = copy.deepcopy(case_info)
             # 执行测试用例
             case_executor.execute_test_case(case_)
+            case_executor.close()
         except Exception as e:
             writer = get_stream_writer()
             writer(f"【预执行失败】：用例执行异常：{e}")